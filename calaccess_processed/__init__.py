@@ -19,7 +19,7 @@ def archive_directory_path(instance, filename):
 
     if isinstance(instance, ProcessedDataVersion):
         release_datetime = instance.raw_version.release_datetime
-        f_name, f_ext = filename.split('.')
+        f_name, f_ext = filename.split('.', 1)
         path = '{fn}_{dt:%Y-%m-%d_%H-%M-%S}.{fx}'.format(
             fn=f_name,
             dt=release_datetime,
@@ -52,6 +52,7 @@ from calaccess_processed.admin.common import (
 from calaccess_processed.admin.tracking import (
     ProcessedDataVersionAdmin,
     ProcessedDataFileAdmin,
+    ProcessedDataChunkAdmin,
 )
 
 __all__ = (
@@ -95,4 +96,5 @@ __all__ = (
     'FilerIDValueAdmin',
     'ProcessedDataVersionAdmin',
     'ProcessedDataFileAdmin',
+    'ProcessedDataChunkAdmin',
 )
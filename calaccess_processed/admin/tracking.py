@@ -35,6 +35,28 @@ class ProcessedDataFileAdmin(BaseAdmin):
         "version",
         "file_name",
         "records_count",
+        "insert_duration",
+        "rebuild_duration",
+        "rows_per_second",
+        "pretty_table_size",
+        "pretty_index_size",
     )
     list_display_links = ('id', 'file_name',)
     list_filter = ("version__process_start_datetime",)
+
+
+@admin.register(models.ProcessedDataChunk)
+class ProcessedDataChunkAdmin(BaseAdmin):
+    """
+    Custom admin for the ProcessedDataChunk model.
+    """
+    list_display = (
+        "id",
+        "processed_file",
+        "min_key",
+        "max_key",
+        "records_count",
+        "process_finish_datetime",
+    )
+    list_display_links = ('id', 'processed_file',)
+    list_filter = ("processed_file__version__process_start_datetime",)
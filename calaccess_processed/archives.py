@@ -0,0 +1,740 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for streaming processed data out of the database and into archives.
+"""
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import time
+import zlib
+import hashlib
+import shutil
+import struct
+import tarfile
+import threading
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from zipfile import ZIP_DEFLATED
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.db import connection
+from django.utils import six
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# Archive formats for a processed data version
+ARCHIVE_FORMATS = ('zip', 'gzip', 'tar.xz')
+
+# Uncompressed bytes handed to each compression thread at a time
+BLOCK_SIZE = 1024 * 1024
+
+# How much of the previous block deflate can refer back to
+DEFLATE_WINDOW_SIZE = 32 * 1024
+
+
+def get_archive_format():
+    """
+    Return the archive format set by CALACCESS_ARCHIVE_FORMAT, which defaults to "zip".
+
+    "zip" and "tar.xz" combine all processed files into one archive, while "gzip"
+    compresses each processed file on its own.
+    """
+    archive_format = getattr(settings, 'CALACCESS_ARCHIVE_FORMAT', 'zip')
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ImproperlyConfigured(
+            "CALACCESS_ARCHIVE_FORMAT must be one of: %s" % ", ".join(ARCHIVE_FORMATS)
+        )
+    if archive_format == 'tar.xz' and not lzma:
+        raise ImproperlyConfigured("The tar.xz archive format requires the lzma module.")
+    return archive_format
+
+
+def get_compression_level():
+    """
+    Return the compression level set by CALACCESS_ARCHIVE_COMPRESSION_LEVEL, which defaults to 6.
+    """
+    return getattr(settings, 'CALACCESS_ARCHIVE_COMPRESSION_LEVEL', 6)
+
+
+def get_compression_workers():
+    """
+    Return the number of compression threads set by CALACCESS_ARCHIVE_COMPRESSION_WORKERS.
+
+    Defaults to the number of CPUs.
+    """
+    return getattr(settings, 'CALACCESS_ARCHIVE_COMPRESSION_WORKERS', None) or cpu_count()
+
+
+class CountingWriter(object):
+    """
+    A file-like object that passes writes through to another file and counts the bytes.
+    """
+    def __init__(self, fileobj):
+        """
+        Wrap the provided file.
+        """
+        self.fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self, data):
+        """
+        Write the data to the wrapped file and return the count of bytes written.
+        """
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        """
+        Flush the wrapped file.
+        """
+        self.fileobj.flush()
+
+    def close(self):
+        """
+        Close the wrapped file.
+        """
+        self.fileobj.close()
+
+
+class HashingWriter(CountingWriter):
+    """
+    A file-like object that passes writes through to another file and hashes them with SHA-256.
+    """
+    def __init__(self, fileobj):
+        """
+        Wrap the provided file.
+        """
+        super(HashingWriter, self).__init__(fileobj)
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        """
+        Write the data to the wrapped file and return the count of bytes written.
+        """
+        self.hash.update(data)
+        return super(HashingWriter, self).write(data)
+
+    def hexdigest(self):
+        """
+        Return the SHA-256 hash of everything written so far.
+        """
+        return self.hash.hexdigest()
+
+
+class TeeWriter(object):
+    """
+    A file-like object that writes everything written to it to each of several files.
+    """
+    def __init__(self, *fileobjs):
+        """
+        Wrap the provided files.
+        """
+        self.fileobjs = fileobjs
+
+    def write(self, data):
+        """
+        Write the data to each wrapped file and return the count of bytes written.
+        """
+        for fileobj in self.fileobjs:
+            fileobj.write(data)
+        return len(data)
+
+    def flush(self):
+        """
+        Flush each wrapped file.
+        """
+        for fileobj in self.fileobjs:
+            fileobj.flush()
+
+
+def copy_table(db_table, fileobj):
+    """
+    Write the contents of a database table to the file as CSV with a header.
+    """
+    with connection.cursor() as c:
+        c.cursor.copy_expert('COPY "%s" TO STDOUT CSV HEADER;' % db_table, fileobj)
+
+
+class StreamAborted(IOError):
+    """
+    Raised by a PipeReader when the writer aborts the stream.
+    """
+    pass
+
+
+class PipeReader(object):
+    """
+    The read end of a pipe, wrapped so a storage backend can read an upload from it.
+
+    Backends like S3 rewind the file before reading it, so seeking to where the
+    reader already is works, and tell() reports how much has been read. If the
+    writer aborts, the reader raises an error instead of ending the file early.
+    """
+    def __init__(self, fileobj):
+        """
+        Wrap the provided file.
+        """
+        self.fileobj = fileobj
+        self.position = 0
+        self.aborted = False
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes from the pipe, or until it's closed.
+        """
+        data = self.fileobj.read(size)
+        if not data and self.aborted:
+            raise StreamAborted("The stream was aborted before it was finished.")
+        self.position += len(data)
+        return data
+
+    def seekable(self):
+        """
+        Return False, so backends read the pipe front to back, like in a multipart upload.
+        """
+        return False
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Stay put if the offset is where the reader already is, otherwise raise an error.
+        """
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        if whence == os.SEEK_END or offset != self.position:
+            raise io.UnsupportedOperation("A pipe can't seek.")
+        return self.position
+
+    def tell(self):
+        """
+        Return the count of bytes read so far.
+        """
+        return self.position
+
+    @property
+    def closed(self):
+        """
+        Return True if the pipe has been closed.
+        """
+        return self.fileobj.closed
+
+    def close(self):
+        """
+        Close the pipe.
+        """
+        self.fileobj.close()
+
+
+def save_stream(field_file, name, write):
+    """
+    Save everything the write function writes to the FieldFile's storage, without a temporary file.
+
+    write is called with a file-like object, which is piped to the storage backend
+    on another thread as it's written, so only a pipe's worth is held in memory and
+    the backend reads it in a single pass. If write raises an error, the upload is
+    aborted instead of saving a truncated file.
+
+    Returns the count of bytes saved.
+    """
+    read_fd, write_fd = os.pipe()
+    reader = PipeReader(io.open(read_fd, 'rb'))
+    writer = CountingWriter(io.open(write_fd, 'wb'))
+    save_errors = []
+
+    def save():
+        """
+        Read the pipe into the FieldFile's storage.
+        """
+        try:
+            field_file.save(name, File(reader), save=False)
+        except Exception:
+            save_errors.append(sys.exc_info())
+        finally:
+            reader.close()
+
+    thread = threading.Thread(target=save)
+    thread.start()
+    write_error = None
+    try:
+        write(writer)
+    except Exception:
+        write_error = sys.exc_info()
+        reader.aborted = True
+    try:
+        writer.close()
+    except (IOError, OSError):
+        # the reader stopped early, which the save's error explains
+        if not write_error:
+            write_error = sys.exc_info()
+    thread.join()
+
+    # A failed save breaks the pipe, so its error is the one to raise, unless
+    # it only failed because the write was aborted
+    if save_errors and not isinstance(save_errors[0][1], StreamAborted):
+        six.reraise(*save_errors[0])
+    if write_error:
+        six.reraise(*write_error)
+    return writer.bytes_written
+
+
+class ParallelCompressor(object):
+    """
+    A file-like object that compresses what's written to it on a pool of threads.
+
+    Writes are cut into blocks that are compressed independently, a pool's worth at
+    a time, then written out to the wrapped file in order. Subclasses set how each
+    block is compressed and what goes around the compressed blocks.
+
+    Use it as a context manager, which closes it if everything is written without error.
+    """
+    def __init__(self, fileobj, level=None, workers=None):
+        """
+        Wrap the provided file, compressing at level on a pool of workers threads.
+        """
+        self.fileobj = fileobj
+        self.level = get_compression_level() if level is None else level
+        self.workers = workers or get_compression_workers()
+        self.pool = ThreadPool(self.workers)
+        self.size = 0
+        self.compressed_size = 0
+        self._buffer = bytearray()
+        self._blocks = []
+        self._previous_block = b''
+        self._started = False
+
+    def write(self, data):
+        """
+        Buffer the data, compressing whenever enough blocks are ready.
+        """
+        if not self._started:
+            self._started = True
+            self._write_out(self.header())
+        self.size += len(data)
+        self.update(data)
+        self._buffer.extend(data)
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._add_block(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def flush(self):
+        """
+        Flush the wrapped file.
+
+        Buffered data isn't compressed until there's a full block or the compressor is closed.
+        """
+        self.fileobj.flush()
+
+    def close(self):
+        """
+        Compress and write out everything still buffered, then the compressed format's trailer.
+
+        The wrapped file is left open.
+        """
+        try:
+            if not self._started:
+                self._started = True
+                self._write_out(self.header())
+            if self._buffer:
+                self._add_block(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._compress_blocks()
+            self._write_out(self.trailer())
+        finally:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type:
+            self.pool.terminate()
+            self.pool.join()
+        else:
+            self.close()
+
+    def _add_block(self, block):
+        self._blocks.append((block, self._previous_block))
+        self._previous_block = block
+        if len(self._blocks) >= self.workers * 2:
+            self._compress_blocks()
+
+    def _compress_blocks(self):
+        for compressed in self.pool.map(self.compress_block, self._blocks):
+            self._write_out(compressed)
+        self._blocks = []
+
+    def _write_out(self, data):
+        self.fileobj.write(data)
+        self.compressed_size += len(data)
+
+    def header(self):
+        """
+        Return the bytes written before the first compressed block.
+        """
+        return b''
+
+    def trailer(self):
+        """
+        Return the bytes written after the last compressed block.
+        """
+        return b''
+
+    def update(self, data):
+        """
+        Update any checksum with data, in the order it's written.
+        """
+        pass
+
+    def compress_block(self, args):
+        """
+        Return the compressed bytes of a (block, previous block) tuple.
+        """
+        raise NotImplementedError
+
+
+class DeflateCompressor(ParallelCompressor):
+    """
+    Compresses to a single raw deflate stream, as stored in zip and gzip files.
+
+    Each block is compressed with the end of the block before it as its dictionary
+    and ends on a byte boundary, so the compressed blocks join into one stream.
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        Wrap the provided file and start the checksum.
+        """
+        super(DeflateCompressor, self).__init__(*args, **kwargs)
+        self.crc = 0
+
+    def update(self, data):
+        """
+        Update the CRC-32 checksum of the uncompressed data.
+        """
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+
+    def compress_block(self, args):
+        """
+        Return the block compressed as raw deflate, ending with a sync flush.
+        """
+        block, previous_block = args
+        if previous_block and sys.version_info >= (3, 3):
+            compressor = zlib.compressobj(
+                self.level,
+                zlib.DEFLATED,
+                -zlib.MAX_WBITS,
+                zdict=previous_block[-DEFLATE_WINDOW_SIZE:],
+            )
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def trailer(self):
+        """
+        Return an empty final deflate block to end the stream.
+        """
+        return zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+
+
+class GzipCompressor(DeflateCompressor):
+    """
+    Compresses to a gzip file.
+    """
+    def header(self):
+        """
+        Return the gzip header.
+        """
+        return b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff'
+
+    def trailer(self):
+        """
+        Return the end of the deflate stream, then the checksum and size of the uncompressed data.
+        """
+        return super(GzipCompressor, self).trailer() + struct.pack(
+            '<II',
+            self.crc,
+            self.size & 0xffffffff,
+        )
+
+
+class XZCompressor(ParallelCompressor):
+    """
+    Compresses to an xz file made of one xz stream per block.
+
+    xz and Python's lzma module decompress the concatenated streams as a single file.
+    """
+    def compress_block(self, args):
+        """
+        Return the block compressed as a complete xz stream.
+        """
+        return lzma.compress(args[0], format=lzma.FORMAT_XZ, preset=self.level)
+
+
+def dos_datetime(timestamp):
+    """
+    Return a (time, date) tuple of the timestamp in the MS-DOS format used by zip files.
+    """
+    t = time.localtime(timestamp)
+    return (
+        t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+        max(t.tm_year - 1980, 0) << 9 | t.tm_mon << 5 | t.tm_mday,
+    )
+
+
+class ZipMemberWriter(object):
+    """
+    A file-like object that writes the contents of one member of a StreamingZipFile.
+
+    The member's header is written when it's opened and its data descriptor when it's
+    closed, so what's written to it can be streamed straight into the zip.
+    """
+    def __init__(self, zf, name):
+        """
+        Write the local file header of a member with the provided name.
+        """
+        self.zf = zf
+        self.name = name.encode('utf-8')
+        self.offset = zf.fileobj.bytes_written
+        self.dos_time, self.dos_date = dos_datetime(time.time())
+        zf.fileobj.write(struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50,  # local file header signature
+            45,  # version needed to extract (Zip64)
+            0x0808,  # sizes in data descriptor, utf-8 name
+            zf.compression,
+            self.dos_time,
+            self.dos_date,
+            0,
+            0xffffffff,
+            0xffffffff,
+            len(self.name),
+            20,
+        ))
+        zf.fileobj.write(self.name)
+        # Zip64 extra field, so the data descriptor holds 8-byte sizes
+        zf.fileobj.write(struct.pack('<HHQQ', 0x0001, 16, 0, 0))
+
+        self.compressor = None
+        if zf.compression == ZIP_DEFLATED:
+            self.compressor = DeflateCompressor(zf.fileobj, level=zf.level, workers=zf.workers)
+        self.crc = 0
+        self.size = 0
+
+    def write(self, data):
+        """
+        Add the data to the member and return the count of bytes written.
+        """
+        if self.compressor:
+            return self.compressor.write(data)
+        self.zf.fileobj.write(data)
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        """
+        Flush the zip's file.
+        """
+        self.zf.fileobj.flush()
+
+    def close(self):
+        """
+        Finish the member's data and write its data descriptor.
+        """
+        if self.compressor:
+            self.compressor.close()
+            crc = self.compressor.crc
+            size = self.compressor.size
+            compressed_size = self.compressor.compressed_size
+        else:
+            crc, size, compressed_size = self.crc, self.size, self.size
+        self.zf.fileobj.write(struct.pack('<IIQQ', 0x08074b50, crc, compressed_size, size))
+        self.zf.members.append(
+            (self.name, self.dos_time, self.dos_date, crc, compressed_size, size, self.offset)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type:
+            if self.compressor:
+                self.compressor.__exit__(exc_type, exc_value, tb)
+        else:
+            self.close()
+
+
+class StreamingZipFile(object):
+    """
+    Writes a zip file front to back, so it can go to an unseekable file.
+
+    Deflated members are compressed on a pool of threads. Every member's CRC and
+    sizes follow its data in a Zip64 data descriptor, since they're only known
+    after it's written.
+    """
+    def __init__(self, fileobj, compression=ZIP_DEFLATED, level=None, workers=None):
+        """
+        Start a zip in the provided file, compressing members at level on workers threads.
+        """
+        self.fileobj = CountingWriter(fileobj)
+        self.compression = compression
+        self.level = level
+        self.workers = workers
+        self.members = []
+
+    def open_member(self, name):
+        """
+        Start a member with the provided name and return a ZipMemberWriter for its contents.
+
+        Close the writer before starting another member or closing the zip.
+        """
+        return ZipMemberWriter(self, name)
+
+    def write_member(self, name, source):
+        """
+        Add a member with the provided name and the contents of the source file.
+        """
+        with self.open_member(name) as member:
+            shutil.copyfileobj(source, member, BLOCK_SIZE)
+
+    def close(self):
+        """
+        Write the central directory and end records. The wrapped file is left open.
+        """
+        directory_offset = self.fileobj.bytes_written
+        for name, dos_time, dos_date, crc, compressed_size, size, offset in self.members:
+            # Values too big for the standard fields move to a Zip64 extra field
+            zip64_values = [v for v in (size, compressed_size, offset) if v >= 0xffffffff]
+            extra = b''
+            if zip64_values:
+                extra = struct.pack(
+                    '<HH%dQ' % len(zip64_values),
+                    0x0001,
+                    8 * len(zip64_values),
+                    *zip64_values
+                )
+            self.fileobj.write(struct.pack(
+                '<IHHHHHHIIIHHHHHII',
+                0x02014b50,  # central directory file header signature
+                45,  # version made by
+                45,  # version needed to extract
+                0x0808,
+                self.compression,
+                dos_time,
+                dos_date,
+                crc,
+                min(compressed_size, 0xffffffff),
+                min(size, 0xffffffff),
+                len(name),
+                len(extra),
+                0,  # comment length
+                0,  # disk number
+                0,  # internal attributes
+                0o100644 << 16,  # external attributes: regular file, rw-r--r--
+                min(offset, 0xffffffff),
+            ))
+            self.fileobj.write(name)
+            self.fileobj.write(extra)
+
+        directory_size = self.fileobj.bytes_written - directory_offset
+        count = len(self.members)
+        if count >= 0xffff or directory_offset >= 0xffffffff or directory_size >= 0xffffffff:
+            zip64_end_offset = self.fileobj.bytes_written
+            self.fileobj.write(struct.pack(
+                '<IQHHIIQQQQ',
+                0x06064b50,  # Zip64 end of central directory signature
+                44,
+                45,
+                45,
+                0,
+                0,
+                count,
+                count,
+                directory_size,
+                directory_offset,
+            ))
+            self.fileobj.write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+        self.fileobj.write(struct.pack(
+            '<IHHHHIIH',
+            0x06054b50,  # end of central directory signature
+            0,
+            0,
+            min(count, 0xffff),
+            min(count, 0xffff),
+            min(directory_size, 0xffffffff),
+            min(directory_offset, 0xffffffff),
+            0,
+        ))
+        self.fileobj.flush()
+
+
+def write_zip(fileobj, members, compression=ZIP_DEFLATED, level=None, workers=None):
+    """
+    Write a zip of the members to the file.
+
+    members is a list of (name, write) tuples. Each write function is called with
+    a file-like object that streams what's written to it into the member.
+    """
+    zf = StreamingZipFile(fileobj, compression=compression, level=level, workers=workers)
+    for name, write in members:
+        with zf.open_member(name) as member:
+            write(member)
+    zf.close()
+
+
+def write_tar_xz(fileobj, members, level=None, workers=None):
+    """
+    Write an xz-compressed tar of the members to the file.
+
+    members is a list of (name, FieldFile) tuples. Each FieldFile is read from its
+    storage straight into the tar, since a tar member's size has to be known before
+    its contents are written.
+    """
+    with XZCompressor(fileobj, level=level, workers=workers) as compressor:
+        with tarfile.open(fileobj=compressor, mode='w|') as tar:
+            for name, field_file in members:
+                info = tarfile.TarInfo(name)
+                info.size = field_file.size
+                info.mtime = time.time()
+                info.mode = 0o644
+                field_file.open('rb')
+                try:
+                    tar.addfile(info, field_file)
+                finally:
+                    field_file.close()
+
+
+def save_zip(field_file, members, compression=ZIP_DEFLATED):
+    """
+    Save a zip of the members to the FieldFile's storage.
+
+    members is a list of (name, write) tuples, as taken by write_zip.
+
+    Returns the size of the zip in bytes.
+    """
+    return save_stream(
+        field_file,
+        'processed.zip',
+        lambda f: write_zip(f, members, compression=compression),
+    )
+
+
+def save_tar_xz(field_file, members):
+    """
+    Save an xz-compressed tar of the members to the FieldFile's storage.
+
+    members is a list of (name, FieldFile) tuples.
+
+    Returns the size of the archive in bytes.
+    """
+    return save_stream(
+        field_file,
+        'processed.tar.xz',
+        lambda f: write_tar_xz(f, members),
+    )
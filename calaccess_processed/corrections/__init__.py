@@ -3,9 +3,12 @@
 """
 Utilities for correcting raw data.
 """
-from .candidate_party import candidate_party
+from .candidate_party import candidate_party, candidate_parties
+from .tables import CorrectionsTable
 
 
 __all__ = (
     'candidate_party',
+    'candidate_parties',
+    'CorrectionsTable',
 )
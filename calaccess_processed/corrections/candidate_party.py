@@ -3,9 +3,14 @@
 """
 Utilities for correcting connection between candidates and parties.
 """
-import os
-import csv
-from django.apps import apps
+from .tables import CorrectionsTable
+
+# Party names keyed by (candidate_name, year, election_type, office)
+candidate_party_corrections = CorrectionsTable(
+    'candidate_party.csv',
+    key_fields=('candidate_name', 'year', 'election_type', 'office'),
+    value_field='party',
+)
 
 
 def candidate_party(candidate_name, year, election_type, office):
@@ -14,35 +19,21 @@ def candidate_party(candidate_name, year, election_type, office):
 
     Returns None if no correction is found.
     """
+    return candidate_parties([(candidate_name, year, election_type, office)]).get(
+        (candidate_name, year, election_type, office)
+    )
+
+
+def candidate_parties(candidates):
+    """
+    Returns the correct OCD party organization objects for many candidates at once.
+
+    candidates is a list of (candidate_name, year, election_type, office) tuples. Returns
+    a dict mapping each tuple with a correction to its party. Tuples without one are left out.
+    """
     from calaccess_processed.models.proxies import OCDPartyProxy
 
-    # Get the path to our corrections file
-    app = apps.get_app_config("calaccess_processed")
-    module_dir = os.path.abspath(os.path.dirname(app.module.__file__))
-    corrections_path = os.path.join(module_dir, 'corrections', "candidate_party.csv")
-
-    # Open up the corrections
-    with open(corrections_path, 'r') as f:
-        corrections = csv.DictReader(f)
-        # Filter down to the ones we've corrected
-        corrections = [d for d in corrections if d['party']]
-
-    # Filter down to the ones that match
-    matches = [
-        d['party'] for d in corrections if (
-            d['candidate_name'] == candidate_name and
-            str(d['year']) == str(year) and
-            d['election_type'] == election_type and
-            d['office'] == office
-        )
-    ]
-
-    # If there's more than one result throw an error
-    if len(matches) > 1:
-        raise Exception('More than one correction found.')
-    # If there's no match return None
-    elif len(matches) == 0:
-        return None
-    # If there's only one match return that
-    else:
-        return OCDPartyProxy.objects.get_by_name(matches[0])
+    return dict(
+        (candidate, OCDPartyProxy.objects.get_by_name(party_name))
+        for candidate, party_name in candidate_party_corrections.get_many(candidates).items()
+    )
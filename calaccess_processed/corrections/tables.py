@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for loading tables of corrections from CSV files.
+"""
+import os
+import csv
+from django.utils import six
+
+
+class CorrectionsTable(object):
+    """
+    A CSV file of corrections indexed in memory by its key columns.
+
+    The file is read on first use and again only if its modification time changes.
+    """
+    def __init__(self, file_name, key_fields, value_field):
+        """
+        Index the file_name CSV in this directory by key_fields, returning value_field.
+
+        Rows with an empty value_field are skipped.
+        """
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+        self.key_fields = key_fields
+        self.value_field = value_field
+        self.mtime = None
+        self.index = {}
+        self.duplicate_keys = set()
+
+    def make_key(self, *values):
+        """
+        Return the index key for the provided values of the key fields.
+        """
+        return tuple(six.text_type(v) for v in values)
+
+    def load(self):
+        """
+        Read the file into the index if it has changed since it was last read.
+        """
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+
+        index = {}
+        duplicate_keys = set()
+        with open(self.path, 'r') as f:
+            for row in csv.DictReader(f):
+                if not row[self.value_field]:
+                    continue
+                key = self.make_key(*[row[field] for field in self.key_fields])
+                if key in index:
+                    duplicate_keys.add(key)
+                index[key] = row[self.value_field]
+
+        self.index = index
+        self.duplicate_keys = duplicate_keys
+        self.mtime = mtime
+
+    def get(self, *values):
+        """
+        Return the correction for the provided values of the key fields, or None.
+
+        Raises an exception if the file has more than one correction for them.
+        """
+        return self.get_many([values]).get(values)
+
+    def get_many(self, keys):
+        """
+        Return a dict mapping each tuple of key field values in keys that's been corrected to its correction.
+
+        Raises an exception if the file has more than one correction for any of them.
+        """
+        self.load()
+        corrections = {}
+        for values in keys:
+            key = self.make_key(*values)
+            if key in self.duplicate_keys:
+                raise Exception('More than one correction found.')
+            if key in self.index:
+                corrections[values] = self.index[key]
+        return corrections
@@ -7,13 +7,27 @@ from __future__ import unicode_literals
 import os
 import re
 import logging
+import itertools
+from django.apps import apps
+from django.db import connection, transaction
 from django.utils import timezone
 from django.utils.termcolors import colorize
 from django.core.management.base import BaseCommand
 from django.core.management import CommandError, call_command
 from calaccess_raw import get_data_directory
 from calaccess_raw.models import RawDataVersion
-from calaccess_processed.models import ProcessedDataVersion, OCDDivisionProxy
+from calaccess_processed.models import (
+    Form501Filing,
+    ProcessedDataVersion,
+    OCDDivisionProxy,
+    OCDOrganizationProxy,
+    OCDPartyProxy,
+    OCDPostProxy,
+    ScrapedCandidateElectionProxy,
+    ScrapedIncumbentElectionProxy,
+    ScrapedPropositionElectionProxy,
+)
+from calaccess_processed.models.proxies.opencivicdata.unitofwork import OCDUnitOfWork
 logger = logging.getLogger(__name__)
 
 
@@ -21,6 +35,23 @@ class CalAccessCommand(BaseCommand):
     """
     Base class for all custom CalAccess-related management commands.
     """
+    # How many records run_in_batches saves in each transaction, unless --batch-size is provided
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        """
+        Adds arguments common to all commands.
+        """
+        super(CalAccessCommand, self).add_arguments(parser)
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=None,
+            help="How many records to save in each transaction (default %s)." % self.batch_size
+        )
+
     def handle(self, *args, **options):
         """
         Sets options common to all commands.
@@ -36,6 +67,12 @@ class CalAccessCommand(BaseCommand):
         # Start the clock
         self.start_datetime = timezone.now()
 
+        # Set how many records are saved in each transaction
+        self.batch_size = options.get("batch_size") or self.batch_size
+
+        # Drop lookups cached by an earlier command in this process
+        self.clear_caches()
+
         # set up processed data directory
         self.data_dir = get_data_directory()
         self.processed_data_dir = os.path.join(
@@ -46,6 +83,80 @@ class CalAccessCommand(BaseCommand):
             # make the processed data director
             os.makedirs(self.processed_data_dir)
 
+    def clear_caches(self):
+        """
+        Clear the in-memory lookups kept by the proxy and Form 501 model managers.
+
+        They're kept for the length of a command, so a command run after another
+        in the same process doesn't see the data as it was before.
+        """
+        Form501Filing.objects.clear_cache()
+        OCDDivisionProxy.objects.clear_cache()
+        OCDDivisionProxy.assembly.clear_cache()
+        OCDDivisionProxy.senate.clear_cache()
+        OCDOrganizationProxy.objects.clear_cache()
+        OCDPartyProxy.objects.clear_cache()
+        OCDPostProxy.objects.clear_cache()
+        ScrapedCandidateElectionProxy.objects.clear_cache()
+        ScrapedIncumbentElectionProxy.objects.clear_cache()
+        ScrapedPropositionElectionProxy.objects.clear_cache()
+
+    def run_in_batches(self, object_list, func, batch_size=None):
+        """
+        Call func with each object in object_list, saving batch_size objects in each transaction.
+
+        Each object runs in a savepoint with its own OCDUnitOfWork, which is saved
+        and has its foreign keys checked before the savepoint is released. If func,
+        the save or the check raises an error, the object's changes are rolled back,
+        the cached objects it could have changed are dropped, the error is logged
+        and the rest of the batch carries on.
+
+        Returns the count of objects that failed.
+        """
+        batch_size = batch_size or self.batch_size
+        failures = 0
+        iterator = iter(object_list)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                for obj in batch:
+                    try:
+                        with transaction.atomic():
+                            with OCDUnitOfWork():
+                                func(obj)
+                            self.check_deferred_constraints()
+                    except Exception as e:
+                        failures += 1
+                        logger.exception('Failed to load %s', obj)
+                        self.failure(' Failed to load {0}: {1}'.format(obj, e))
+                        self.clear_rolled_back_caches()
+        return failures
+
+    def check_deferred_constraints(self):
+        """
+        Check the deferred foreign keys of the rows saved so far in the current transaction.
+
+        Raises an IntegrityError if a row references one that doesn't exist, instead of
+        waiting until the transaction commits.
+        """
+        with connection.cursor() as c:
+            c.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+            c.execute("SET CONSTRAINTS ALL DEFERRED;")
+
+    def clear_rolled_back_caches(self):
+        """
+        Drop the cached objects that could hold changes from a rolled back savepoint.
+
+        Posts and organizations are only cached once they're committed, but each cached
+        scraped election keeps the OCD Election it finds or creates, along with any
+        unsaved changes to it.
+        """
+        ScrapedCandidateElectionProxy.objects.clear_cache()
+        ScrapedIncumbentElectionProxy.objects.clear_cache()
+        ScrapedPropositionElectionProxy.objects.clear_cache()
+
     def get_or_create_processed_version(self):
         """
         Get or create the current processed version.
@@ -75,6 +186,16 @@ class CalAccessCommand(BaseCommand):
             raw_version=latest_raw_version,
         )
 
+    def get_filing_models(self):
+        """
+        Return a list of all the processed filing models.
+        """
+        return [
+            m for m in apps.get_app_config('calaccess_processed').get_models()
+            if not m._meta.abstract and
+            'filings' in str(m)
+        ]
+
     def header(self, string):
         """
         Writes out a string to stdout formatted to look like a header.
@@ -154,16 +275,21 @@ class LoadOCDElectionsBase(CalAccessCommand):
         """
         Load OCD Election from scraped proxy model.
         """
-        for scraped_election in proxy.objects.all():
-            # Get or create an election record
-            ocd_election, ocd_created = scraped_election.get_or_create_ocd_election()
+        self.run_in_batches(proxy.objects.all(), self.load_election)
+
+    def load_election(self, scraped_election):
+        """
+        Get or create the OCD Election of a scraped election and update its source.
+        """
+        # Get or create an election record
+        ocd_election, ocd_created = scraped_election.get_or_create_ocd_election()
 
-            # Log it out
-            if self.verbosity > 1 and ocd_created:
-                self.log(' Created new Election: {}'.format(ocd_election))
+        # Log it out
+        if self.verbosity > 1 and ocd_created:
+            self.log(' Created new Election: {}'.format(ocd_election))
 
-            # Whether Election is new or not, update EventSource
-            ocd_election.sources.update_or_create(
-                url=scraped_election.url,
-                note='Last scraped on {:%Y-%m-%d}'.format(scraped_election.last_modified)
-            )
+        # Whether Election is new or not, update EventSource
+        ocd_election.sources.update_or_create(
+            url=scraped_election.url,
+            note='Last scraped on {:%Y-%m-%d}'.format(scraped_election.last_modified)
+        )
@@ -3,11 +3,9 @@
 """
 Export and archive a .csv file for a given model.
 """
-import os
 from django.apps import apps
-from django.core.files import File
 from django.core.management import CommandError
-from django.db import connection
+from calaccess_processed import archives
 from calaccess_processed.management.commands import CalAccessCommand
 from calaccess_processed.models.tracking import (
     ProcessedDataVersion,
@@ -36,13 +34,17 @@ class Command(CalAccessCommand):
         Make it happen.
         """
         super(Command, self).handle(*args, **options)
-        self.model_name = options['model_name']
+        self.archive_model(options['model_name'])
 
-        # get the full path for archiving the csv
-        self.csv_path = os.path.join(
-            self.processed_data_dir,
-            '%s.csv' % self.model_name,
-        )
+    def archive_model(self, model_name, tee=None):
+        """
+        Export and archive a .csv file for the model with the provided name.
+
+        If tee is provided, the .csv is also written to it as it streams out of the
+        database, so it can be added to another archive in the same pass.
+        """
+        self.model_name = model_name
+        self.tee = tee
 
         # get model
         self.model = self.get_model()
@@ -66,26 +68,88 @@ class Command(CalAccessCommand):
             )
 
         # Remove previous .CSV files
-        self.processed_file.file_archive.delete()
-
-        # Write out to the temp directory
-        copy_sql = "COPY %s TO STDOUT CSV HEADER;" % self.db_table
-        with open(self.csv_path, 'wb') as stdout:
-            with connection.cursor() as c:
-                c.cursor.copy_expert(copy_sql, stdout)
-
-        # Open up the .CSV file for reading so we can wrap it in the Django File obj
-        with open(self.csv_path, 'rb') as csv_file:
-            # Save the .CSV on the raw data file
-            self.processed_file.file_archive.save(
-                '%s.csv' % self.model_name,
-                File(csv_file),
-            )
+        self.delete_archive()
+
+        # Stream the .CSV out of the database into storage, hashing it on the way
+        if archives.get_archive_format() == 'gzip':
+            name, write = '%s.csv.gz' % self.model_name, self.copy_table_to_gzip
+        else:
+            name, write = '%s.csv' % self.model_name, self.copy_table
+        self.processed_file.file_size = archives.save_stream(
+            self.processed_file.file_archive,
+            name,
+            write,
+        )
+
+        # Point to an identical archive from an earlier version instead of keeping another copy
+        previous_file = self.get_previous_file(name)
+        if previous_file:
+            if self.verbosity > 2:
+                self.log(" Unchanged since %s" % previous_file.version)
+            self.processed_file.file_archive.delete(save=False)
+            self.processed_file.file_archive = previous_file.file_archive.name
+            self.processed_file.file_size = previous_file.file_size
 
         # Save it to the model
-        self.processed_file.file_size = os.path.getsize(self.csv_path)
         self.processed_file.save()
 
+    def copy_table(self, fileobj):
+        """
+        Write the model's table to the file as a .CSV, recording its SHA-256 hash.
+
+        The .CSV is also written to the tee, if there is one.
+        """
+        hashing_writer = archives.HashingWriter(fileobj)
+        if self.tee:
+            archives.copy_table(self.db_table, archives.TeeWriter(hashing_writer, self.tee))
+        else:
+            archives.copy_table(self.db_table, hashing_writer)
+        self.processed_file.sha256 = hashing_writer.hexdigest()
+
+    def copy_table_to_gzip(self, fileobj):
+        """
+        Write the model's table to the file as a gzipped .CSV, recording the .CSV's SHA-256 hash.
+        """
+        with archives.GzipCompressor(fileobj) as gz:
+            self.copy_table(gz)
+
+    def delete_archive(self):
+        """
+        Delete the processed file's archive, unless the archive is shared with another version.
+        """
+        name = self.processed_file.file_archive.name
+        if not name:
+            return
+        shared = ProcessedDataFile.objects.filter(
+            file_archive=name,
+        ).exclude(id=self.processed_file.id).exists()
+        if shared:
+            self.processed_file.file_archive = ''
+            self.processed_file.save()
+        else:
+            self.processed_file.file_archive.delete()
+
+    def get_previous_file(self, name):
+        """
+        Return the latest processed file from an earlier version with the same contents, or None.
+
+        Only archives in the same format as name, like .csv or .csv.gz, and still in
+        storage are returned.
+        """
+        extension = '.' + name.split('.', 1)[1]
+        previous_files = ProcessedDataFile.objects.filter(
+            file_name=self.model_name,
+            sha256=self.processed_file.sha256,
+            file_archive__endswith=extension,
+        ).exclude(
+            id=self.processed_file.id,
+        ).order_by('-version__process_start_datetime')
+
+        for previous_file in previous_files:
+            if previous_file.file_archive.storage.exists(previous_file.file_archive.name):
+                return previous_file
+        return None
+
     def get_model(self):
         """
         Return the model with model_name, or None.
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the load stats of each processed data file across processed versions.
+"""
+from django.core.management import CommandError
+from hurry.filesize import size as sizeformat
+from calaccess_processed.management.commands import CalAccessCommand
+from calaccess_processed.models.tracking import ProcessedDataVersion
+
+
+class Command(CalAccessCommand):
+    """
+    Compare the load stats of each processed data file across processed versions.
+    """
+    help = 'Compare the load stats of each processed data file across processed versions.'
+
+    # Stats where an increase means the load got slower or bigger
+    compared_stats = (
+        'insert_duration',
+        'rebuild_duration',
+        'archive_duration',
+        'temp_bytes',
+        'table_size',
+        'index_size',
+    )
+
+    def add_arguments(self, parser):
+        """
+        Adds custom arguments specific to this command.
+        """
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            "--versions",
+            action="store",
+            type=int,
+            dest="versions",
+            default=2,
+            help="Number of the most recent processed versions to compare."
+        )
+        parser.add_argument(
+            "--threshold",
+            action="store",
+            type=float,
+            dest="threshold",
+            default=25,
+            help="Percent increase over the previous version at which a stat is flagged."
+        )
+
+    def handle(self, *args, **options):
+        """
+        Make it happen.
+        """
+        super(Command, self).handle(*args, **options)
+        self.threshold = options.get("threshold")
+
+        versions = list(
+            ProcessedDataVersion.objects.order_by('-process_start_datetime')[:options.get("versions")]
+        )
+        if len(versions) < 2:
+            raise CommandError("At least two processed versions are needed to compare.")
+        # report from oldest to newest
+        versions.reverse()
+
+        # map each file name to its ProcessedDataFile in every version
+        files_by_name = {}
+        for i, version in enumerate(versions):
+            for processed_file in version.files.all():
+                files_by_name.setdefault(processed_file.file_name, [None] * len(versions))[i] = processed_file
+
+        regression_count = 0
+        for file_name in sorted(files_by_name):
+            self.header(file_name)
+            previous = None
+            for version, processed_file in zip(versions, files_by_name[file_name]):
+                if not processed_file:
+                    self.log(" {0:%Y-%m-%d}: not loaded".format(version.raw_version.release_datetime))
+                    continue
+                self.log(" {0:%Y-%m-%d}: {1}".format(
+                    version.raw_version.release_datetime,
+                    self.format_stats(processed_file),
+                ))
+                if previous:
+                    for name, change in self.get_regressions(previous, processed_file):
+                        regression_count += 1
+                        self.warn("  {0} up {1:.0f}%".format(name, change))
+                previous = processed_file
+
+        if regression_count:
+            self.warn("%s stats grew more than %s%%" % (regression_count, self.threshold))
+        else:
+            self.success("No stats grew more than %s%%" % self.threshold)
+
+    def format_stats(self, processed_file):
+        """
+        Return a one-line summary of the load stats recorded on a ProcessedDataFile.
+        """
+        def seconds(duration):
+            return '-' if duration is None else '{0:.1f}s'.format(duration.total_seconds())
+
+        def size(value):
+            return '-' if value is None else sizeformat(value)
+
+        return (
+            '{records} rows, insert {insert}, rebuild {rebuild}, count {count}, '
+            'archive {archive}, {rate} rows/s, table {table}, indexes {index}, temp {temp}'
+        ).format(
+            records=processed_file.records_count,
+            insert=seconds(processed_file.insert_duration),
+            rebuild=seconds(processed_file.rebuild_duration),
+            count=seconds(processed_file.count_duration),
+            archive=seconds(processed_file.archive_duration),
+            rate='-' if processed_file.rows_per_second is None else '{0:.0f}'.format(
+                processed_file.rows_per_second
+            ),
+            table=size(processed_file.table_size),
+            index=size(processed_file.index_size),
+            temp=size(processed_file.temp_bytes),
+        )
+
+    def get_regressions(self, previous, current):
+        """
+        Return a list of (stat name, percent change) tuples for stats that grew past the threshold.
+        """
+        regressions = []
+        for name in self.compared_stats:
+            old = getattr(previous, name)
+            new = getattr(current, name)
+            if old is None or new is None:
+                continue
+            if hasattr(old, 'total_seconds'):
+                old, new = old.total_seconds(), new.total_seconds()
+            if not old:
+                continue
+            change = (new - old) * 100.0 / old
+            if change > self.threshold:
+                regressions.append((name, change))
+        return regressions
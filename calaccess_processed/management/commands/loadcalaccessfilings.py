@@ -3,13 +3,218 @@
 """
 Load and archive the CAL-ACCESS Filing and FilingVersion models.
 """
+from multiprocessing.pool import ThreadPool
 from django.apps import apps
 from django.conf import settings
-from django.core.management import call_command
-from django.db import connection
+from django.core.management import call_command, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
 from django.utils.timezone import now
+from calaccess_processed import schemas
+from calaccess_processed.managers import get_database_temp_bytes
+from calaccess_processed.workers import WorkerPool
 from calaccess_processed.management.commands import CalAccessCommand
-from calaccess_processed.models.tracking import ProcessedDataFile
+from calaccess_processed.models.tracking import (
+    ProcessedDataVersion,
+    ProcessedDataFile,
+    ProcessedDataChunk,
+)
+
+
+def load_model(
+    model,
+    processed_file=None,
+    staging=False,
+    chunks=1,
+    chunk_workers=1,
+    index_workers=1,
+    profile_sql=False,
+    warn=None,
+):
+    """
+    Flush and reload the provided processed data model.
+
+    If staging is True, the model is loaded into a new table in the staging schema.
+
+    If chunks is more than 1 and the model's load query can be split, it's loaded
+    in that many ranges of filings, tracked on the provided ProcessedDataFile.
+
+    Constraints and indexes are rebuilt on up to index_workers database connections.
+
+    If profile_sql is True, the model's load query is profiled with EXPLAIN ANALYZE,
+    so it's always loaded in a single statement.
+
+    Warnings are reported with warn, like CalAccessCommand.warn, if it's provided.
+
+    Return a dict of stats to record on the model's ProcessedDataFile.
+    """
+    if chunks > 1 and model.objects.chunk_key_field and not profile_sql:
+        stats = load_model_in_chunks(
+            model,
+            processed_file,
+            chunks,
+            chunk_workers,
+            staging=staging,
+            index_workers=index_workers,
+            warn=warn,
+        )
+    else:
+        if staging:
+            model.objects.create_bare_table(schemas.STAGING_SCHEMA)
+        else:
+            with connection.cursor() as c:
+                c.execute('TRUNCATE TABLE "%s" CASCADE' % (model._meta.db_table))
+        stats = model.objects.load_raw_data(
+            bare_table=staging,
+            index_workers=index_workers,
+            profile=profile_sql,
+        )
+
+    insert_seconds = stats['insert_duration'].total_seconds()
+    if insert_seconds:
+        stats['rows_per_second'] = stats['records_count'] / insert_seconds
+    stats.update(model.objects.get_table_sizes())
+    return stats
+
+
+def load_model_in_chunks(
+    model,
+    processed_file,
+    chunks,
+    chunk_workers,
+    staging=False,
+    index_workers=1,
+    warn=None,
+):
+    """
+    Load the provided processed data model one range of filings at a time.
+
+    Each chunk commits on its own, so an interrupted load resumes with the chunks
+    still unfinished. Up to chunk_workers chunks load at the same time, each on its
+    own database connection.
+
+    Return a dict of load stats like ProcessedDataManager.load_raw_data, except the
+    count of records covers all of the model's chunks, including any loaded before
+    a resume.
+    """
+    # On a resume, the first run may have dropped the constraints and indexes and
+    # started rebuilding them, so only the ones missing from the table are added.
+    # The same goes for a drop that failed partway.
+    missing_only = processed_file.chunks.exists()
+    if not missing_only:
+        if staging:
+            model.objects.create_bare_table(schemas.STAGING_SCHEMA)
+        else:
+            with connection.cursor() as c:
+                c.execute('TRUNCATE TABLE "%s" CASCADE' % (model._meta.db_table))
+            try:
+                model.objects.drop_constraints_and_indexes()
+            except ValueError as e:
+                if warn:
+                    warn(" Dropping constraints and indexes of {0} failed: {1}".format(
+                        model._meta.db_table,
+                        e,
+                    ))
+                missing_only = True
+        ProcessedDataChunk.objects.bulk_create([
+            ProcessedDataChunk(
+                processed_file=processed_file,
+                min_key=min_key,
+                max_key=max_key,
+            ) for min_key, max_key in model.objects.get_chunk_ranges(chunks)
+        ])
+
+    chunk_ids = processed_file.chunks.filter(
+        process_finish_datetime__isnull=True,
+    ).values_list('id', flat=True)
+
+    def load_chunk(chunk_id):
+        """
+        Load the chunk with the provided id, on the current thread's database connection.
+        """
+        try:
+            # record the chunk as finished in the same transaction as its rows
+            with transaction.atomic():
+                chunk = ProcessedDataChunk.objects.get(id=chunk_id)
+                chunk.process_start_datetime = now()
+                chunk.records_count = model.objects.load_raw_data_chunk(
+                    chunk.min_key,
+                    chunk.max_key,
+                )
+                chunk.process_finish_datetime = now()
+                chunk.save()
+        finally:
+            connection.close()
+
+    stats = {}
+    temp_bytes_start = get_database_temp_bytes()
+    insert_start = now()
+    pool = ThreadPool(chunk_workers)
+    try:
+        pool.map(load_chunk, list(chunk_ids))
+    finally:
+        pool.close()
+        pool.join()
+    stats['insert_duration'] = now() - insert_start
+    stats['temp_bytes'] = get_database_temp_bytes() - temp_bytes_start
+    stats['records_count'] = processed_file.chunks.aggregate(
+        total=Sum('records_count'),
+    )['total'] or 0
+
+    rebuild_start = now()
+    model.objects.add_constraints_and_indexes(
+        workers=index_workers,
+        primary_key=staging,
+        missing_only=missing_only,
+    )
+    stats['rebuild_duration'] = now() - rebuild_start
+    return stats
+
+
+def load_model_in_worker(model_label, processed_file_id, load_options, no_color=False):
+    """
+    Load the processed data model with the provided label inside a worker process.
+
+    Each worker process opens its own database connection. load_options are passed
+    through to load_model, and warnings are written out like the command's own.
+
+    Return the dict of stats from load_model.
+    """
+    command = Command()
+    command.no_color = no_color
+    try:
+        return load_model(
+            apps.get_model(model_label),
+            processed_file=ProcessedDataFile.objects.get(id=processed_file_id),
+            warn=command.warn,
+            **load_options
+        )
+    finally:
+        connection.close()
+
+
+def archive_model_in_worker(model_label, processed_file_id):
+    """
+    Archive the processed data model with the provided label inside a worker process.
+    """
+    try:
+        archive_model(apps.get_model(model_label), processed_file_id)
+    finally:
+        connection.close()
+
+
+def archive_model(model, processed_file_id):
+    """
+    Archive the processed data model and record how long it took on its ProcessedDataFile.
+    """
+    archive_start = now()
+    call_command(
+        'archivecalaccessprocessedfile',
+        model._meta.object_name,
+    )
+    ProcessedDataFile.objects.filter(id=processed_file_id).update(
+        archive_duration=now() - archive_start,
+    )
 
 
 class Command(CalAccessCommand):
@@ -18,6 +223,9 @@ class Command(CalAccessCommand):
     """
     help = 'Load and archive the CAL-ACCESS Filing and FilingVersion models.'
 
+    # How often load_model_graph checks on its workers while it waits for a task to finish
+    result_poll_seconds = 5
+
     def add_arguments(self, parser):
         """
         Adds custom arguments specific to this command.
@@ -30,6 +238,72 @@ class Command(CalAccessCommand):
             default=False,
             help="Force re-start (overrides auto-resume)."
         )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            type=int,
+            dest="workers",
+            default=1,
+            help="Number of processes for loading independent models at the same time."
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            dest="incremental",
+            default=False,
+            help="Only reload filings that are new or changed since the previous "
+                 "processed version (falls back to a full rebuild if there is none)."
+        )
+        parser.add_argument(
+            "--staging",
+            action="store_true",
+            dest="staging",
+            default=False,
+            help="Rebuild the models in a staging schema and swap them into place "
+                 "when all are loaded (ignored by incremental updates)."
+        )
+        parser.add_argument(
+            "--chunks",
+            action="store",
+            type=int,
+            dest="chunks",
+            default=1,
+            help="Number of filing ranges to split each large item model's load into. "
+                 "Each range commits on its own, and an interrupted load resumes "
+                 "with the ranges still unfinished."
+        )
+        parser.add_argument(
+            "--chunk-workers",
+            action="store",
+            type=int,
+            dest="chunk_workers",
+            default=1,
+            help="Number of database connections for loading each model's ranges at the same time."
+        )
+        parser.add_argument(
+            "--index-workers",
+            action="store",
+            type=int,
+            dest="index_workers",
+            default=1,
+            help="Number of database connections for rebuilding each model's indexes at the same time."
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_false",
+            dest="archive",
+            default=True,
+            help="Don't archive each model after it's loaded (processcalaccessdata archives "
+                 "them while building its combined archive)."
+        )
+        parser.add_argument(
+            "--profile-sql",
+            action="store_true",
+            dest="profile_sql",
+            default=False,
+            help="Run each load query under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and "
+                 "store its plan on the model's processed data file (turns off --chunks)."
+        )
 
     def handle(self, *args, **options):
         """
@@ -38,6 +312,17 @@ class Command(CalAccessCommand):
         super(Command, self).handle(*args, **options)
 
         self.force_restart = options.get("restart")
+        self.workers = options.get("workers") or 1
+        self.incremental = options.get("incremental")
+        self.staging = options.get("staging")
+        self.archive = options.get("archive", True)
+        self.load_options = dict(
+            staging=self.staging,
+            chunks=options.get("chunks") or 1,
+            chunk_workers=options.get("chunk_workers") or 1,
+            index_workers=options.get("index_workers") or 1,
+            profile_sql=options.get("profile_sql"),
+        )
 
         # get or create the ProcessedDataVersion instance
         self.processed_version, created = self.get_or_create_processed_version()
@@ -59,27 +344,83 @@ class Command(CalAccessCommand):
             self.processed_version.process_start_datetime = now()
             self.processed_version.save()
 
-        # handle version models first
-        version_models = self.get_model_list('version')
-        self.load_model_list(version_models)
+        if self.incremental:
+            if self.get_previous_processed_version():
+                self.load_incremental(self.get_filing_models())
+                self.success("Done!")
+                return
+            self.warn(
+                "No previous processed version to update. Falling back to full rebuild."
+            )
 
-        # then filing models
-        filing_models = self.get_model_list('filing')
-        self.load_model_list(filing_models)
+        if self.staging:
+            # Tables already loaded into the staging schema can only be reused on a resume
+            if self.force_restart or not schemas.schema_exists(schemas.STAGING_SCHEMA):
+                self.force_restart = True
+                schemas.create_schema(schemas.STAGING_SCHEMA)
+            with schemas.search_path(schemas.STAGING_SCHEMA):
+                self.load_all()
+            self.publish_staging_schema()
+        else:
+            self.load_all()
 
         self.success("Done!")
 
+    def load_all(self):
+        """
+        Load all the version and filing models that still need loading.
+        """
+        if self.workers > 1:
+            # load version and filing models together, as their dependencies allow
+            self.load_model_graph(
+                self.get_model_list('version') + self.get_model_list('filing')
+            )
+        else:
+            # handle version models first
+            version_models = self.get_model_list('version')
+            self.load_model_list(version_models)
+
+            # then filing models
+            filing_models = self.get_model_list('filing')
+            self.load_model_list(filing_models)
+
+    def publish_staging_schema(self):
+        """
+        Swap the tables loaded into the staging schema into the live schema.
+        """
+        tables = [m._meta.db_table for m in self.get_filing_models()]
+        if not schemas.tables_exist(schemas.STAGING_SCHEMA, tables):
+            raise CommandError(
+                "Not all models are loaded into the %s schema. "
+                "Run again with --force-restart." % schemas.STAGING_SCHEMA
+            )
+        if self.verbosity > 1:
+            self.log(" Swapping {0} tables into the {1} schema".format(
+                len(tables),
+                schemas.LIVE_SCHEMA,
+            ))
+        schemas.publish_staging_schema(tables)
+
+    def get_previous_processed_version(self):
+        """
+        Return the most recent completed ProcessedDataVersion before the current one, or None.
+        """
+        try:
+            return ProcessedDataVersion.objects.exclude(
+                id=self.processed_version.id,
+            ).filter(
+                process_finish_datetime__isnull=False,
+            ).latest('process_start_datetime')
+        except ProcessedDataVersion.DoesNotExist:
+            return None
+
     def get_model_list(self, model_type):
         """
         Return a list of models of the specified type to be loaded.
 
         model_type must be "version" of "filing".
         """
-        non_abstract_models = [
-            m for m in apps.get_app_config('calaccess_processed').get_models()
-            if not m._meta.abstract and
-            'filings' in str(m)
-        ]
+        non_abstract_models = self.get_filing_models()
 
         if model_type == 'version':
             models_to_load = [
@@ -129,6 +470,93 @@ class Command(CalAccessCommand):
 
         return models_to_load
 
+    def get_model_graph(self, model_list):
+        """
+        Return a dict mapping each model in the list to the set of models it depends on.
+
+        A model depends on every other model in the list whose table is read by its
+        load query or referenced by one of its foreign key constraints.
+        """
+        models_by_table = dict((m._meta.db_table, m) for m in model_list)
+        graph = {}
+        for m in model_list:
+            tables = set(m.objects.raw_data_load_query_dependencies)
+            tables.update(
+                f.related_model._meta.db_table for f in m._meta.fields
+                if f.is_relation and f.related_model is not m and
+                getattr(f, 'db_constraint', False)
+            )
+            graph[m] = set(
+                models_by_table[t] for t in tables if t in models_by_table
+            )
+        return graph
+
+    def sort_model_graph(self, graph):
+        """
+        Return a list of the models in the graph, ordered so each follows its dependencies.
+        """
+        ordered = []
+        pending = dict(graph)
+        while pending:
+            ready = [
+                m for m, deps in pending.items()
+                if not deps - set(ordered)
+            ]
+            if not ready:
+                raise CommandError(
+                    "Circular dependency among models: %s" % ", ".join(
+                        m._meta.object_name for m in pending
+                    )
+                )
+            for m in sorted(ready, key=lambda m: m._meta.object_name):
+                ordered.append(m)
+                del pending[m]
+        return ordered
+
+    def start_processed_file(self, model):
+        """
+        Get or create the ProcessedDataFile for the model and record its start time.
+
+        Return the ProcessedDataFile object.
+        """
+        processed_file, created = ProcessedDataFile.objects.get_or_create(
+            version=self.processed_version,
+            file_name=model._meta.object_name,
+        )
+        # chunks loaded before a forced restart have to be loaded again
+        if self.force_restart:
+            processed_file.chunks.all().delete()
+        # don't leave the plan of an earlier profiled load on the file
+        processed_file.query_plan = None
+        processed_file.query_plan_warnings = []
+        processed_file.process_start_datetime = now()
+        processed_file.save()
+        return processed_file
+
+    def finish_processed_file(self, model, processed_file, stats, archive=True):
+        """
+        Record the load stats and finish time on the model's ProcessedDataFile.
+
+        If archive is True, also archive the model if the django project setting is enabled.
+        """
+        for name, value in stats.items():
+            setattr(processed_file, name, value)
+        for warning in stats.get('query_plan_warnings', []):
+            self.warn(" {0}: {1}".format(model._meta.object_name, warning))
+        processed_file.process_finish_datetime = now()
+        processed_file.save()
+
+        if archive and self.store_archive():
+            archive_model(model, processed_file.id)
+
+    def store_archive(self):
+        """
+        Return True if the loaded models are archived.
+
+        They are if the django project setting is enabled, unless --no-archive was passed.
+        """
+        return self.archive and getattr(settings, 'CALACCESS_STORE_ARCHIVE', False)
+
     def load_model_list(self, model_list):
         """
         Iterate over the given list of models, loading each one.
@@ -136,29 +564,148 @@ class Command(CalAccessCommand):
         # iterate over all of filing models
         for m in model_list:
             # set up the ProcessedDataFile instance
-            processed_file, created = ProcessedDataFile.objects.get_or_create(
-                version=self.processed_version,
-                file_name=m._meta.object_name,
-            )
-            processed_file.process_start_datetime = now()
-            processed_file.save()
-            # flush the processed model
-            if self.verbosity > 2:
-                self.log(" Truncating %s" % m._meta.db_table)
-            with connection.cursor() as c:
-                c.execute('TRUNCATE TABLE "%s" CASCADE' % (m._meta.db_table))
-            # load the processed model
+            processed_file = self.start_processed_file(m)
+            # flush and load the processed model
             if self.verbosity > 2:
                 self.log(" Loading %s" % m._meta.db_table)
-            m.objects.load_raw_data()
+            stats = load_model(m, processed_file=processed_file, warn=self.warn, **self.load_options)
+            self.finish_processed_file(m, processed_file, stats)
+
+    def load_incremental(self, model_list):
+        """
+        Reload only the filings that are new or changed since the previous processed version.
+
+        Changes are detected by comparing the (filing_id, amend_id) keys in each root
+        filing version model's table against those in the raw table it's loaded from.
+        A filing whose items changed has a new amendment, so it's found the same way.
+        Every row for those filings is then deleted and re-inserted in the root model
+        and all of the models that depend on it, in a single transaction.
+        """
+        graph = self.get_model_graph(model_list)
+        load_order = self.sort_model_graph(graph)
+        filing_id_sql = 'SELECT filing_id FROM incremental_filing_id'
+
+        with connection.cursor() as c:
+            c.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS incremental_filing_id '
+                '(filing_id integer PRIMARY KEY)'
+            )
+
+        for root in [m for m in load_order if not graph[m]]:
+            # the root and every model that depends on it, directly or not
+            family = [root]
+            for m in load_order:
+                if graph[m] & set(family):
+                    family.append(m)
+
+            processed_files = [(m, self.start_processed_file(m)) for m in family]
+
+            with transaction.atomic():
+                with connection.cursor() as c:
+                    c.execute('TRUNCATE TABLE incremental_filing_id')
+                    c.execute(
+                        'INSERT INTO incremental_filing_id (filing_id) %s' % (
+                            root.objects.changed_filing_ids_query
+                        )
+                    )
+                    changed_count = c.rowcount
 
-            processed_file.records_count = m.objects.count()
-            processed_file.process_finish_datetime = now()
-            processed_file.save()
+                if self.verbosity > 1:
+                    self.log(" {0} changed filings in {1}".format(
+                        changed_count,
+                        root._meta.object_name,
+                    ))
 
-            # archive if django project setting enabled
-            if getattr(settings, 'CALACCESS_STORE_ARCHIVE', False):
-                call_command(
-                    'archivecalaccessprocessedfile',
-                    m._meta.object_name,
+                # Delete dependents before the rows they point to, then reload in order
+                for m in reversed(family):
+                    deleted_count = m.objects.delete_filings(filing_id_sql)
+                    if self.verbosity > 2:
+                        self.log(" Deleted {0} rows from {1}".format(
+                            deleted_count,
+                            m._meta.db_table,
+                        ))
+                for m in family:
+                    inserted_count = m.objects.load_raw_data_for_filings(filing_id_sql)
+                    if self.verbosity > 2:
+                        self.log(" Inserted {0} rows into {1}".format(
+                            inserted_count,
+                            m._meta.db_table,
+                        ))
+
+            for m, processed_file in processed_files:
+                count_start = now()
+                records_count = m.objects.count()
+                self.finish_processed_file(
+                    m,
+                    processed_file,
+                    {
+                        'records_count': records_count,
+                        'count_duration': now() - count_start,
+                    },
                 )
+
+    def load_model_graph(self, model_list):
+        """
+        Load the given list of models in a pool of worker processes.
+
+        Each model is dispatched as soon as every model it depends on has loaded,
+        so independent models load at the same time. Archiving a loaded model is
+        a task of its own in the pool, so it doesn't hold up the models after it.
+        """
+        pending = self.get_model_graph(model_list)
+        running = {}
+        loaded = set()
+
+        if self.verbosity > 2:
+            self.log(" Loading {0} models with {1} workers".format(
+                len(pending),
+                self.workers,
+            ))
+
+        # Each worker process must open its own database connection
+        connections.close_all()
+        with WorkerPool(self.workers, poll_seconds=self.result_poll_seconds) as pool:
+            while pending or running:
+                # dispatch every model with no unloaded dependencies left
+                ready = [m for m, deps in pending.items() if not deps - loaded]
+                for m in ready:
+                    del pending[m]
+                    processed_file = self.start_processed_file(m)
+                    running[('load', m._meta.label)] = (m, processed_file)
+                    if self.verbosity > 2:
+                        self.log(" Loading %s" % m._meta.db_table)
+                    pool.apply_async(
+                        ('load', m._meta.label),
+                        load_model_in_worker,
+                        (m._meta.label, processed_file.id, self.load_options, self.no_color),
+                    )
+
+                if not running:
+                    raise CommandError(
+                        "Circular dependency among models: %s" % ", ".join(
+                            m._meta.object_name for m in pending
+                        )
+                    )
+
+                # wait for the next task to finish
+                key, stats, error = pool.get_next_result()
+                m, processed_file = running.pop(key)
+                task, model_label = key
+                if error:
+                    raise CommandError(
+                        "%s %s failed:\n%s" % (
+                            'Loading' if task == 'load' else 'Archiving',
+                            m._meta.object_name,
+                            error,
+                        )
+                    )
+                if task == 'load':
+                    self.finish_processed_file(m, processed_file, stats, archive=False)
+                    loaded.add(m)
+                    if self.store_archive():
+                        running[('archive', model_label)] = (m, processed_file)
+                        pool.apply_async(
+                            ('archive', model_label),
+                            archive_model_in_worker,
+                            (model_label, processed_file.id),
+                        )
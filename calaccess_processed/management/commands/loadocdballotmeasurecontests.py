@@ -42,43 +42,48 @@ class Command(CalAccessCommand):
         Load OCD ballot measure-related models with data scraped from CAL-ACCESS website.
         """
         object_list = ScrapedPropositionProxy.objects.exclude(name__icontains='RECALL')
-        for scraped_prop in object_list:
-            ocd_election = scraped_prop.election_proxy.get_ocd_election()
-            try:
-                # Try getting the contest using scraped_id
-                ocd_contest = ocd_election.ballotmeasurecontests.get(
-                    identifiers__scheme='calaccess_measure_id',
-                    identifiers__identifier=scraped_prop.scraped_id,
-                )
-            except BallotMeasureContest.DoesNotExist:
-                # If not there, create one
-                ocd_contest = self.create_contest(scraped_prop, ocd_election)
-                # Add the options
-                ocd_contest.options.create(text='yes')
-                ocd_contest.options.create(text='no')
-                # Add the identifiers
-                ocd_contest.identifiers.create(
-                    scheme='calaccess_measure_id',
-                    identifier=scraped_prop.scraped_id,
-                )
-                if self.verbosity > 2:
-                    self.log(
-                        'Created {0}: {1}'.format(
-                            ocd_contest._meta.object_name,
-                            ocd_contest,
-                        )
-                    )
-            else:
-                # If the contest already exists, make sure the name is up-to-date
-                # because they could change on subsequent scrapes of the SoS website
-                if ocd_contest.name != scraped_prop.name:
-                    ocd_contest.name = scraped_prop.name
-                    ocd_contest.save()
+        self.run_in_batches(object_list, self.load_proposition)
 
-            # Update or create the Contest source
-            ocd_contest.sources.update_or_create(
-                url=scraped_prop.url,
-                note='Last scraped on {dt:%Y-%m-%d}'.format(
-                    dt=scraped_prop.last_modified,
+    def load_proposition(self, scraped_prop):
+        """
+        Load the BallotMeasureContest of a scraped proposition.
+        """
+        ocd_election = scraped_prop.election_proxy.get_ocd_election()
+        try:
+            # Try getting the contest using scraped_id
+            ocd_contest = ocd_election.ballotmeasurecontests.get(
+                identifiers__scheme='calaccess_measure_id',
+                identifiers__identifier=scraped_prop.scraped_id,
+            )
+        except BallotMeasureContest.DoesNotExist:
+            # If not there, create one
+            ocd_contest = self.create_contest(scraped_prop, ocd_election)
+            # Add the options
+            ocd_contest.options.create(text='yes')
+            ocd_contest.options.create(text='no')
+            # Add the identifiers
+            ocd_contest.identifiers.create(
+                scheme='calaccess_measure_id',
+                identifier=scraped_prop.scraped_id,
+            )
+            if self.verbosity > 2:
+                self.log(
+                    'Created {0}: {1}'.format(
+                        ocd_contest._meta.object_name,
+                        ocd_contest,
+                    )
                 )
+        else:
+            # If the contest already exists, make sure the name is up-to-date
+            # because they could change on subsequent scrapes of the SoS website
+            if ocd_contest.name != scraped_prop.name:
+                ocd_contest.name = scraped_prop.name
+                ocd_contest.save()
+
+        # Update or create the Contest source
+        ocd_contest.sources.update_or_create(
+            url=scraped_prop.url,
+            note='Last scraped on {dt:%Y-%m-%d}'.format(
+                dt=scraped_prop.last_modified,
             )
+        )
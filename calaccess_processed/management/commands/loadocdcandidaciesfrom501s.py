@@ -31,28 +31,32 @@ class Command(CalAccessCommand):
         else:
             self.header("Loading additional candidacies from Form 501 filings")
 
-            for form501 in Form501Filing.objects.without_candidacy():
-                if self.verbosity > 2:
-                    self.log(' Processing Form 501: %s' % form501.filing_id)
+            self.run_in_batches(Form501Filing.objects.without_candidacy().iterator(), self.load_form501)
+            self.success("Done!")
 
-                # Get a linked contest
-                contest = form501.get_contest()
+    def load_form501(self, form501):
+        """
+        Get or create the Candidacy for a Form 501 filing and link them.
+        """
+        if self.verbosity > 2:
+            self.log(' Processing Form 501: %s' % form501.filing_id)
 
-                # If there is no contest, quit.
-                if not contest:
-                    return None
+        # Get a linked contest
+        contest = form501.get_contest()
 
-                candidacy, created = OCDCandidacyProxy.objects.get_or_create_from_calaccess(
-                    contest,
-                    form501.parsed_name,
-                    candidate_filer_id=form501.filer_id
-                )
+        # If there is no contest, skip it.
+        if not contest:
+            return
 
-                if created and self.verbosity > 2:
-                    tmp = ' Created new Candidacy: {0.candidate_name} in {0.post.label}'
-                    self.log(tmp.format(candidacy))
+        candidacy, created = OCDCandidacyProxy.objects.get_or_create_from_calaccess(
+            contest,
+            form501.parsed_name,
+            candidate_filer_id=form501.filer_id
+        )
 
-                candidacy.link_form501(form501)
-                candidacy.update_from_form501(form501)
+        if created and self.verbosity > 2:
+            tmp = ' Created new Candidacy: {0.candidate_name} in {0.post.label}'
+            self.log(tmp.format(candidacy))
 
-            self.success("Done!")
+        candidacy.link_form501(form501)
+        candidacy.update_from_form501(form501)
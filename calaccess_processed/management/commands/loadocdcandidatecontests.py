@@ -3,13 +3,437 @@
 """
 Load the OCD CandidateContest and related models with scraped CAL-ACCESS data.
 """
+from collections import OrderedDict
+from datetime import date
+from django.core.management import call_command, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import six
+from opencivicdata.core.models import Person, PersonIdentifier, PersonName
+from opencivicdata.elections.models import (
+    Candidacy,
+    CandidacySource,
+    CandidateContest,
+    CandidateContestPost,
+    CandidateContestSource,
+)
 from calaccess_processed.models import (
+    Form501Filing,
+    OCDPostProxy,
     OCDRunoffProxy,
     OCDCandidacyProxy,
     ScrapedCandidateProxy,
     ScrapedCandidateElectionProxy
 )
+from calaccess_processed.workers import WorkerPool
 from calaccess_processed.management.commands import CalAccessCommand
+from calaccess_processed.models.proxies.opencivicdata import locks
+from calaccess_processed.models.proxies.opencivicdata.unitofwork import save_or_defer
+
+
+class BulkCandidateContestLoader(object):
+    """
+    Loads the contests and candidacies of one scraped election in memory, then saves them in bulk.
+
+    Contests, people and candidacies are matched, created and updated as they are
+    by ScrapedCandidateProxy.get_or_create_contest and
+    OCDCandidacyProxy.objects.get_or_create_from_calaccess, one candidate at a time,
+    but everything they read is loaded up front and every new object is held until
+    save, which inserts each model's new objects in one statement.
+    """
+    # Models of the new objects, in the order they're inserted
+    insert_order = (
+        Person,
+        PersonIdentifier,
+        PersonName,
+        CandidateContest,
+        CandidateContestPost,
+        CandidateContestSource,
+        Candidacy,
+        CandidacySource,
+    )
+
+    def __init__(self, scraped_election):
+        """
+        Prepare to load the candidates in a ScrapedCandidateElectionProxy.
+        """
+        self.scraped_election = scraped_election
+        self.ocd_election = scraped_election.get_ocd_election()
+        self.new_objects = OrderedDict((model, []) for model in self.insert_order)
+        self.changed_persons = {}
+        self.changed_candidacies = {}
+
+        # Contests in the election, keyed by the fields they're matched on
+        self.contests = {}
+        # Post id of each contest
+        self.contest_posts = {}
+        # Candidacies in each contest
+        self.contest_candidacies = {}
+        # (contest id, url, note) and (candidacy id, url, note) of sources
+        self.contest_sources = set()
+        self.candidacy_sources = set()
+
+        # People, with their filer_ids, other names and latest candidacy
+        self.persons = {}
+        self.person_filer_ids = {}
+        self.person_other_names = {}
+        self.person_latest_candidacy = {}
+        # Person ids keyed by filer_id, and by name, sort_name and family_name
+        self.filer_persons = {}
+        self.named_persons = {}
+
+    def load(self, candidates):
+        """
+        Load contests and candidacies for the provided ScrapedCandidateProxy objects.
+
+        Returns a list of the new OCD Candidacy objects.
+        """
+        form501s = Form501Filing.objects.get_matcher().match_candidates(candidates, self.scraped_election)
+        rows = []
+        for candidate in candidates:
+            post = OCDPostProxy.objects.get_or_create_by_name(candidate.office_name)[0]
+            party = candidate.get_party(self.scraped_election)
+            rows.append((candidate, post, party, form501s[candidate.id]))
+
+        self.load_contests()
+        self.load_people(candidates)
+        for candidate, post, party, form501 in rows:
+            contest = self.get_or_create_contest(candidate, post, party)
+            candidacy = self.get_or_create_candidacy(candidate, contest)
+            self.update_candidacy(candidate, candidacy, party, form501)
+
+        self.save()
+        return self.new_objects[Candidacy]
+
+    def load_contests(self):
+        """
+        Load the election's contests with their posts and sources.
+        """
+        contest_list = CandidateContest.objects.filter(
+            election=self.ocd_election,
+        ).prefetch_related('posts')
+        for contest in contest_list:
+            self.contests[self.get_contest_key(
+                contest.name,
+                contest.previous_term_unexpired,
+                contest.party_id,
+                contest.division_id,
+            )] = contest
+            posts = contest.posts.all()
+            self.contest_posts[contest.id] = posts[0].post_id if posts else None
+
+        self.contest_sources = set(CandidateContestSource.objects.filter(
+            contest__election=self.ocd_election,
+        ).values_list('contest_id', 'url', 'note'))
+
+    def load_people(self, candidates):
+        """
+        Load the election's candidacies and everyone the candidates could be matched to.
+        """
+        candidacy_list = list(Candidacy.objects.filter(contest__election=self.ocd_election))
+        for candidacy in candidacy_list:
+            self.contest_candidacies.setdefault(candidacy.contest_id, []).append(candidacy)
+        self.candidacy_sources = set(CandidacySource.objects.filter(
+            candidacy__contest__election=self.ocd_election,
+        ).values_list('candidacy_id', 'url', 'note'))
+
+        # People with the candidates' filer_ids
+        filer_ids = set(c.scraped_id for c in candidates if c.scraped_id)
+        for filer_id, person_id in PersonIdentifier.objects.filter(
+            scheme='calaccess_filer_id',
+            identifier__in=filer_ids,
+        ).values_list('identifier', 'person_id'):
+            self.filer_persons.setdefault(filer_id, person_id)
+
+        # ... plus people already in the election and people with the candidates' names
+        person_list = Person.objects.filter(
+            Q(id__in=set(c.person_id for c in candidacy_list) | set(self.filer_persons.values())) |
+            Q(name__in=set(c.parsed_name['name'] for c in candidates))
+        )
+        for person in person_list:
+            self.add_person(person)
+
+        person_ids = list(self.persons)
+        for person_id, filer_id in PersonIdentifier.objects.filter(
+            person_id__in=person_ids,
+            scheme='calaccess_filer_id',
+        ).values_list('person_id', 'identifier'):
+            self.person_filer_ids[person_id].add(filer_id)
+            self.filer_persons.setdefault(filer_id, person_id)
+        for person_id, name, note in PersonName.objects.filter(
+            person_id__in=person_ids,
+        ).values_list('person_id', 'name', 'note'):
+            self.person_other_names[person_id].add((name, note))
+        for person_id, candidate_name, election_date in Candidacy.objects.filter(
+            person_id__in=person_ids,
+        ).values_list('person_id', 'candidate_name', 'contest__election__date'):
+            self.set_latest_candidacy(person_id, candidate_name, election_date)
+
+    def get_contest_key(self, name, previous_term_unexpired, party_id, division_id):
+        """
+        Return the key of a contest in the contests dict.
+        """
+        return (name, previous_term_unexpired, party_id, division_id)
+
+    def get_or_create_contest(self, candidate, post, party):
+        """
+        Return the CandidateContest for a candidate, creating it, its post and its source as needed.
+        """
+        fields = candidate.get_contest_fields(self.scraped_election, party)
+        key = self.get_contest_key(
+            fields['name'],
+            fields['previous_term_unexpired'],
+            fields['party'].id if fields['party'] else None,
+            post.division_id,
+        )
+        contest = self.contests.get(key)
+        if not contest:
+            contest = CandidateContest(election=self.ocd_election, division=post.division, **fields)
+            self.new_objects[CandidateContest].append(contest)
+            self.new_objects[CandidateContestPost].append(CandidateContestPost(contest=contest, post=post))
+            self.contests[key] = contest
+            self.contest_posts[contest.id] = post.id
+
+        source = (contest.id, candidate.url, 'Last scraped on {dt:%Y-%m-%d}'.format(dt=candidate.last_modified))
+        if source not in self.contest_sources:
+            self.new_objects[CandidateContestSource].append(
+                CandidateContestSource(contest=contest, url=source[1], note=source[2])
+            )
+            self.contest_sources.add(source)
+        return contest
+
+    def get_or_create_candidacy(self, candidate, contest):
+        """
+        Return the Candidacy for a candidate in contest, creating it and its Person as needed.
+        """
+        name_dict = candidate.parsed_name
+        name = name_dict['name']
+        filer_id = candidate.scraped_id or None
+        contest_candidacies = self.contest_candidacies.setdefault(contest.id, [])
+        candidacy = None
+
+        # first, try matching to existing candidate in contest with filer_id
+        if filer_id:
+            matches = [c for c in contest_candidacies if filer_id in self.person_filer_ids[c.person_id]]
+            if matches:
+                candidacy = matches[0]
+                self.add_other_name(
+                    self.persons[candidacy.person_id],
+                    name,
+                    'Matched on CandidateContest and calaccess_filer_id',
+                )
+
+        # if filer_id match fails (or no filer_id), try matching to a single candidate
+        # in contest with provided name
+        if not candidacy:
+            matches = [
+                c for c in contest_candidacies if (
+                    c.candidate_name == name or
+                    self.persons[c.person_id].name == name or
+                    name in set(n for n, note in self.person_other_names[c.person_id])
+                )
+            ]
+            if len(matches) == 1:
+                candidacy = matches[0]
+                if filer_id:
+                    # don't conflate with a candidate with a different filer_id
+                    if self.person_filer_ids[candidacy.person_id]:
+                        candidacy = None
+                    else:
+                        self.add_filer_id(self.persons[candidacy.person_id], filer_id)
+
+        # if no matched candidate yet, make a new one
+        if not candidacy:
+            person = self.get_or_create_person(name_dict, filer_id)
+            self.add_other_name(person, name, 'From {} candidacy'.format(contest))
+            candidacy = Candidacy(
+                contest=contest,
+                person=person,
+                post_id=self.contest_posts[contest.id],
+                candidate_name=name,
+                registration_status='qualified',
+            )
+            self.new_objects[Candidacy].append(candidacy)
+            contest_candidacies.append(candidacy)
+            self.set_latest_candidacy(person.id, name, self.ocd_election.date)
+
+        if candidacy.registration_status != 'qualified':
+            candidacy.registration_status = 'qualified'
+            self.changed_candidacies[candidacy.id] = candidacy
+
+        # make sure Person name is same as most recent candidate_name
+        self.update_name(self.persons[candidacy.person_id])
+        return candidacy
+
+    def update_candidacy(self, candidate, candidacy, party, form501):
+        """
+        Fill in a candidacy from its Form 501 filings, party and source.
+        """
+        if form501:
+            # link the filing
+            filing_ids = candidacy.extras.setdefault('form501_filing_ids', [])
+            if form501.filing_id not in filing_ids:
+                filing_ids.append(form501.filing_id)
+                self.changed_candidacies[candidacy.id] = candidacy
+
+            # keep the earliest filed_date of the linked filings
+            by_filing_id = Form501Filing.objects.get_matcher().by_filing_id
+            filings = [by_filing_id[i] for i in filing_ids if i in by_filing_id]
+            filed_dates = [f.date_filed for f in filings if f.date_filed]
+            first_filed_date = min(filed_dates) if filed_dates else None
+            if candidacy.filed_date != first_filed_date:
+                candidacy.filed_date = first_filed_date
+                self.changed_candidacies[candidacy.id] = candidacy
+
+            # mark it withdrawn if the latest filing says so
+            latest = max(filings, key=lambda f: (f.date_filed is None, f.date_filed or date.min))
+            if latest.statement_type == '10003' and candidacy.registration_status != 'withdrawn':
+                candidacy.registration_status = 'withdrawn'
+                self.changed_candidacies[candidacy.id] = candidacy
+
+            # if the scraped candidate lacks a filer_id, add the Form 501's
+            if candidate.scraped_id == '':
+                self.add_filer_id(self.persons[candidacy.person_id], form501.filer_id)
+
+        # Fill the party if the candidacy doesn't have it
+        if not candidacy.party_id:
+            candidacy.party = party
+            self.changed_candidacies[candidacy.id] = candidacy
+
+        # always update the source for the candidacy
+        source = (candidacy.id, candidate.url, 'Last scraped on {dt:%Y-%m-%d}'.format(dt=candidate.last_modified))
+        if source not in self.candidacy_sources:
+            self.new_objects[CandidacySource].append(
+                CandidacySource(candidacy=candidacy, url=source[1], note=source[2])
+            )
+            self.candidacy_sources.add(source)
+
+    def add_person(self, person):
+        """
+        Add a Person to the people that can be matched.
+        """
+        self.persons[person.id] = person
+        self.person_filer_ids.setdefault(person.id, set())
+        self.person_other_names.setdefault(person.id, set())
+        self.named_persons.setdefault(
+            (person.name, person.sort_name, person.family_name),
+            [],
+        ).append(person.id)
+
+    def get_or_create_person(self, name_dict, filer_id=None):
+        """
+        Return the Person with the filer_id, or else with the names in name_dict, creating it as needed.
+        """
+        if filer_id and filer_id in self.filer_persons:
+            person = self.persons[self.filer_persons[filer_id]]
+            self.add_other_name(person, name_dict['name'], 'Matched on calaccess_filer_id')
+            return person
+
+        matches = [
+            self.persons[i] for i in self.named_persons.get(
+                (name_dict['name'], name_dict['sort_name'], name_dict['family_name']),
+                [],
+            ) if self.persons[i].given_name == name_dict.get('given_name', self.persons[i].given_name)
+        ]
+        if matches:
+            person = matches[0]
+        else:
+            person = Person(**name_dict)
+            self.new_objects[Person].append(person)
+            self.add_person(person)
+
+        if filer_id:
+            self.add_filer_id(person, filer_id)
+        return person
+
+    def add_other_name(self, person, name, note):
+        """
+        Add an other name to a Person, unless it's the Person's name or it's already been added with the note.
+        """
+        if name == person.name or (name, note) in self.person_other_names[person.id]:
+            return
+        self.new_objects[PersonName].append(PersonName(person=person, name=name, note=note))
+        self.person_other_names[person.id].add((name, note))
+
+    def add_filer_id(self, person, filer_id):
+        """
+        Add a CAL-ACCESS filer_id to a Person, if it's not already there.
+        """
+        if filer_id in self.person_filer_ids[person.id]:
+            return
+        self.new_objects[PersonIdentifier].append(
+            PersonIdentifier(person=person, scheme='calaccess_filer_id', identifier=filer_id)
+        )
+        self.person_filer_ids[person.id].add(filer_id)
+        self.filer_persons.setdefault(filer_id, person.id)
+
+    def set_latest_candidacy(self, person_id, candidate_name, election_date):
+        """
+        Record a candidacy of a Person, if it's in the latest election the Person has run in.
+        """
+        # compare as ISO strings, since a new election's date may not have been read back from the database
+        election_date = six.text_type(election_date)[:10]
+        latest = self.person_latest_candidacy.get(person_id)
+        if not latest or election_date >= latest[0]:
+            self.person_latest_candidacy[person_id] = (election_date, candidate_name)
+
+    def update_name(self, person):
+        """
+        Update a Person's name to the candidate_name of its latest candidacy.
+        """
+        latest_candidate_name = self.person_latest_candidacy[person.id][1]
+        if person.name == latest_candidate_name:
+            return
+
+        # Move the current name into other_names
+        if person.name not in set(n for n, note in self.person_other_names[person.id]):
+            self.new_objects[PersonName].append(PersonName(person=person, name=person.name))
+            self.person_other_names[person.id].add((person.name, ''))
+
+        self.named_persons[(person.name, person.sort_name, person.family_name)].remove(person.id)
+        person.name = latest_candidate_name
+        self.named_persons.setdefault((person.name, person.sort_name, person.family_name), []).append(person.id)
+        self.changed_persons[person.id] = person
+
+    def save(self):
+        """
+        Insert the new objects and update the changed ones in a single transaction.
+        """
+        new_ids = set(o.id for model in (Person, Candidacy) for o in self.new_objects[model])
+        with transaction.atomic():
+            for model, obj_list in self.new_objects.items():
+                if obj_list:
+                    model.objects.bulk_create(obj_list)
+            for person_id, person in self.changed_persons.items():
+                if person_id not in new_ids:
+                    person.save(update_fields=['name'])
+            for candidacy_id, candidacy in self.changed_candidacies.items():
+                if candidacy_id not in new_ids:
+                    candidacy.save(update_fields=['registration_status', 'filed_date', 'extras', 'party'])
+
+
+def load_election_in_worker(scraped_election_id, load_options):
+    """
+    Load the contests and candidacies of a scraped election inside a worker process.
+
+    Each worker process opens its own database connection and locks the people it
+    creates, so two workers don't create the same person. Each candidate is committed
+    on its own, so the locks are only held while one candidate loads.
+
+    Return the count of candidates that failed to load.
+    """
+    locks.enabled = True
+    command = Command()
+    command.verbosity = load_options['verbosity']
+    command.no_color = load_options['no_color']
+    command.bulk = False
+    command.batch_size = 1
+    try:
+        return command.load_election(
+            ScrapedCandidateElectionProxy.objects.get_cached(scraped_election_id)
+        )
+    finally:
+        connection.close()
 
 
 class Command(CalAccessCommand):
@@ -18,6 +442,37 @@ class Command(CalAccessCommand):
     """
     help = 'Load the OCD CandidateContest and related models with scraped CAL-ACCESS data'
 
+    # How often load_in_workers checks on its workers while it waits for an election to finish
+    result_poll_seconds = 5
+
+    def add_arguments(self, parser):
+        """
+        Adds custom arguments specific to this command.
+        """
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            dest="bulk",
+            default=False,
+            help="Match each election's candidates in memory and save them with bulk inserts."
+        )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            type=int,
+            dest="workers",
+            default=1,
+            help="Number of processes for loading scraped elections at the same time (not with --bulk)."
+        )
+        parser.add_argument(
+            "--incremental-runoffs",
+            action="store_true",
+            dest="incremental_runoffs",
+            default=False,
+            help="Only link the runoff contests created by this run to their previous contests."
+        )
+
     def handle(self, *args, **options):
         """
         Make it happen.
@@ -25,63 +480,168 @@ class Command(CalAccessCommand):
         super(Command, self).handle(*args, **options)
         self.header("Load Candidate Contests")
 
+        self.bulk = options['bulk']
+        self.workers = options['workers']
+        if self.bulk and self.workers > 1:
+            # The bulk loader creates people without locking them
+            raise CommandError("--bulk can't be combined with more than one worker.")
+
         # Load everything we can from the scrape
-        for scraped_election in ScrapedCandidateElectionProxy.objects.all():
+        if self.workers > 1:
+            self.load_in_workers()
+        else:
+            for scraped_election in ScrapedCandidateElectionProxy.objects.all():
+                self.load_election(scraped_election)
 
-            # then over candidates in the scraped_election
-            scraped_candidate_list = ScrapedCandidateProxy.objects.filter(election=scraped_election)
-            for scraped_candidate in scraped_candidate_list:
+        # connect runoffs to their previously undecided contests
+        if self.verbosity > 2:
+            self.log(' Linking runoffs to previous contests')
+        runoff_count = OCDRunoffProxy.objects.set_parents(
+            created_since=self.start_datetime if options['incremental_runoffs'] else None,
+        )
+        if self.verbosity > 2:
+            self.log(' {0} runoffs linked'.format(runoff_count))
 
-                # Get contest
-                contest, contest_created = scraped_candidate.get_or_create_contest()
+        self.success("Done!")
 
-                # Create candidacy
-                candidacy, candidacy_created = OCDCandidacyProxy.objects.get_or_create_from_calaccess(
-                    contest,
-                    scraped_candidate.parsed_name,
-                    candidate_status='qualified',
-                    candidate_filer_id=scraped_candidate.scraped_id or None
+    def load_election(self, scraped_election):
+        """
+        Load the contests and candidacies of a scraped election.
+
+        Returns the count of candidates that failed to load.
+        """
+        # then over candidates in the scraped_election
+        scraped_candidate_list = ScrapedCandidateProxy.objects.filter(election=scraped_election)
+
+        if self.bulk:
+            self.bulk_load(scraped_election, scraped_candidate_list)
+            return 0
+
+        form501s = Form501Filing.objects.get_matcher().match_candidates(
+            scraped_candidate_list,
+            scraped_election,
+        )
+        return self.run_in_batches(
+            scraped_candidate_list,
+            lambda c: self.load_candidate(c, scraped_election, form501s[c.id]),
+        )
+
+    def load_in_workers(self):
+        """
+        Load the scraped elections in a pool of worker processes, then reconcile their results.
+
+        Posts are created first, so the workers only look them up, and the lookups
+        the workers share are loaded before they start. Each worker locks the people
+        it creates. Afterwards, elections that failed, had candidates that failed or
+        whose worker died are loaded again one at a time, and people created more
+        than once with the same filer_id are merged.
+        """
+        election_list = list(ScrapedCandidateElectionProxy.objects.all())
+        if self.verbosity > 2:
+            self.log(" Loading {0} elections with {1} workers".format(len(election_list), self.workers))
+
+        # Create the posts and load the shared lookups before starting the workers
+        self.run_in_batches(
+            ScrapedCandidateProxy.objects.values_list('office_name', flat=True).distinct(),
+            OCDPostProxy.objects.get_or_create_by_name,
+        )
+        Form501Filing.objects.get_matcher()
+        for scraped_election in election_list:
+            ScrapedCandidateElectionProxy.objects.resolve(scraped_election.name)
+
+        load_options = dict(
+            verbosity=self.verbosity,
+            no_color=self.no_color,
+        )
+
+        # Each worker process must open its own database connection
+        connections.close_all()
+        failed_list = []
+        with WorkerPool(self.workers, poll_seconds=self.result_poll_seconds) as pool:
+            for scraped_election in election_list:
+                pool.apply_async(
+                    scraped_election.id,
+                    load_election_in_worker,
+                    (scraped_election.id, load_options),
                 )
-                if candidacy_created and self.verbosity > 1:
-                    msg = ' Created Candidacy: {0.candidate_name} in {0.post.label}'.format(candidacy)
-                    self.log(msg)
-
-                #
-                # Dress it up with extra stuff
-                #
-
-                # add extra data from form501, if available
-                form501 = scraped_candidate.get_form501_filing()
-
-                if form501:
-                    candidacy.link_form501(form501)
-                    candidacy.update_from_form501(form501)
-
-                    # if the scraped_candidate lacks a filer_id, add the
-                    # Form501Filing.filer_id
-                    if scraped_candidate.scraped_id == '':
-                        candidacy.person.identifiers.get_or_create(
-                            scheme='calaccess_filer_id',
-                            identifier=form501.filer_id,
-                        )
-
-                # Fill the party if the candidacy doesn't have it
-                # Get the candidate's party, looking in our correction file for any fixes
-                if not candidacy.party:
-                    candidacy.party = scraped_candidate.get_party()
-                    candidacy.save()
-
-                # always update the source for the candidacy
-                candidacy.sources.update_or_create(
-                    url=scraped_candidate.url,
-                    note='Last scraped on {dt:%Y-%m-%d}'.format(
-                        dt=scraped_candidate.last_modified,
-                    )
+            for _ in election_list:
+                election_id, failures, error = pool.get_next_result()
+                if error:
+                    self.failure(" Loading election {0} failed:\n{1}".format(election_id, error))
+                if error or failures:
+                    failed_list.append(ScrapedCandidateElectionProxy.objects.get_cached(election_id))
+
+        # Reconcile: load the failed elections again, without other workers in the way
+        for scraped_election in failed_list:
+            if self.verbosity > 2:
+                self.log(" Reloading {0}".format(scraped_election.name))
+            self.load_election(scraped_election)
+
+        # and merge any people created by more than one worker
+        call_command('mergeocdpersonsbyfilerid', verbosity=self.verbosity, no_color=self.no_color)
+
+    def load_candidate(self, scraped_candidate, scraped_election, form501):
+        """
+        Load the contest and candidacy of a scraped candidate, with its matched Form 501 filing.
+        """
+        # Get contest
+        contest, contest_created = scraped_candidate.get_or_create_contest(scraped_election)
+
+        # Create candidacy
+        candidacy, candidacy_created = OCDCandidacyProxy.objects.get_or_create_from_calaccess(
+            contest,
+            scraped_candidate.parsed_name,
+            candidate_status='qualified',
+            candidate_filer_id=scraped_candidate.scraped_id or None
+        )
+        if candidacy_created and self.verbosity > 1:
+            msg = ' Created Candidacy: {0.candidate_name} in {0.post.label}'.format(candidacy)
+            self.log(msg)
+
+        #
+        # Dress it up with extra stuff
+        #
+
+        # add extra data from form501, if available
+        if form501:
+            candidacy.link_form501(form501)
+            candidacy.update_from_form501(form501)
+
+            # if the scraped_candidate lacks a filer_id, add the
+            # Form501Filing.filer_id
+            if scraped_candidate.scraped_id == '':
+                candidacy.person.identifiers.get_or_create(
+                    scheme='calaccess_filer_id',
+                    identifier=form501.filer_id,
                 )
 
-        # connect runoffs to their previously undecided contests
-        if self.verbosity > 2:
-            self.log(' Linking runoffs to previous contests')
-        OCDRunoffProxy.objects.set_parents()
+        # Fill the party if the candidacy doesn't have it
+        # Get the candidate's party, looking in our correction file for any fixes
+        if not candidacy.party:
+            candidacy.party = scraped_candidate.get_party(scraped_election)
+            save_or_defer(candidacy, ['party'])
 
-        self.success("Done!")
+        # always update the source for the candidacy
+        candidacy.sources.update_or_create(
+            url=scraped_candidate.url,
+            note='Last scraped on {dt:%Y-%m-%d}'.format(
+                dt=scraped_candidate.last_modified,
+            )
+        )
+
+    def bulk_load(self, scraped_election, scraped_candidate_list):
+        """
+        Load the contests and candidacies of a scraped election with a BulkCandidateContestLoader.
+        """
+        loader = BulkCandidateContestLoader(scraped_election)
+        created_list = loader.load(list(scraped_candidate_list))
+        if self.verbosity > 1:
+            for candidacy in created_list:
+                self.log(' Created Candidacy: {0.candidate_name} in {0.contest.name}'.format(candidacy))
+        if self.verbosity > 2:
+            self.log(' {0} contests, {1} candidacies and {2} people created for {3}'.format(
+                len(loader.new_objects[CandidateContest]),
+                len(created_list),
+                len(loader.new_objects[Person]),
+                scraped_election.name,
+            ))
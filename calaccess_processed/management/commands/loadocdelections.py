@@ -6,7 +6,7 @@ Load OCD elections models with data extracted and scraped from CAL-ACCESS.
 from django.apps import apps
 from django.conf import settings
 from django.utils.timezone import now
-from django.core.management import call_command
+from django.core.management import call_command, CommandError
 from calaccess_processed.management.commands import LoadOCDElectionsBase
 
 
@@ -16,11 +16,44 @@ class Command(LoadOCDElectionsBase):
     """
     help = 'Load OCD elections models with data extracted and scraped from CAL-ACCESS'
 
+    def add_arguments(self, parser):
+        """
+        Adds custom arguments specific to this command.
+        """
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            dest="bulk",
+            default=False,
+            help="Load candidate contests with bulk inserts."
+        )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            type=int,
+            dest="workers",
+            default=1,
+            help="Number of processes for loading candidate contests at the same time (not with --bulk)."
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_false",
+            dest="archive",
+            default=True,
+            help="Only record a processed file for each loaded model, without archiving it "
+                 "(processcalaccessdata archives them while building its combined archive)."
+        )
+
     def handle(self, *args, **options):
         """
         Make it happen.
         """
         super(Command, self).handle(*args, **options)
+        self.bulk = options['bulk']
+        self.workers = options['workers']
+        if self.bulk and self.workers > 1:
+            raise CommandError("--bulk can't be combined with more than one worker.")
 
         # Get the logger for this version
         self.processed_version = self.get_or_create_processed_version()[0]
@@ -30,7 +63,7 @@ class Command(LoadOCDElectionsBase):
 
         # archive if django project setting enabled
         if getattr(settings, 'CALACCESS_STORE_ARCHIVE', False):
-            self.archive()
+            self.archive(export=options['archive'])
 
         # Wrap it up
         self.success('Done!')
@@ -64,7 +97,7 @@ class Command(LoadOCDElectionsBase):
         # Load contests and candidates
         #
 
-        call_command('loadocdcandidatecontests', **options)
+        call_command('loadocdcandidatecontests', bulk=self.bulk, workers=self.workers, **options)
         self.duration()
 
         call_command('loadocdballotmeasurecontests', **options)
@@ -89,9 +122,11 @@ class Command(LoadOCDElectionsBase):
         call_command('mergeocdpersonsbycontestandname', **options)
         self.duration()
 
-    def archive(self):
+    def archive(self, export=True):
         """
         Save a csv file for each loaded OCD model.
+
+        If export is False, only the processed file of each model is recorded.
         """
         core_models = [
             m for m in apps.get_app_config('core').get_models()
@@ -114,10 +149,11 @@ class Command(LoadOCDElectionsBase):
             processed_data_file.process_start_datetime = now()
             processed_data_file.save()
 
-            call_command(
-                'archivecalaccessprocessedfile',
-                m._meta.object_name,
-            )
-            processed_data_file.refresh_from_db()
+            if export:
+                call_command(
+                    'archivecalaccessprocessedfile',
+                    m._meta.object_name,
+                )
+                processed_data_file.refresh_from_db()
             processed_data_file.process_finish_datetime = now()
             processed_data_file.save()
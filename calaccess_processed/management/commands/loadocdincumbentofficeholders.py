@@ -3,10 +3,9 @@
 """
 Load the OCD Membership model with data from the scraped Incumbent model.
 """
-from django.db.models import IntegerField
-from django.db.models.functions import Cast
+from django.db import connection
 from opencivicdata.core.models import Membership
-from opencivicdata.elections.models import Candidacy, CandidateContest
+from opencivicdata.elections.models import Candidacy, CandidateContest, Election
 from calaccess_processed.management.commands import CalAccessCommand
 from calaccess_processed.models import (
     OCDPersonProxy,
@@ -37,103 +36,131 @@ class Command(CalAccessCommand):
         """
         Load OCD Election, Membership and related models with data scraped from CAL-ACCESS website.
         """
-        for incumbent in ScrapedIncumbentProxy.objects.all():
-            # Get or create post
-            post, post_created = OCDPostProxy.objects.get_or_create_by_name(
-                incumbent.office_name,
-            )
-            if post_created and self.verbosity > 2:
-                self.log(' Created new Post: %s' % post.label)
-            # Get or person
-            person, person_created = OCDPersonProxy.objects.get_or_create_from_calaccess(
-                incumbent.parsed_name,
-                candidate_filer_id=incumbent.scraped_id,
-            )
-            if person_created and self.verbosity > 2:
-                self.log(' Created new Person: %s' % person.name)
-            # Get or create membership for post and person
-            membership, membership_created = Membership.objects.get_or_create(
-                person=person,
-                post=post,
-                role=post.role,
-                organization=post.organization,
-                person_name=person.name,
-            )
-            if membership_created and self.verbosity > 2:
-                self.log(' Created new Membership: %s' % membership)
-            # Handle start_date on membership
-            if membership_created or membership.start_date == '':
+        self.run_in_batches(ScrapedIncumbentProxy.objects.all(), self.load_incumbent)
+
+    def load_incumbent(self, incumbent):
+        """
+        Load the Post, Person and Membership of a scraped incumbent.
+        """
+        # Get or create post
+        post, post_created = OCDPostProxy.objects.get_or_create_by_name(
+            incumbent.office_name,
+        )
+        if post_created and self.verbosity > 2:
+            self.log(' Created new Post: %s' % post.label)
+        # Get or person
+        person, person_created = OCDPersonProxy.objects.get_or_create_from_calaccess(
+            incumbent.parsed_name,
+            candidate_filer_id=incumbent.scraped_id,
+        )
+        if person_created and self.verbosity > 2:
+            self.log(' Created new Person: %s' % person.name)
+        # Get or create membership for post and person
+        membership, membership_created = Membership.objects.get_or_create(
+            person=person,
+            post=post,
+            role=post.role,
+            organization=post.organization,
+            person_name=person.name,
+        )
+        if membership_created and self.verbosity > 2:
+            self.log(' Created new Membership: %s' % membership)
+        # Handle start_date on membership
+        if membership_created or membership.start_date == '':
+            membership.start_date = incumbent.session
+            membership.save()
+        else:
+            # increment start year down
+            start = int(membership.start_date)
+            if start > incumbent.session:
                 membership.start_date = incumbent.session
                 membership.save()
-            else:
-                # increment start year down
-                start = int(membership.start_date)
-                if start > incumbent.session:
-                    membership.start_date = incumbent.session
-                    membership.save()
 
     def set_end_dates(self):
         """
         Set the end_date for each Membership based on the start_date of each successor.
+
+        Each member's end year should be the start year of their successor: the
+        member in the same post with the earliest start year greater than the
+        incumbent's. Members without a start year are succeeded by the earliest one.
         """
-        for member in Membership.objects.all():
-            # Each member's end year should be the start year of their successor.
-            # Successor is the member in the same post with the earliest
-            # start year greater than the incumbent's start year
-            if member.start_date == '':
-                start_year = 0
-            else:
-                start_year = int(member.start_date)
+        sql = """
+        WITH start_years AS (
+            SELECT DISTINCT post_id, NULLIF(start_date, '')::int AS start_year
+            FROM "{membership}"
+            WHERE start_date != ''
+            UNION
+            SELECT DISTINCT post_id, 0
+            FROM "{membership}"
+        ), successors AS (
+            SELECT
+                post_id,
+                start_year,
+                LEAD(start_year) OVER (PARTITION BY post_id ORDER BY start_year) AS end_year
+            FROM start_years
+        )
+        UPDATE "{membership}" AS m
+        SET end_date = s.end_year::text
+        FROM successors AS s
+        WHERE m.post_id IS NOT DISTINCT FROM s.post_id
+        AND s.start_year = COALESCE(NULLIF(m.start_date, '')::int, 0)
+        AND s.end_year IS NOT NULL
+        AND m.end_date IS DISTINCT FROM s.end_year::text;
+        """.format(membership=Membership._meta.db_table)
 
-            successor_q = Membership.objects.exclude(
-                start_date='',
-            ).annotate(
-                start_year=Cast('start_date', IntegerField()),
-            ).filter(
-                start_year__gt=start_year,
-                post=member.post,
-            ).order_by('start_year')
+        with connection.cursor() as c:
+            c.execute(sql)
+            updated = c.rowcount
 
-            if successor_q.exists():
-                member.end_date = int(successor_q[0].start_date)
-                member.save()
+        if self.verbosity > 1:
+            self.log(' Set end dates on {} memberships'.format(updated))
 
     def set_incumbent_candidacies(self):
         """
         Set is_incumbent for candidacies within each member's start/end years.
-        """
-        # For every one of the member's candidacies for the office where
-        # the election of the contest happens after the start year
-        # but before the end year, if it exists, mark as incumbent
-        for member in Membership.objects.all():
-            candidacies_q = member.person.candidacies.filter(
-                contest__election__date__year__gt=int(member.start_date),
-                post=member.post,
-            ).exclude(is_incumbent=True)
-            # Handle blank member end_date values
-            if member.end_date != '':
-                member_end_year = int(member.end_date)
-                candidacies_q = candidacies_q.filter(
-                    contest__election__date__year__lte=member_end_year
-                )
 
-            if candidacies_q.exists():
-                rows = candidacies_q.update(is_incumbent=True)
-                if self.verbosity > 2:
-                    self.log(
-                        ' {0} identified as incumbent in {1} contests'.format(
-                            member.person.name,
-                            rows,
-                        )
-                    )
-        # loop over all contest with an incumbent candidate
-        contests_q = CandidateContest.objects.filter(
-            candidacies__is_incumbent=True
+        Every one of a member's candidacies for the office, where the election of the
+        contest happens after the start year but before the end year (if there is one),
+        is marked as incumbent. The other candidacies in those contests are marked as not.
+        """
+        tables = dict(
+            candidacy=Candidacy._meta.db_table,
+            contest=CandidateContest._meta.db_table,
+            election=Election._meta.db_table,
+            membership=Membership._meta.db_table,
         )
-        for contest in contests_q.all():
-            # set is_incumbent False for all other candidacies in contest
-            contest.candidacies.exclude(
-                is_incumbent=True
-            ).update(is_incumbent=False)
+        incumbent_sql = """
+        UPDATE "{candidacy}" AS c
+        SET is_incumbent = true
+        FROM "{membership}" AS m, "{contest}" AS ct, "{election}" AS e
+        WHERE c.person_id = m.person_id
+        AND c.post_id = m.post_id
+        AND c.contest_id = ct.id
+        AND ct.election_id = e.id
+        AND EXTRACT(YEAR FROM e.date) > NULLIF(m.start_date, '')::int
+        AND (m.end_date = '' OR EXTRACT(YEAR FROM e.date) <= NULLIF(m.end_date, '')::int)
+        AND c.is_incumbent IS DISTINCT FROM true;
+        """.format(**tables)
+        challenger_sql = """
+        UPDATE "{candidacy}" AS c
+        SET is_incumbent = false
+        WHERE c.is_incumbent IS NULL
+        AND EXISTS (
+            SELECT 1
+            FROM "{candidacy}" AS i
+            WHERE i.contest_id = c.contest_id
+            AND i.is_incumbent
+        );
+        """.format(**tables)
+
+        with connection.cursor() as c:
+            c.execute(incumbent_sql)
+            incumbent_count = c.rowcount
+            c.execute(challenger_sql)
+            challenger_count = c.rowcount
 
-        return
+        if self.verbosity > 1:
+            self.log(' Identified {} incumbent candidacies'.format(incumbent_count))
+            self.log(' Identified {} challenger candidacies in contests with an incumbent'.format(
+                challenger_count,
+            ))
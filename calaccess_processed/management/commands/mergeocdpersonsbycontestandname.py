@@ -3,18 +3,76 @@
 """
 Find and merge OCD Person records that share a name and CandidateContest.
 """
-from django.db.models import Count
+from itertools import groupby
+from django.db import connection
 from calaccess_processed.models import OCDPersonProxy
-from opencivicdata.elections.models import CandidateContest
+from opencivicdata.core.models import Person, PersonIdentifier, PersonName
+from opencivicdata.elections.models import Candidacy
 from calaccess_processed.management.commands import CalAccessCommand
 
 
+class PersonClusters(object):
+    """
+    Union-find of OCD Person ids, where no cluster may have more than one CAL-ACCESS filer_id.
+    """
+    def __init__(self, person_filer_ids):
+        """
+        Start with each person in its own cluster.
+
+        person_filer_ids is a dict mapping person ids to sets of their filer_ids.
+        """
+        self.parents = {}
+        self.filer_ids = dict((k, set(v)) for k, v in person_filer_ids.items())
+
+    def find(self, person_id):
+        """
+        Return the id of the person at the root of the person's cluster.
+        """
+        root = self.parents.setdefault(person_id, person_id)
+        while root != self.parents[root]:
+            root = self.parents[root]
+        # point everything on the way straight at the root
+        while person_id != root:
+            self.parents[person_id], person_id = root, self.parents[person_id]
+        return root
+
+    def union(self, a, b):
+        """
+        Combine the clusters of the two people, unless that would combine different filer_ids.
+
+        Returns whether the two people are now in the same cluster.
+        """
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return True
+        filer_ids = self.filer_ids.get(root_a, set()) | self.filer_ids.get(root_b, set())
+        if len(filer_ids) > 1:
+            return False
+        # keep the lower id as the root, so clusters come out the same every time
+        root, child = min(root_a, root_b), max(root_a, root_b)
+        self.parents[child] = root
+        self.filer_ids[root] = filer_ids
+        return True
+
+    def clusters(self):
+        """
+        Return a list of the sorted person ids in each cluster with more than one person.
+        """
+        members = {}
+        for person_id in self.parents:
+            members.setdefault(self.find(person_id), []).append(person_id)
+        return sorted(sorted(ids) for ids in members.values() if len(ids) > 1)
+
+
 class Command(CalAccessCommand):
     """
     Find and merge OCD Person records that share a name and CandidateContest.
     """
     help = 'Find and merge OCD Person records that share a name and CandidateContest'
 
+    # How many clusters of persons are merged in each transaction
+    merge_batch_size = 100
+
     def handle(self, *args, **options):
         """
         Make it happen.
@@ -23,132 +81,132 @@ class Command(CalAccessCommand):
 
         self.header("Merging Persons in same Contest with shared name")
 
-        # Loop over all CandidateContests
-        for contest in CandidateContest.objects.all():
-            for group_q in self.group_by_candidate_name(contest.candidacies):
-                self.handle_group(group_q)
-
-            for group_q in self.group_by_person_name(contest.candidacies):
-                self.handle_group(group_q)
-
-            for group_q in self.group_by_other_name(contest.candidacies):
-                self.handle_group(group_q)
+        groups = self.get_name_groups()
+        person_ids = set(c[1] for group in groups for c in group)
+        self.person_filer_ids = self.get_person_filer_ids(person_ids)
+        clusters = PersonClusters(self.person_filer_ids)
+        for group in groups:
+            self.handle_group(group, clusters)
+
+        cluster_list = clusters.clusters()
+        if self.verbosity > 1:
+            self.log(' Found {0} groups of candidacies sharing a name, making {1} clusters of persons'.format(
+                len(groups),
+                len(cluster_list),
+            ))
+        self.merge_clusters(cluster_list)
 
         self.success("Done!")
 
-    def group_by_candidate_name(self, candidacies_q):
+    def get_name_groups(self):
         """
-        Return a list of QuerySets for Candidacies with the same candidate_name.
-        """
-        q = candidacies_q.values('candidate_name').annotate(
-            row_count=Count('id'),
-        ).order_by().filter(row_count__gt=1)
-
-        results = []
-
-        for i in q.all():
-            results.append(
-                candidacies_q.filter(
-                    candidate_name=i['candidate_name']
-                ).order_by()
-            )
+        Return a list of groups of candidacies in the same contest that share a name.
 
-        return results
-
-    def group_by_person_name(self, candidacies_q):
+        Candidacies are grouped by candidate_name, by their Person's name and by their
+        Person's other names. Each group is a list of (candidacy id, person id, party id)
+        tuples for at least two different persons.
         """
-        Return a list of QuerySets for Candidacies with the same Person name.
+        sql = """
+        WITH names AS (
+            SELECT c.id, c.contest_id, c.person_id, c.party_id, 'candidate' AS kind, c.candidate_name AS name
+            FROM "{candidacy}" AS c
+            UNION
+            SELECT c.id, c.contest_id, c.person_id, c.party_id, 'person', p.name
+            FROM "{candidacy}" AS c
+            JOIN "{person}" AS p ON p.id = c.person_id
+            UNION
+            SELECT c.id, c.contest_id, c.person_id, c.party_id, 'other', n.name
+            FROM "{candidacy}" AS c
+            JOIN "{person_name}" AS n ON n.person_id = c.person_id
+            WHERE n.name != ''
+        ), counted AS (
+            SELECT
+                names.*,
+                MIN(person_id) OVER (PARTITION BY contest_id, kind, name) AS min_person_id,
+                MAX(person_id) OVER (PARTITION BY contest_id, kind, name) AS max_person_id
+            FROM names
+        )
+        SELECT contest_id, kind, name, id, person_id, party_id
+        FROM counted
+        WHERE min_person_id != max_person_id
+        ORDER BY contest_id, kind, name, id;
+        """.format(
+            candidacy=Candidacy._meta.db_table,
+            person=Person._meta.db_table,
+            person_name=PersonName._meta.db_table,
+        )
+        with connection.cursor() as c:
+            c.execute(sql)
+            rows = c.fetchall()
+
+        return [
+            [row[3:] for row in group]
+            for key, group in groupby(rows, key=lambda row: row[:3])
+        ]
+
+    def get_person_filer_ids(self, person_ids):
         """
-        q = candidacies_q.values('person__name').annotate(
-            row_count=Count('id'),
-        ).order_by().filter(row_count__gt=1)
-
-        results = []
-
-        for i in q.all():
-            results.append(
-                candidacies_q.filter(
-                    person__name=i['person__name']
-                ).order_by()
-            )
-
-        return results
-
-    def group_by_other_name(self, candidacies_q):
+        Return a dict mapping each of the person ids to a set of its CAL-ACCESS filer_ids.
         """
-        Return a list of QuerySets for Candidacies with shared other_name.
+        person_filer_ids = dict((i, set()) for i in person_ids)
+        for person_id, filer_id in PersonIdentifier.objects.filter(
+            person_id__in=person_ids,
+            scheme='calaccess_filer_id',
+        ).values_list('person_id', 'identifier'):
+            person_filer_ids[person_id].add(filer_id)
+        return person_filer_ids
+
+    def handle_group(self, group, clusters):
         """
-        q = candidacies_q.values('person__other_names__name').annotate(
-            row_count=Count('id'),
-        ).order_by().filter(row_count__gt=1)
-
-        results = []
+        Add a group of candidacies sharing a name to the clusters of persons to merge.
+        """
+        parties = set(party_id for candidacy_id, person_id, party_id in group)
+        person_ids = [person_id for candidacy_id, person_id, party_id in group]
 
-        for i in q.all():
-            if i['person__other_names__name']:
-                results.append(
-                    candidacies_q.filter(
-                        person__other_names__name=i['person__other_names__name']
-                    ).order_by()
+        # if there isn't more than one party and more than one filer_id, put everyone together
+        if len(parties - set([None])) <= 1 and len(self.get_filer_ids(person_ids)) <= 1:
+            self.cluster_persons(person_ids, clusters)
+        # handle multiple parties in the group
+        elif len(parties) > 1:
+            # put together the persons with the same party
+            for party in parties:
+                self.cluster_persons(
+                    [person_id for candidacy_id, person_id, party_id in group if party_id == party],
+                    clusters,
                 )
 
-        return results
-
-    def group_by_party(self, candidacies_q):
+    def get_filer_ids(self, person_ids):
         """
-        Return a list of QuerySets for Candidacies with the same party.
+        Return the set of CAL-ACCESS filer_ids of the persons.
         """
-        q = candidacies_q.values('party').annotate(
-            row_count=Count('id'),
-        ).order_by().filter(row_count__gt=1)
-
-        results = []
-
-        for i in q.all():
-            results.append(
-                candidacies_q.filter(
-                    party=i['party']
-                ).order_by()
-            )
+        filer_ids = set()
+        for person_id in person_ids:
+            filer_ids |= self.person_filer_ids[person_id]
+        return filer_ids
 
-        return results
-
-    def get_group_filer_id_count(self, candidacies_q):
+    def cluster_persons(self, person_ids, clusters):
         """
-        Return the count of distinct filer_ids in the Candidacy QuerySet.
+        Put persons together in a cluster, if they share no more than one filer_id.
         """
-        return candidacies_q.filter(
-            person__identifiers__scheme='calaccess_filer_id'
-        ).distinct('person__identifiers__identifier').count()
-
-    def handle_group(self, group_q):
+        if len(self.get_filer_ids(person_ids)) > 1:
+            return
+        for person_id in person_ids[1:]:
+            if not clusters.union(person_ids[0], person_id) and self.verbosity > 2:
+                self.log(' Not merging persons {0} and {1} with different filer_ids'.format(
+                    person_ids[0],
+                    person_id,
+                ))
+
+    def merge_clusters(self, cluster_list):
         """
-        Handle group of candidates for merging.
+        Merge each cluster of persons into one, merge_batch_size clusters at a time.
         """
-        # if there isn't more than one party and more than one filer_id
-        if (
-            group_q.distinct('party').exclude(party__isnull=True).count() <= 1 and
-            self.get_group_filer_id_count(group_q) <= 1
-        ):
+        for i in range(0, len(cluster_list), self.merge_batch_size):
+            batch = cluster_list[i:i + self.merge_batch_size]
             if self.verbosity > 2:
-                self.log(
-                    'Merging {0} persons in {1}'.format(
-                        group_q.count(),
-                        group_q.all()[0].contest,
-                    )
-                )
-                for c in group_q.all():
-                    self.log(' - {}'.format(c.person))
-            # merge
-            OCDPersonProxy.objects.merge([c.person for c in group_q.all()])
-        # handle multiple parties in the group
-        elif group_q.distinct('party').count() > 1:
-            # for each group with the same party in the group
-            for party_group_q in self.group_by_party(group_q):
-                # if there's only one filer_id
-                if self.get_group_filer_id_count(party_group_q) <= 1:
-                    # merge the group
-                    OCDPersonProxy.objects.merge(
-                        [c.person for c in party_group_q.all()]
-                    )
-        return
+                persons = OCDPersonProxy.objects.in_bulk([pid for cluster in batch for pid in cluster])
+                for cluster in batch:
+                    self.log('Merging {0} persons'.format(len(cluster)))
+                    for person_id in cluster:
+                        self.log(' - {}'.format(persons[person_id]))
+            OCDPersonProxy.objects.merge_groups([(cluster[0], cluster[1:]) for cluster in batch])
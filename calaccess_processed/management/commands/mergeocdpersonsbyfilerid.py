@@ -6,7 +6,7 @@ Find and merge OCD Person records that share the same CAL-ACCESS filer_id.
 from django.db.models import Count
 from calaccess_processed.models import OCDPersonProxy
 from calaccess_processed.management.commands import CalAccessCommand
-from opencivicdata.core.models import Person, PersonIdentifier
+from opencivicdata.core.models import PersonIdentifier
 
 
 class Command(CalAccessCommand):
@@ -35,22 +35,30 @@ class Command(CalAccessCommand):
             "Merging %s Person sets with shared CAL-ACCESS filer_id" % shared_filer_ids_q.count()
         )
 
-        for group in shared_filer_ids_q.all():
-            persons = [
-                p for p in Person.objects.filter(
-                    identifiers__scheme='calaccess_filer_id',
-                    identifiers__identifier=group['identifier'],
-                ).all()
-            ]
+        # Get all the persons for those filer_ids in one go
+        filer_persons = {}
+        for identifier, person_id in PersonIdentifier.objects.filter(
+            scheme='calaccess_filer_id',
+            identifier__in=shared_filer_ids_q.values('identifier'),
+        ).values_list('identifier', 'person_id').distinct():
+            filer_persons.setdefault(identifier, []).append(person_id)
 
+        groups = []
+        for identifier, person_ids in sorted(filer_persons.items()):
+            person_ids = sorted(set(person_ids))
+            if len(person_ids) < 2:
+                continue
             if self.verbosity > 2:
                 self.log(
                     "Merging {0} Persons sharing filer_id {1}".format(
-                        len(persons),
-                        group['identifier'],
+                        len(person_ids),
+                        identifier,
                     )
                 )
+            groups.append((person_ids[0], person_ids[1:]))
 
-            OCDPersonProxy.objects.merge(persons)
+        merged = OCDPersonProxy.objects.merge_groups(groups)
+        if self.verbosity > 1:
+            self.log(" Merged away {0} Persons".format(merged))
 
         self.success("Done!")
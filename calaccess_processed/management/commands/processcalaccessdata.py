@@ -3,13 +3,16 @@
 """
 Load data into processed CAL-ACCESS models, archive processed files and ZIP.
 """
-import os
+import json
 from django.conf import settings
-from django.core.files import File
+from django.core.files.base import ContentFile
 from django.utils.timezone import now
 from django.core.management import call_command
-from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+from calaccess_processed import archives
 from calaccess_processed.management.commands import CalAccessCommand
+from calaccess_processed.management.commands.archivecalaccessprocessedfile import (
+    Command as ArchiveCommand,
+)
 
 
 class Command(CalAccessCommand):
@@ -30,6 +33,54 @@ class Command(CalAccessCommand):
             default=False,
             help="Force re-start (overrides auto-resume)."
         )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            type=int,
+            dest="workers",
+            default=1,
+            help="Number of processes for loading independent models, and scraped elections, at the same time."
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            dest="incremental",
+            default=False,
+            help="Only reload filings that are new or changed since the previous "
+                 "processed version (falls back to a full rebuild if there is none)."
+        )
+        parser.add_argument(
+            "--staging",
+            action="store_true",
+            dest="staging",
+            default=False,
+            help="Rebuild the filing models in a staging schema and swap them into place "
+                 "when all are loaded (ignored by incremental updates)."
+        )
+        parser.add_argument(
+            "--chunks",
+            action="store",
+            type=int,
+            dest="chunks",
+            default=1,
+            help="Number of filing ranges to split each large item model's load into."
+        )
+        parser.add_argument(
+            "--chunk-workers",
+            action="store",
+            type=int,
+            dest="chunk_workers",
+            default=1,
+            help="Number of database connections for loading each model's ranges at the same time."
+        )
+        parser.add_argument(
+            "--index-workers",
+            action="store",
+            type=int,
+            dest="index_workers",
+            default=1,
+            help="Number of database connections for rebuilding each model's indexes at the same time."
+        )
 
     def handle(self, *args, **options):
         """
@@ -38,6 +89,12 @@ class Command(CalAccessCommand):
         # Set options
         super(Command, self).handle(*args, **options)
         self.force_restart = options.get("restart")
+        self.workers = options.get("workers")
+        self.incremental = options.get("incremental")
+        self.staging = options.get("staging")
+        self.chunks = options.get("chunks")
+        self.chunk_workers = options.get("chunk_workers")
+        self.index_workers = options.get("index_workers")
 
         # Get or create the logger record
         self.processed_version, created = self.get_or_create_processed_version()
@@ -67,6 +124,8 @@ class Command(CalAccessCommand):
         if getattr(settings, 'CALACCESS_STORE_ARCHIVE', False):
             # then zip
             self.zip()
+            # and list what's in it
+            self.save_manifest()
 
         # Wrap up the log
         self.processed_version.process_finish_datetime = now()
@@ -77,12 +136,23 @@ class Command(CalAccessCommand):
     def load(self):
         """
         Load all of the processed models.
+
+        If they're combined into a zip, they're archived while it's built instead
+        of right after they load.
         """
+        archive = archives.get_archive_format() != 'zip'
         call_command(
             'loadcalaccessfilings',
             verbosity=self.verbosity,
             no_color=self.no_color,
-            force_restart=self.force_restart
+            force_restart=self.force_restart,
+            workers=self.workers,
+            incremental=self.incremental,
+            staging=self.staging,
+            chunks=self.chunks,
+            chunk_workers=self.chunk_workers,
+            index_workers=self.index_workers,
+            archive=archive,
         )
         self.duration()
 
@@ -90,50 +160,117 @@ class Command(CalAccessCommand):
             'loadocdelections',
             verbosity=self.verbosity,
             no_color=self.no_color,
+            workers=self.workers,
+            archive=archive,
         )
         self.duration()
 
     def zip(self):
         """
-        Zip up all processed data files and archive the zip.
+        Combine all processed data files into one archive and save it.
+
+        For a zip, each model's table is streamed out of the database once, into
+        both its own archive and its member of the zip, which is compressed on a
+        pool of threads and streamed into storage. For a tar.xz, each archived file
+        is streamed from storage into the archive, since a tar member's size has to
+        be known before it's written.
+
+        The CALACCESS_ARCHIVE_FORMAT setting picks a zip or tar.xz archive. With
+        "gzip", each file is already compressed on its own, so nothing is combined.
         """
+        archive_format = archives.get_archive_format()
+        if archive_format == 'gzip':
+            if self.verbosity:
+                self.log("Processed files are archived as separate gzip files")
+            return
+
         if self.verbosity:
-            self.header("Zipping processed files")
+            self.header("Archiving processed files as %s" % archive_format)
 
-        # Remove previous zip file
+        # Remove previous archive
         self.processed_version.zip_archive.delete()
-        zip_path = os.path.join(self.data_dir, 'processed.zip')
 
-        # enable zipfile compression
-        compression = ZIP_DEFLATED
+        # Save the archive on the processed data version
+        if archive_format == 'zip':
+            self.processed_version.zip_size = archives.save_zip(
+                self.processed_version.zip_archive,
+                self.get_zip_members(),
+            )
+        else:
+            members = [
+                ('%s.csv' % f.file_name, f.file_archive)
+                for f in self.processed_version.files.exclude(file_archive='')
+            ]
+            if self.verbosity > 2:
+                for name, field_file in members:
+                    self.log(" Adding %s to %s" % (name, archive_format))
+            self.processed_version.zip_size = archives.save_tar_xz(
+                self.processed_version.zip_archive,
+                members,
+            )
+        self.processed_version.save()
+        if self.verbosity > 2:
+            self.log(" Archive saved.")
 
-        try:
-            zf = ZipFile(zip_path, 'w', compression, allowZip64=True)
-        except RuntimeError:
-            self.error('Zip file cannot be compressed (check zlib module).')
-            compression = ZIP_STORED
-            zf = ZipFile(zip_path, 'w', compression, allowZip64=True)
+    def get_zip_members(self):
+        """
+        Return a list of (name, write) tuples for the zip, one for each of the version's processed files.
 
-        # loop over and save files in csv dir
-        for f in os.listdir(self.processed_data_dir):
-            if self.verbosity > 2:
-                self.log(" Adding %s to zip" % f)
-            csv_path = os.path.join(self.processed_data_dir, f)
-            zf.write(csv_path, f)
+        Each write function archives its model, writing the .CSV into the zip member too.
+        """
+        archiver = ArchiveCommand()
+        archiver.stdout = self.stdout
+        archiver.verbosity = self.verbosity
+        archiver.no_color = self.no_color
 
-        # close the zip file
-        zf.close()
-        if self.verbosity > 2:
-            self.log(" All files zipped")
+        def get_write(file_name):
+            """
+            Return a function that archives the model and writes its .CSV to the provided file.
+            """
+            def write(fileobj):
+                """
+                Archive the model, writing its .CSV to the file too.
+                """
+                if self.verbosity > 2:
+                    self.log(" Adding %s.csv to zip" % file_name)
+                archiver.archive_model(file_name, tee=fileobj)
+            return write
 
-        # save the zip size
-        self.processed_version.zip_size = os.path.getsize(zip_path)
-        with open(zip_path, 'rb') as zf:
-            # Save the zip on the processed data version
-            if self.verbosity > 2:
-                self.log(" Archiving zip")
-            self.processed_version.zip_archive.save(
-                os.path.basename(zip_path), File(zf)
-            )
+        return [
+            ('%s.csv' % file_name, get_write(file_name))
+            for file_name in self.processed_version.files.values_list('file_name', flat=True)
+        ]
+
+    def save_manifest(self):
+        """
+        Save a JSON manifest of the version's archived files and their SHA-256 hashes.
+
+        Mirrors can compare the hashes against their copies to fetch only the files
+        that changed. Unchanged files point to the archive stored with an earlier version.
+        """
+        manifest = {
+            'release_datetime': self.processed_version.raw_version.release_datetime.isoformat(),
+            'files': [
+                {
+                    'file_name': f.file_name,
+                    'path': f.file_archive.name,
+                    'size': f.file_size,
+                    'sha256': f.sha256,
+                    'records_count': f.records_count,
+                }
+                for f in self.processed_version.files.exclude(file_archive='').order_by('file_name')
+            ],
+        }
+        if self.processed_version.zip_archive:
+            manifest['archive'] = {
+                'path': self.processed_version.zip_archive.name,
+                'size': self.processed_version.zip_size,
+            }
+
+        self.processed_version.manifest.delete(save=False)
+        self.processed_version.manifest.save(
+            'manifest.json',
+            ContentFile(json.dumps(manifest, indent=2).encode('utf-8')),
+        )
         if self.verbosity > 2:
-            self.log(" Zip archived.")
+            self.log(" Manifest saved.")
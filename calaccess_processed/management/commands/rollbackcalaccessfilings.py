@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Swap the previously live CAL-ACCESS Filing and FilingVersion tables back into place.
+"""
+from django.core.management import CommandError
+from calaccess_processed import schemas
+from calaccess_processed.management.commands import CalAccessCommand
+
+
+class Command(CalAccessCommand):
+    """
+    Swap the previously live CAL-ACCESS Filing and FilingVersion tables back into place.
+    """
+    help = 'Swap the previously live CAL-ACCESS Filing and FilingVersion tables back into place.'
+
+    def handle(self, *args, **options):
+        """
+        Make it happen.
+        """
+        super(Command, self).handle(*args, **options)
+
+        tables = [m._meta.db_table for m in self.get_filing_models()]
+        if not schemas.tables_exist(schemas.PREVIOUS_SCHEMA, tables):
+            raise CommandError(
+                "No previous filing tables to roll back to in the %s schema. They are "
+                "only kept after a `loadcalaccessfilings --staging` run." % schemas.PREVIOUS_SCHEMA
+            )
+
+        self.header("Rolling back {0} filing tables".format(len(tables)))
+        # Anything half-built in the staging schema is dropped by the swap
+        schemas.rollback_to_previous_schema(tables)
+        self.success("Done!")
@@ -5,18 +5,115 @@ Custom managers for working with CAL-ACCESS processed data models.
 """
 from __future__ import unicode_literals
 import os
-from django.db import models, connection
+import re
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, connection, transaction
+from django.utils.timezone import now
+from calaccess_processed import plans
+from calaccess_processed.schemas import LIVE_SCHEMA
+
+
+def get_database_temp_bytes():
+    """
+    Return the total bytes written to temporary files by queries against the current database.
+
+    The total includes every connection to the database, so the difference across a
+    statement is only exact if nothing else is running at the same time.
+    """
+    with connection.cursor() as c:
+        # drop any cached statistics so the latest numbers are read
+        c.execute('SELECT pg_stat_clear_snapshot()')
+        c.execute(
+            'SELECT temp_bytes FROM pg_stat_database WHERE datname = current_database()'
+        )
+        return c.fetchone()[0]
 
 
 class ProcessedDataManager(models.Manager):
     """
     Utilities for loading raw CAL-ACCESS data into processed data models.
     """
-    def add_constraints_and_indexes(self):
+    raw_data_load_query_pattern = re.compile(
+        r'^\s*INSERT INTO\s+(?P<table>\w+)\s*\((?P<columns>[^)]+)\)\s*(?P<select>SELECT\b.+?)\s*;?\s*$',
+        re.DOTALL | re.IGNORECASE,
+    )
+    # Finds the raw table a filing version load query selects from and its final WHERE clause
+    raw_filing_keys_pattern = re.compile(
+        r'\bFROM\s+(?P<table>"\w+")\s+(?:AS\s+)?(?P<alias>\w+)\b.*\bWHERE\s+(?P<where>[^;]+?)\s*$',
+        re.DOTALL | re.IGNORECASE,
+    )
+
+    # Find the name of the index or constraint created by a rebuild statement
+    create_index_pattern = re.compile(
+        r'^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?"(?P<name>[^"]+)"',
+        re.IGNORECASE,
+    )
+    add_constraint_pattern = re.compile(
+        r'\bADD\s+CONSTRAINT\s+"(?P<name>[^"]+)"',
+        re.IGNORECASE,
+    )
+
+    def add_constraints_and_indexes(self, workers=1, primary_key=False, missing_only=False):
         """
         Re-create constraints and indexes on the model and its fields.
+
+        Indexes are built first, on up to the provided number of database connections
+        at the same time, then constraints are added one after another. If the
+        CALACCESS_MAINTENANCE_WORK_MEM setting is set, each connection uses it for
+        maintenance_work_mem.
+
+        If primary_key is True, the primary key constraint is re-created too.
+
+        If missing_only is True, constraints and indexes already on the table are
+        left alone, like after a rebuild that was interrupted partway through.
         """
-        with connection.schema_editor() as schema_editor:
+        sql_list = self.get_constraints_and_indexes_sql(primary_key=primary_key)
+        if missing_only:
+            sql_list = self.exclude_existing_sql(sql_list, self.get_constraints())
+
+        index_sql = []
+        constraint_sql = []
+        for sql in sql_list:
+            if sql.lstrip().upper().startswith('CREATE'):
+                index_sql.append(sql)
+            else:
+                constraint_sql.append(sql)
+
+        if workers > 1 and len(index_sql) > 1:
+            pool = ThreadPool(min(workers, len(index_sql)))
+            try:
+                pool.map(self._execute_maintenance_sql_in_thread, [[sql] for sql in index_sql])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self._execute_maintenance_sql(index_sql)
+
+        self._execute_maintenance_sql(constraint_sql)
+
+    def get_constraints_and_indexes_sql(self, primary_key=False):
+        """
+        Return the list of sql statements that re-create constraints and indexes on the model.
+
+        If primary_key is True, statements that re-create the primary key constraint
+        from a unique index are included.
+        """
+        sql_list = []
+        if primary_key:
+            table = self.model._meta.db_table
+            sql_list.extend([
+                'CREATE UNIQUE INDEX "{0}_pkey" ON "{0}" ("{1}");'.format(
+                    table,
+                    self.model._meta.pk.column,
+                ),
+                'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_pkey" PRIMARY KEY USING INDEX "{0}_pkey";'.format(
+                    table,
+                ),
+            ])
+
+        with connection.schema_editor(collect_sql=True) as schema_editor:
             schema_editor.alter_unique_together(
                 self.model,
                 (),
@@ -42,6 +139,32 @@ class ProcessedDataManager(models.Manager):
                 schema_editor.alter_field(
                     self.model, field_copy, field
                 )
+        sql_list.extend(schema_editor.collected_sql)
+
+        return sql_list
+
+    def _execute_maintenance_sql(self, sql_list):
+        """
+        Execute the list of sql statements in a transaction with maintenance_work_mem tuned.
+        """
+        if not sql_list:
+            return
+        work_mem = getattr(settings, 'CALACCESS_MAINTENANCE_WORK_MEM', None)
+        with transaction.atomic():
+            with connection.cursor() as c:
+                if work_mem:
+                    c.execute('SET LOCAL maintenance_work_mem = %s', [work_mem])
+                for sql in sql_list:
+                    c.execute(sql)
+
+    def _execute_maintenance_sql_in_thread(self, sql_list):
+        """
+        Execute the list of sql statements on the current thread's own database connection.
+        """
+        try:
+            self._execute_maintenance_sql(sql_list)
+        finally:
+            connection.close()
 
     def drop_constraints_and_indexes(self):
         """
@@ -74,29 +197,321 @@ class ProcessedDataManager(models.Manager):
                     self.model, field, field_copy
                 )
 
-    def load_raw_data(self):
+    def get_constraints(self):
+        """
+        Return a dict of the constraints and indexes on the model's table, keyed by name.
+        """
+        with connection.cursor() as c:
+            return connection.introspection.get_constraints(
+                c,
+                self.model._meta.db_table,
+            )
+
+    def exclude_existing_sql(self, sql_list, constraints):
+        """
+        Return the statements in sql_list that don't create an index or constraint in constraints.
+
+        constraints is a dict like the one returned by get_constraints. Statements
+        that don't create a named index or constraint are always kept.
+        """
+        missing_sql = []
+        for sql in sql_list:
+            index_match = self.create_index_pattern.match(sql)
+            constraint_match = self.add_constraint_pattern.search(sql)
+            if index_match:
+                existing = constraints.get(index_match.group('name'), {}).get('index')
+            elif constraint_match:
+                existing = constraints.get(constraint_match.group('name'), {})
+                if 'PRIMARY KEY' in sql.upper():
+                    # the primary key is made from a unique index with the same name
+                    existing = existing.get('primary_key')
+                else:
+                    existing = any(existing.get(k) for k in ('foreign_key', 'unique', 'check'))
+            else:
+                existing = False
+            if not existing:
+                missing_sql.append(sql)
+        return missing_sql
+
+    def create_bare_table(self, schema):
+        """
+        Create an empty copy of the model's table in the schema, without constraints or indexes.
+
+        Any existing copy of the table in the schema is dropped first.
+        """
+        table = self.model._meta.db_table
+        pk = self.model._meta.pk
+        with connection.cursor() as c:
+            c.execute('DROP TABLE IF EXISTS "{0}"."{1}" CASCADE'.format(schema, table))
+            c.execute(
+                'CREATE TABLE "{0}"."{1}" (LIKE "{2}"."{1}" INCLUDING DEFAULTS)'.format(
+                    schema,
+                    table,
+                    LIVE_SCHEMA,
+                )
+            )
+            # The copied default still points at the live table's sequence, so give
+            # the copy its own sequence that will move along with it
+            if isinstance(pk, models.AutoField):
+                sequence = '{0}_{1}_seq'.format(table, pk.column)
+                c.execute(
+                    'CREATE SEQUENCE "{0}"."{1}" OWNED BY "{0}"."{2}"."{3}"'.format(
+                        schema,
+                        sequence,
+                        table,
+                        pk.column,
+                    )
+                )
+                c.execute(
+                    'ALTER TABLE "{0}"."{1}" ALTER COLUMN "{2}" '
+                    'SET DEFAULT nextval(\'"{0}"."{3}"\')'.format(
+                        schema,
+                        table,
+                        pk.column,
+                        sequence,
+                    )
+                )
+
+    def load_raw_data(self, bare_table=False, index_workers=1, profile=False):
         """
         Load the model by executing its raw sql load query.
 
-        Temporarily drops any constraints or indexes on the model.
+        Temporarily drops any constraints or indexes on the model, then rebuilds
+        them on up to index_workers database connections at the same time.
+
+        If bare_table is True, the model's table is assumed to have been made by
+        create_bare_table, so its primary key, constraints and indexes are only added
+        after loading.
+
+        If profile is True, the load query runs under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+        and its plan is included in the stats, with warnings about its slow operations.
+
+        Return a dict of load stats: the count of records inserted, the durations of
+        the insert and of the constraint and index rebuild and the bytes written to
+        temporary files during the insert.
         """
-        try:
-            self.drop_constraints_and_indexes()
-        except ValueError as e:
-            print(e)
-            print('Constrained fields: %s' % self.constrained_fields)
-            print('Indexed fields: %s' % self.indexed_fields)
-            dropped = False
-        else:
+        if bare_table:
             dropped = True
+        else:
+            try:
+                self.drop_constraints_and_indexes()
+            except ValueError as e:
+                print(e)
+                print('Constrained fields: %s' % self.constrained_fields)
+                print('Indexed fields: %s' % self.indexed_fields)
+                dropped = False
+            else:
+                dropped = True
 
+        stats = {}
+        temp_bytes_start = get_database_temp_bytes()
+        insert_start = now()
         c = connection.cursor()
         try:
-            c.execute(self.raw_data_load_query)
+            if profile:
+                c.execute(
+                    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) %s' % self.raw_data_load_query
+                )
+                plan = c.fetchone()[0][0]
+                stats['records_count'] = plans.get_inserted_rows(plan)
+                stats['query_plan'] = plan
+                stats['query_plan_warnings'] = plans.get_plan_warnings(plan)
+            else:
+                c.execute(self.raw_data_load_query)
+                stats['records_count'] = c.rowcount
         finally:
             c.close()
+            stats['insert_duration'] = now() - insert_start
+            stats['temp_bytes'] = get_database_temp_bytes() - temp_bytes_start
+            rebuild_start = now()
             if dropped:
-                self.add_constraints_and_indexes()
+                self.add_constraints_and_indexes(
+                    workers=index_workers,
+                    primary_key=bare_table,
+                )
+            stats['rebuild_duration'] = now() - rebuild_start
+        return stats
+
+    def get_table_sizes(self):
+        """
+        Return a dict with the size on disk (in bytes) of the model's table and of its indexes.
+        """
+        with connection.cursor() as c:
+            c.execute(
+                'SELECT pg_table_size(%s::regclass), pg_indexes_size(%s::regclass)',
+                [self.model._meta.db_table] * 2,
+            )
+            table_size, index_size = c.fetchone()
+        return {'table_size': table_size, 'index_size': index_size}
+
+    def get_raw_data_load_query(self, where=None):
+        """
+        Return string of raw sql for loading the model, limited to rows matching the where clause.
+
+        The where clause can refer to any of the columns inserted by the load query.
+        """
+        if not where:
+            return self.raw_data_load_query
+
+        return (
+            'INSERT INTO {table} ({columns})\n'
+            'SELECT * FROM (\n{select}\n) AS load_query ({columns})\n'
+            'WHERE {where};'
+        ).format(
+            table=self.model._meta.db_table,
+            columns=', '.join(self.raw_data_load_query_columns),
+            select=self.raw_data_load_query_select,
+            where=where,
+        )
+
+    def get_filing_filter(self, filing_id_sql):
+        """
+        Return a sql condition limiting the model's rows to the filings selected by filing_id_sql.
+        """
+        field_names = [f.attname for f in self.model._meta.fields]
+        if 'filing_id' in field_names:
+            return 'filing_id IN ({0})'.format(filing_id_sql)
+        elif 'filing_version_id' in field_names:
+            version_model = self.model._meta.get_field('filing_version').related_model
+            return 'filing_version_id IN (SELECT id FROM {0} WHERE filing_id IN ({1}))'.format(
+                version_model._meta.db_table,
+                filing_id_sql,
+            )
+        else:
+            raise ValueError(
+                "%s can't be filtered by filing_id." % self.model._meta.object_name
+            )
+
+    def delete_filings(self, filing_id_sql):
+        """
+        Delete the model's rows for the filings selected by filing_id_sql.
+
+        Return the count of rows deleted.
+        """
+        with connection.cursor() as c:
+            c.execute(
+                'DELETE FROM {0} WHERE {1}'.format(
+                    self.model._meta.db_table,
+                    self.get_filing_filter(filing_id_sql),
+                )
+            )
+            return c.rowcount
+
+    def load_raw_data_for_filings(self, filing_id_sql):
+        """
+        Load the model's rows for the filings selected by filing_id_sql.
+
+        Unlike load_raw_data, constraints and indexes are left in place.
+
+        Return the count of rows inserted.
+        """
+        with connection.cursor() as c:
+            c.execute(
+                self.get_raw_data_load_query(
+                    where=self.get_filing_filter(filing_id_sql),
+                )
+            )
+            return c.rowcount
+
+    @property
+    def chunk_key_field(self):
+        """
+        Return the foreign key field the model's load query can be split into ranges on, or None.
+
+        That's its filing_version or filing field, if the load query reads the related table.
+        """
+        dependencies = self.raw_data_load_query_dependencies
+        for name in ('filing_version', 'filing'):
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.is_relation and field.related_model._meta.db_table in dependencies:
+                return field
+        return None
+
+    def get_chunk_ranges(self, chunk_count):
+        """
+        Return a list of (min_key, max_key) tuples splitting the model's load query into chunks.
+
+        Each range covers roughly the same number of rows in the related table of chunk_key_field.
+        """
+        field = self.chunk_key_field
+        if not field:
+            raise ValueError(
+                "Load query for %s can't be split into chunks." % self.model._meta.object_name
+            )
+        with connection.cursor() as c:
+            c.execute(
+                'SELECT MIN(key), MAX(key) FROM ('
+                'SELECT {column} AS key, NTILE(%s) OVER (ORDER BY {column}) AS chunk FROM {table}'
+                ') AS keys GROUP BY chunk ORDER BY chunk'.format(
+                    column=field.target_field.column,
+                    table=field.related_model._meta.db_table,
+                ),
+                [chunk_count],
+            )
+            return c.fetchall()
+
+    def load_raw_data_chunk(self, min_key, max_key):
+        """
+        Load the model's rows with a chunk_key_field value between min_key and max_key, inclusive.
+
+        Return the count of rows inserted.
+        """
+        with connection.cursor() as c:
+            c.execute(
+                self.get_raw_data_load_query(
+                    where='{0} BETWEEN {1:d} AND {2:d}'.format(
+                        self.chunk_key_field.column,
+                        min_key,
+                        max_key,
+                    )
+                )
+            )
+            return c.rowcount
+
+    @property
+    def raw_filing_keys_query(self):
+        """
+        Return a sql query selecting the filing_id and amend_id of each raw filing version the model loads.
+
+        Only the table the load query selects from is read, filtered by the load query's
+        final WHERE clause, so none of its joins are run.
+        """
+        columns = self.raw_data_load_query_columns
+        match = self.raw_filing_keys_pattern.search(self.raw_data_load_query_select)
+        if 'filing_id' not in columns or 'amend_id' not in columns or not match:
+            raise ValueError(
+                "Load query for %s doesn't select filing versions from a raw table." % (
+                    self.model._meta.object_name
+                )
+            )
+        return (
+            'SELECT {alias}."FILING_ID" AS filing_id, {alias}."AMEND_ID" AS amend_id\n'
+            'FROM {table} {alias}\n'
+            'WHERE {where}'
+        ).format(**match.groupdict())
+
+    @property
+    def changed_filing_ids_query(self):
+        """
+        Return a sql query selecting the filing_id of versions that differ between the model's table and raw data.
+
+        This includes filings with versions that are new or removed since the model was last
+        loaded. Only the (filing_id, amend_id) keys are compared, which is enough because
+        CAL-ACCESS records any change to a filing, including to its items, as a new amendment.
+        """
+        return (
+            'WITH loaded AS (SELECT filing_id, amend_id FROM {table}), '
+            'raw AS (\n{raw}\n)\n'
+            'SELECT filing_id FROM (SELECT * FROM raw EXCEPT SELECT * FROM loaded) AS added\n'
+            'UNION\n'
+            'SELECT filing_id FROM (SELECT * FROM loaded EXCEPT SELECT * FROM raw) AS removed'
+        ).format(
+            table=self.model._meta.db_table,
+            raw=self.raw_filing_keys_query,
+        )
 
     @property
     def constrained_fields(self):
@@ -145,6 +560,46 @@ class ProcessedDataManager(models.Manager):
                 sql = f.read()
         return sql
 
+    @property
+    def raw_data_load_query_columns(self):
+        """
+        Return the list of columns inserted by the model's load query.
+        """
+        return [
+            c.strip() for c in self._match_raw_data_load_query().group('columns').split(',')
+        ]
+
+    @property
+    def raw_data_load_query_select(self):
+        """
+        Return the SELECT statement of the model's load query.
+        """
+        return self._match_raw_data_load_query().group('select')
+
+    def _match_raw_data_load_query(self):
+        """
+        Match the model's load query against the expected INSERT ... SELECT pattern.
+        """
+        match = self.raw_data_load_query_pattern.match(self.raw_data_load_query)
+        if not match:
+            raise ValueError(
+                "Load query for %s isn't a single INSERT ... SELECT statement." % (
+                    self.model._meta.object_name
+                )
+            )
+        return match
+
+    @property
+    def raw_data_load_query_dependencies(self):
+        """
+        Return the set of other processed db tables read by the model's load query.
+        """
+        tables = set(
+            re.findall(r'\bcalaccess_processed_\w+\b', self.raw_data_load_query)
+        )
+        tables.discard(self.model._meta.db_table)
+        return tables
+
     @property
     def raw_data_load_query_path(self):
         """
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calaccess_processed', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedDataChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_key', models.IntegerField(help_text='Lowest filing_id or filing_version_id value included in the chunk', verbose_name='minimum key')),
+                ('max_key', models.IntegerField(help_text='Highest filing_id or filing_version_id value included in the chunk', verbose_name='maximum key')),
+                ('process_start_datetime', models.DateTimeField(help_text='Date and time when the processing of the chunk started', null=True, verbose_name='date and time processing started')),
+                ('process_finish_datetime', models.DateTimeField(help_text='Date and time when the processing of the chunk finished', null=True, verbose_name='date and time processing finished')),
+                ('records_count', models.IntegerField(default=0, help_text='Count of records loaded from the chunk', verbose_name='clean records count')),
+                ('processed_file', models.ForeignKey(help_text='Foreign key referencing the processed data file the chunk is loaded into', on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='calaccess_processed.ProcessedDataFile', verbose_name='processed data file')),
+            ],
+            options={
+                'verbose_name': 'TRACKING: processed CAL-ACCESS data file chunk',
+                'ordering': ('processed_file', 'min_key'),
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calaccess_processed', '0002_processeddatachunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='rebuild_duration',
+            field=models.DurationField(help_text='Time spent re-creating constraints and indexes after loading the file', null=True, verbose_name='constraint and index rebuild duration'),
+        ),
+    ]
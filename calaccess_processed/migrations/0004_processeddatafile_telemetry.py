@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calaccess_processed', '0003_processeddatafile_rebuild_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='insert_duration',
+            field=models.DurationField(help_text='Time spent inserting the records of the file', null=True, verbose_name='insert duration'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='count_duration',
+            field=models.DurationField(help_text='Time spent counting the records of the file, if they were not counted as they were inserted', null=True, verbose_name='count duration'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='archive_duration',
+            field=models.DurationField(help_text='Time spent archiving the file', null=True, verbose_name='archive duration'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='rows_per_second',
+            field=models.FloatField(help_text='Count of records inserted divided by the insert duration', null=True, verbose_name='rows inserted per second'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='table_size',
+            field=models.BigIntegerField(help_text='Size on disk of the database table of the file, not including indexes (in bytes)', null=True, verbose_name='size of table on disk (in bytes)'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='index_size',
+            field=models.BigIntegerField(help_text='Size on disk of the indexes on the database table of the file (in bytes)', null=True, verbose_name='size of indexes on disk (in bytes)'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='temp_bytes',
+            field=models.BigIntegerField(help_text='Bytes written to temporary files by the database while inserting the records of the file', null=True, verbose_name='temporary file bytes'),
+        ),
+    ]
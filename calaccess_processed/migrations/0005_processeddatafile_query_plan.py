@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calaccess_processed', '0004_processeddatafile_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='query_plan',
+            field=django.contrib.postgres.fields.jsonb.JSONField(help_text='EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) output of the query that loaded the file, if it was profiled', null=True, verbose_name='load query plan'),
+        ),
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='query_plan_warnings',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=list, help_text='Sequential scans, spills to disk and row misestimates found in the load query plan', verbose_name='load query plan warnings'),
+        ),
+    ]
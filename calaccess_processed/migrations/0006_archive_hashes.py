@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import calaccess_processed
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calaccess_processed', '0005_processeddatafile_query_plan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processeddatafile',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, help_text="SHA-256 hash of the processed file's .CSV contents. Files with the same hash in different versions share one archive.", max_length=64, verbose_name='SHA-256 hash'),
+        ),
+        migrations.AddField(
+            model_name='processeddataversion',
+            name='manifest',
+            field=models.FileField(blank=True, help_text='A JSON file listing the archive path, size and SHA-256 hash of each processed file', max_length=255, upload_to=calaccess_processed.archive_directory_path, verbose_name='manifest of processed files'),
+        ),
+    ]
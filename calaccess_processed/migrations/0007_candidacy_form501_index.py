@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calaccess_processed', '0006_archive_hashes'),
+        ('elections', '0002_auto_20170731_2047'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX IF NOT EXISTS calaccess_processed_candidacy_form501_filing_ids
+            ON opencivicdata_candidacy
+            USING GIN ((extras->'form501_filing_ids') jsonb_path_ops);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS calaccess_processed_candidacy_form501_filing_ids;",
+        ),
+    ]
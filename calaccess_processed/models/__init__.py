@@ -83,6 +83,7 @@ from .research import (
 from .tracking import (
     ProcessedDataVersion,
     ProcessedDataFile,
+    ProcessedDataChunk,
 )
 from .proxies import (
     RawFilerToFilerTypeCdManager,
@@ -180,6 +181,7 @@ __all__ = (
     'FilingIDValue',
     'ProcessedDataVersion',
     'ProcessedDataFile',
+    'ProcessedDataChunk',
     'RawFilerToFilerTypeCdManager',
     'ScrapedCandidateProxy',
     'ScrapedCandidateElectionProxy',
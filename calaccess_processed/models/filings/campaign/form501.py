@@ -4,7 +4,7 @@
 Models for storing campaign-related entities derived from raw CAL-ACCESS data.
 """
 from __future__ import unicode_literals
-import itertools
+from collections import defaultdict
 from datetime import date
 import calaccess_processed
 from django.db import models
@@ -16,18 +16,140 @@ from calaccess_processed.models import CalAccessBaseModel
 from calaccess_processed.models.filings import FilingMixin, FilingVersionMixin
 
 
+class Form501Matcher(object):
+    """
+    Matches scraped candidates to Form 501 filings in memory.
+
+    Filings are indexed by office, district and filer_id, and by office, district
+    and the candidate's name as "<last_name>, <first_name>" and
+    "<last_name>, <first_name> <middle_name>". They can also be looked up by filing_id.
+    """
+    def __init__(self, filings):
+        """
+        Index the provided Form501Filing objects.
+        """
+        self.by_filing_id = {}
+        self.by_filer_id = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self.by_name_with_middle = defaultdict(list)
+        for filing in filings:
+            office = (filing.office or '').upper()
+            self.by_filing_id[filing.filing_id] = filing
+            self.by_filer_id[(office, filing.district, filing.filer_id)].append(filing)
+            self.by_name[(office, filing.district, '{0.last_name}, {0.first_name}'.format(filing))].append(filing)
+            self.by_name_with_middle[(
+                office,
+                filing.district,
+                '{0.last_name}, {0.first_name} {0.middle_name}'.format(filing),
+            )].append(filing)
+
+    def get_latest(self, filings, election_year, election_type=None):
+        """
+        Return the most recently filed of the filings up to election_year, optionally of election_type.
+
+        Filings without a date_filed are considered the most recent, as they are in the database.
+        """
+        filings = [
+            f for f in filings
+            if f.election_year is not None and f.election_year <= election_year and
+            (election_type is None or f.election_type == election_type)
+        ]
+        if not filings:
+            return None
+        return max(filings, key=lambda f: (f.date_filed is None, f.date_filed or date.min))
+
+    def match(self, office_type, district, election_year, election_type, filer_id='', name=''):
+        """
+        Return the Form501Filing for a candidate for office_type and district in election_year.
+
+        If the candidate has a filer_id, look up the filing by it. Otherwise, look it up by name.
+        Filings of the same election_type are preferred. Return None if there's no match.
+        """
+        if office_type is None:
+            return None
+        office = office_type.upper()
+
+        if filer_id:
+            filings = self.by_filer_id.get((office, district, filer_id), [])
+        else:
+            # Use the "<last_name>, <first_name> <middle_name>" format unless
+            # there are filings with the "<last_name>, <first_name>"
+            filings = self.by_name.get((office, district, name), [])
+            if not self.get_latest(filings, election_year):
+                filings = self.by_name_with_middle.get((office, district, name), [])
+
+        return (
+            self.get_latest(filings, election_year, election_type) or
+            self.get_latest(filings, election_year)
+        )
+
+    def match_candidate(self, candidate, scraped_election=None):
+        """
+        Return the Form501Filing that matches a ScrapedCandidateProxy, or None.
+
+        Provide the candidate's ScrapedCandidateElectionProxy to save looking it up.
+        """
+        election_data = (scraped_election or candidate.election_proxy).parsed_name
+        office_data = candidate.parse_office_name()
+        return self.match(
+            office_data['type'],
+            office_data['district'],
+            election_data['year'],
+            election_data['type'],
+            filer_id=candidate.scraped_id,
+            name=candidate.name,
+        )
+
+    def match_candidates(self, candidates, scraped_election):
+        """
+        Return a dict mapping the id of each ScrapedCandidateProxy in scraped_election to its Form501Filing or None.
+        """
+        return dict(
+            (candidate.id, self.match_candidate(candidate, scraped_election))
+            for candidate in candidates
+        )
+
+
 class Form501FilingManager(ProcessedDataManager):
     """
     A custom manager for Form 501 filings.
     """
+    _matcher = None
+
+    def get_matcher(self):
+        """
+        Returns a Form501Matcher of every Form 501 filing, loading it from the database on first use.
+
+        It's kept until clear_cache is called, which happens at the start of every command.
+        """
+        if self._matcher is None:
+            self._matcher = Form501Matcher(self.get_queryset().iterator())
+        return self._matcher
+
+    def clear_cache(self):
+        """
+        Drop the Form501Matcher, so the next match reloads the filings.
+        """
+        self._matcher = None
+
     def without_candidacy(self):
         """
         Returns Form 501 filings that do not have an OCD Candidacy yet.
+
+        A filing has a candidacy if its filing_id is in the candidacy's form501_filing_ids
+        extra, which is checked through the GIN index on them. Filings for retirement
+        board offices are left out.
         """
-        from calaccess_processed.models import OCDCandidacyProxy
-        matched_qs = OCDCandidacyProxy.objects.matched_form501_ids()
-        matched_list = [i for i in itertools.chain.from_iterable(matched_qs)]
-        return self.get_queryset().exclude(filing_id__in=matched_list, office__icontains='RETIREMENT')
+        from opencivicdata.elections.models import Candidacy
+        return self.get_queryset().exclude(
+            office__icontains='RETIREMENT',
+        ).extra(where=["""
+            NOT EXISTS (
+                SELECT 1
+                FROM "{candidacy}" AS c
+                WHERE c.extras->'form501_filing_ids' @> jsonb_build_array("{form501}".filing_id)
+            )
+        """.format(candidacy=Candidacy._meta.db_table, form501=self.model._meta.db_table)])
 
 
 class Form501FilingBase(CalAccessBaseModel):
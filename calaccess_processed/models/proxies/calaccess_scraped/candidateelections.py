@@ -9,23 +9,148 @@ from datetime import date
 from django.utils import timezone
 from calaccess_processed import get_expected_election_date, special_elections
 from calaccess_scraped.models import CandidateElection, IncumbentElection
-from .electionsbase import ElectionProxyMixin
+from .electionsbase import ElectionProxyMixin, ScrapedElectionProxyManager
 from ..opencivicdata.elections import OCDElectionProxy
 
+# Pattern of scraped candidate election names, e.g. "2010 SPECIAL RUNOFF (ASSEMBLY 72)"
+ELECTION_NAME_PATTERN = re.compile(
+    r'^(?P<year>\d{4}) (?P<type>\b(?:[A-Z]| )+)(?: \((?P<office>(?:[A-Z]| )+)(?P<district>\d+)?\))?$'
+)
+
+
+def parse_election_name(name):
+    """
+    Parse a scraped candidate election name into its constituent parts.
+
+    Parts include:
+    * Four-digit year (int)
+    * Type (str), e.g., "GENERAL", "PRIMARY", "SPECIAL ELECTION", "SPECIAL RUNOFF"
+    * Office (optional str)
+    * District (optional int)
+
+    Returns a dict with year, type, office and district as keys.
+    """
+    # Parse out the data
+    parsed_name = ELECTION_NAME_PATTERN.match(name).groupdict()
+
+    # Clean up the contents
+    parsed_name['year'] = int(parsed_name['year'])
+    parsed_name['type'] = parsed_name['type'].strip()
+    if parsed_name['office']:
+        parsed_name['office'] = parsed_name['office'].strip()
+    if parsed_name['district']:
+        parsed_name['district'] = int(parsed_name['district'])
+
+    # Pass it out
+    return parsed_name
+
+
+def resolve_election_date(name, parsed_name, incumbent_elections):
+    """
+    Use a scraped candidate election name to look up the election date.
+
+    incumbent_elections is a list of the scraped IncumbentElection objects to check.
+
+    Return a date object, if found, else None.
+    """
+    # If this is the 2008, we have a hacked out edge case solution
+    if name == '2008 PRIMARY':
+        return date(2008, 6, 3)
+
+    try:
+        # Check if the date is in our hardcoded list of special election
+        dt = special_elections.names_to_dates_dict[name]
+        return timezone.datetime.strptime(dt, '%Y-%m-%d').date()
+    except KeyError:
+        pass
+
+    # If not check the alternative list kept by the scraped IncumbentElection model
+    incumbent_list = [
+        e for e in incumbent_elections
+        if e.date and e.date.year == parsed_name['year'] and
+        parsed_name['type'].upper() in e.name.upper()
+    ]
+    if len(incumbent_list) == 1:
+        return incumbent_list[0].date
+
+    # If that doesn't work either, try parsing the election date from the name
+    try:
+        return get_expected_election_date(parsed_name['year'], parsed_name['type'])
+    except Exception:
+        # If that fails, just give up and return None
+        return None
+
+
+class ScrapedCandidateElectionManager(ScrapedElectionProxyManager):
+    """
+    Custom manager for scraped candidate elections that resolves every election's name and date once.
+    """
+    _resolutions = None
+    _parsed_names = None
+
+    def get_parsed_name(self, name):
+        """
+        Returns the parsed parts of a scraped election name, parsing each name only once.
+        """
+        if self._parsed_names is None:
+            self._parsed_names = {}
+        if name not in self._parsed_names:
+            self._parsed_names[name] = parse_election_name(name)
+        return self._parsed_names[name]
+
+    def resolve(self, name):
+        """
+        Returns a dict with the parsed parts and the date of the scraped election with the provided name.
+
+        Every election is resolved on first use and kept until clear_cache is called.
+        Names that aren't in the database are resolved as they come.
+        """
+        if self._resolutions is None:
+            incumbent_elections = ScrapedIncumbentElectionProxy.objects.get_cached_list()
+            self._resolutions = {}
+            for election in self.get_cached_list():
+                self._resolutions[election.name] = self.get_resolution(election.name, incumbent_elections)
+        if name not in self._resolutions:
+            self._resolutions[name] = self.get_resolution(
+                name,
+                ScrapedIncumbentElectionProxy.objects.get_cached_list(),
+            )
+        return self._resolutions[name]
+
+    def get_resolution(self, name, incumbent_elections):
+        """
+        Returns a dict with the parsed parts and the date of a scraped election name.
+        """
+        parsed_name = self.get_parsed_name(name)
+        return dict(
+            parsed_name=parsed_name,
+            date=resolve_election_date(name, parsed_name, incumbent_elections),
+        )
+
+    def clear_cache(self):
+        """
+        Drop the cached elections and their resolved names and dates.
+        """
+        super(ScrapedCandidateElectionManager, self).clear_cache()
+        self._resolutions = None
+        self._parsed_names = None
+
 
 class ScrapedCandidateElectionProxy(ElectionProxyMixin, CandidateElection):
     """
     A proxy for the CandidateElection model in calaccess_scraped.
     """
+    objects = ScrapedCandidateElectionManager()
+
     class Meta:
         """
         Make this a proxy model.
         """
         proxy = True
 
-    def get_ocd_election(self):
+    def find_ocd_election(self):
         """
-        Returns an OCD Election object for this record, if it exists.
+        Looks up the OCD Election object for this record.
         """
         # First, try getting the record via election's scraped_id
         try:
@@ -55,37 +180,9 @@ class ScrapedCandidateElectionProxy(ElectionProxyMixin, CandidateElection):
         """
         Use a scraped candidate election name to look up the election date.
 
-        Return a timezone aware date object, if found, else None.
+        Return a date object, if found, else None.
         """
-        # If this is the 2008, we have a hacked out edge case solution
-        if self.name == '2008 PRIMARY':
-            return date(2008, 6, 3)
-
-        try:
-            # Check if the date is in our hardcoded list of special election
-            dt = special_elections.names_to_dates_dict[self.name]
-            return timezone.datetime.strptime(dt, '%Y-%m-%d').date()
-        except KeyError:
-            pass
-
-        # If not check the alternative list kept by the scraped IncumbentElection model
-        try:
-            incumbent = IncumbentElection.objects.get(
-                date__year=self.parsed_name['year'],
-                name__icontains=self.parsed_name['type'],
-            )
-            return incumbent.date
-        except (IncumbentElection.DoesNotExist, IncumbentElection.MultipleObjectsReturned):
-            pass
-
-        # If that doesn't work either, try parsing the election date from the name
-        try:
-            return get_expected_election_date(
-                self.date.year, self.election_type
-            )
-        except:
-            # If that fails, just give up and return None
-            return None
+        return self.__class__.objects.resolve(self.name)['date']
 
     @property
     def parsed_name(self):
@@ -100,35 +197,24 @@ class ScrapedCandidateElectionProxy(ElectionProxyMixin, CandidateElection):
 
         Returns a dict with year, type, office and district as keys.
         """
-        # Parse out the data
-        pattern = r'^(?P<year>\d{4}) (?P<type>\b(?:[A-Z]| )+)(?: \((?P<office>(?:[A-Z]| )+)(?P<district>\d+)?\))?$' # NOQA
-        parsed_name = re.match(pattern, self.name).groupdict()
-
-        # Clean up the contents
-        parsed_name['year'] = int(parsed_name['year'])
-        parsed_name['type'] = parsed_name['type'].strip()
-        if parsed_name['office']:
-            parsed_name['office'] = parsed_name['office'].strip()
-        if parsed_name['district']:
-            parsed_name['district'] = int(parsed_name['district'])
-
-        # Pass it out
-        return parsed_name
+        return dict(self.__class__.objects.get_parsed_name(self.name))
 
 
 class ScrapedIncumbentElectionProxy(ElectionProxyMixin, IncumbentElection):
     """
     A proxy for the IncumbentElection model in calaccess_scraped.
     """
+    objects = ScrapedElectionProxyManager()
+
     class Meta:
         """
         Make this a proxy model.
         """
         proxy = True
 
-    def get_ocd_election(self):
+    def find_ocd_election(self):
         """
-        Returns an OCD Election object for this record, if it exists.
+        Looks up the OCD Election object for this record.
         """
         try:
             ocd_election = OCDElectionProxy.objects.get(
@@ -7,8 +7,6 @@ from __future__ import unicode_literals
 import re
 import logging
 from calaccess_processed import corrections
-from django.db.models.functions import Concat
-from django.db.models import Value, CharField
 from ..opencivicdata.posts import OCDPostProxy
 from ..opencivicdata.parties import OCDPartyProxy
 from .candidateelections import ScrapedCandidateElectionProxy
@@ -118,13 +116,15 @@ class ScrapedCandidateProxy(Candidate, ScrapedNameMixin):
         """
         Return the proxy model for the related election object.
         """
-        return ScrapedCandidateElectionProxy.objects.get(id=self.election.id)
+        return ScrapedCandidateElectionProxy.objects.get_cached(self.election_id)
 
-    def get_corrected_party(self):
+    def get_corrected_party(self, scraped_election=None):
         """
         Returns a manually correction to the candidate's party, if it's been made. Otherwise returns None.
+
+        Provide the candidate's ScrapedCandidateElectionProxy to save looking it up.
         """
-        scraped_election = self.election_proxy
+        scraped_election = scraped_election or self.election_proxy
         return corrections.candidate_party(
             self.name,
             scraped_election.date.year,
@@ -132,27 +132,29 @@ class ScrapedCandidateProxy(Candidate, ScrapedNameMixin):
             self.office_name,
         )
 
-    def get_party(self):
+    def get_party(self, scraped_election=None):
         """
         Returns the party we believe the candidate was associated with this election.
+
+        Provide the candidate's ScrapedCandidateElectionProxy to save looking it up.
         """
         # First, if the candidate is running for this office, it is by definition non-partisan
         if self.office_name == 'SUPERINTENDENT OF PUBLIC INSTRUCTION':
             logger.debug("{} party set to NO PARTY PREFERENCE based on office".format(self))
-            return OCDPartyProxy.objects.get(name="NO PARTY PREFERENCE")
+            return OCDPartyProxy.objects.get_by_name("NO PARTY PREFERENCE")
 
         # Next pull the OCD election record so we have it to inspect
-        scraped_election = self.election_proxy
+        scraped_election = scraped_election or self.election_proxy
 
         # Check if this candidate has been manually corrected.
-        party = self.get_corrected_party()
+        party = self.get_corrected_party(scraped_election)
         # If so, just pass that out right away
         if party:
             logger.debug("{} party set to {} based on correction".format(self, party))
             return party
 
         # Next, if they have filed a 501 form, let's use that
-        form501 = self.get_form501_filing()
+        form501 = self.get_form501_filing(scraped_election)
         if form501:
             # Try getting party from form 501 party
             party = OCDPartyProxy.objects.get_by_name(form501.party)
@@ -175,14 +177,14 @@ class ScrapedCandidateProxy(Candidate, ScrapedNameMixin):
         # Otherwise just give up and return the unknown party
         else:
             logger.debug("{} party set to UNKNOWN after failing to find a match".format(self))
-            return OCDPartyProxy.objects.get(name="UNKNOWN")
+            return OCDPartyProxy.objects.unknown()
 
-    def get_form501_filing(self):
+    def get_form501_filing(self, scraped_election=None):
         """
         Return a Form501Filing that matches the scraped Candidate.
 
-        By default, return the latest Form501FilingVersion, unless earliest
-        is set to True.
+        Filings are filtered by office type, district and election year, and the
+        most recently filed one is returned, preferring those of the same election type.
 
         If the scraped Candidate has a scraped_id, lookup the Form501Filing
         by filer_id. Otherwise, lookup using the candidate's name.
@@ -191,74 +193,14 @@ class ScrapedCandidateProxy(Candidate, ScrapedNameMixin):
         """
         from calaccess_processed.models import Form501Filing
 
-        election_data = self.election_proxy.parsed_name
-        office_data = self.parse_office_name()
-
-        # filter all form501 lookups by office type, district and election year
-        # get the most recently filed Form501 within the election_year
-        q = Form501Filing.objects.filter(
-            office__iexact=office_data['type'],
-            district=office_data['district'],
-            election_year__lte=election_data['year'],
-        )
-
-        if self.scraped_id != '':
-            try:
-                # first, try to get w/ filer_id and election_type
-                form501 = q.filter(
-                    filer_id=self.scraped_id,
-                    election_type=election_data['type']
-                ).latest('date_filed')
-            except Form501Filing.DoesNotExist:
-                # if that fails, try dropping election_type from filter
-                try:
-                    form501 = q.filter(filer_id=self.scraped_id).latest('date_filed')
-                except Form501Filing.DoesNotExist:
-                    form501 = None
-        else:
-            # if no filer_id, combine name fields from form501
-            # first try "<last_name>, <first_name>" format.
-            q = q.annotate(
-                full_name=Concat(
-                    'last_name',
-                    Value(', '),
-                    'first_name',
-                    output_field=CharField(),
-                )
-            )
-            # check if there are any with the "<last_name>, <first_name>"
-            if not q.filter(full_name=self.name).exists():
-                # use "<last_name>, <first_name> <middle_name>" format
-                q = q.annotate(
-                    full_name=Concat(
-                        'last_name',
-                        Value(', '),
-                        'first_name',
-                        Value(' '),
-                        'middle_name',
-                        output_field=CharField(),
-                    ),
-                )
+        return Form501Filing.objects.get_matcher().match_candidate(self, scraped_election)
 
-            try:
-                # first, try to get w/ filer_id and election_type
-                form501 = q.filter(
-                    full_name=self.name,
-                    election_type=election_data['type'],
-                ).latest('date_filed')
-            except Form501Filing.DoesNotExist:
-                # if that fails, try dropping election_type from filter
-                try:
-                    form501 = q.filter(full_name=self.name).latest('date_filed')
-                except Form501Filing.DoesNotExist:
-                    form501 = None
-
-        return form501
-
-    def get_or_create_contest(self):
+    def get_or_create_contest(self, scraped_election=None):
         """
         Get or create an OCD CandidateContest object.
 
+        Provide the candidate's ScrapedCandidateElectionProxy to save looking it up.
+
         Returns a tuple (CandidateContest object, created), where created is a boolean
         specifying whether a CandidateContest was created.
         """
@@ -266,11 +208,32 @@ class ScrapedCandidateProxy(Candidate, ScrapedNameMixin):
         post, post_created = OCDPostProxy.objects.get_or_create_by_name(self.office_name)
 
         # Get election data
-        scraped_election = self.election_proxy
+        scraped_election = scraped_election or self.election_proxy
+
+        # Make it happen
+        contest, created = CandidateContest.objects.get_or_create(
+            election=scraped_election.get_ocd_election(),
+            division=post.division,
+            **self.get_contest_fields(scraped_election, self.get_party(scraped_election))
+        )
+
+        # if contest was created, add the Post
+        if created:
+            contest.posts.create(post=post)
+
+        # Always update the source for the contest
+        contest.sources.update_or_create(
+            url=self.url,
+            note='Last scraped on {dt:%Y-%m-%d}'.format(dt=self.last_modified)
+        )
 
-        # Get the candidate's party
-        candidate_party = self.get_party()
+        # Return the contest and whether or not it was created
+        return contest, created
 
+    def get_contest_fields(self, scraped_election, candidate_party):
+        """
+        Returns a dict of the name, previous_term_unexpired and party of the candidate's CandidateContest.
+        """
         # Assume all "SPECIAL" candidate elections are for contests where the
         # previous term of the office was unexpired.
         if scraped_election.is_special:
@@ -304,24 +267,8 @@ class ScrapedCandidateProxy(Candidate, ScrapedNameMixin):
                 # ... and there's no need to do anything to the contest name.
                 contest_name = self.office_name
 
-        # Make it happen
-        contest, created = CandidateContest.objects.get_or_create(
-            election=scraped_election.get_ocd_election(),
+        return dict(
             name=contest_name,
             previous_term_unexpired=previous_term_unexpired,
             party=contest_party,
-            division=post.division,
         )
-
-        # if contest was created, add the Post
-        if created:
-            contest.posts.create(post=post)
-
-        # Always update the source for the contest
-        contest.sources.update_or_create(
-            url=self.url,
-            note='Last scraped on {dt:%Y-%m-%d}'.format(dt=self.last_modified)
-        )
-
-        # Return the contest and whether or not it was created
-        return contest, created
@@ -5,13 +5,64 @@ Proxy models for augmenting our source data tables with methods useful for proce
 """
 from __future__ import unicode_literals
 from datetime import date
+from django.db import models
 from ..opencivicdata.elections import OCDElectionProxy
+from ..opencivicdata.unitofwork import sync_pending
+
+
+class ScrapedElectionProxyManager(models.Manager):
+    """
+    Custom manager for scraped Election proxy models that keeps one instance of each election.
+    """
+    _cache = None
+
+    def get_cached(self, election_id):
+        """
+        Returns the election with the provided id, loading all of them on first use.
+
+        The same instance is returned every time until clear_cache is called, which
+        happens at the start of every command, so each election's OCD Election is
+        only looked up once.
+        """
+        return self.get_cache()[election_id]
+
+    def get_cached_list(self):
+        """
+        Returns a list of all the cached elections.
+        """
+        return list(self.get_cache().values())
+
+    def get_cache(self):
+        """
+        Returns a dict of all the elections keyed by id, loading it on first use.
+        """
+        if self._cache is None:
+            self._cache = dict((e.id, e) for e in self.get_queryset())
+        return self._cache
+
+    def clear_cache(self):
+        """
+        Drop the cached elections, so the next lookup reloads them.
+        """
+        self._cache = None
 
 
 class ElectionProxyMixin(object):
     """
     Mixin with properties and methods shared by all scraped Election proxy models.
     """
+    _ocd_election = None
+
+    def get_ocd_election(self):
+        """
+        Returns an OCD Election object for this record, if it exists.
+
+        The Election is kept on the instance once it's found.
+        """
+        if self._ocd_election is None:
+            self._ocd_election = self.find_ocd_election()
+        return self._ocd_election
+
     def get_or_create_ocd_election(self):
         """
         Get the OCD Election for the scraped election instance, or create a new one.
@@ -47,7 +98,10 @@ class ElectionProxyMixin(object):
                 ocd_election.add_election_id(self.scraped_id)
 
             ocd_election.refresh_from_db()
+            # keep any changes that haven't been saved yet
+            sync_pending(ocd_election)
 
+        self._ocd_election = ocd_election
         return ocd_election, created
 
     @property
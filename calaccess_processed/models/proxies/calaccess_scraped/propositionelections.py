@@ -7,7 +7,7 @@ from __future__ import unicode_literals
 import re
 from django.utils import timezone
 from calaccess_scraped.models import PropositionElection
-from .electionsbase import ElectionProxyMixin
+from .electionsbase import ElectionProxyMixin, ScrapedElectionProxyManager
 from ..opencivicdata.elections import OCDElectionProxy
 
 
@@ -17,6 +17,8 @@ class ScrapedPropositionElectionProxy(ElectionProxyMixin, PropositionElection):
     """
     NAME_PATTERN = re.compile(r'^(?P<date>^[A-Z]+\s\d{1,2},\s\d{4})\s(?P<type>.+)$')
 
+    objects = ScrapedElectionProxyManager()
+
     class Meta:
         """
         Make this a proxy model.
@@ -48,9 +50,9 @@ class ScrapedPropositionElectionProxy(ElectionProxyMixin, PropositionElection):
         # Convert it to a datetime object
         return timezone.datetime.strptime(match.groupdict()['date'], '%B %d, %Y').date()
 
-    def get_ocd_election(self):
+    def find_ocd_election(self):
         """
-        Returns an OCD Election object for this record, if it exists.
+        Looks up the OCD Election object for this record.
         """
         try:
             ocd_election = OCDElectionProxy.objects.get(
@@ -23,7 +23,7 @@ class ScrapedPropositionProxy(Proposition):
         """
         Return the proxy model for the related election object.
         """
-        return ScrapedPropositionElectionProxy.objects.get(id=self.election.id)
+        return ScrapedPropositionElectionProxy.objects.get_cached(self.election_id)
 
     @property
     def classification(self):
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A cache for proxy managers that only keeps objects whose rows are committed.
+"""
+from __future__ import unicode_literals
+from django.db import transaction
+
+
+class CommittedCache(object):
+    """
+    Keeps the objects a manager finds or creates, by key, once their rows are committed.
+
+    An object created inside a transaction is added when the transaction commits,
+    so a row rolled back with its transaction or savepoint is never returned. An object
+    found under a key that's still waiting on a commit is held back the same way, since
+    it could be the uncommitted row. Outside of a transaction, objects are added right away.
+    """
+    def __init__(self):
+        """
+        Start with nothing cached.
+        """
+        self.objects = {}
+        # keys of objects created in a transaction that hasn't committed yet
+        self.pending = set()
+
+    def __contains__(self, key):
+        return key in self.objects
+
+    def __getitem__(self, key):
+        return self.objects[key]
+
+    def add(self, key, obj, created=False):
+        """
+        Keep obj under key, or wait until the current transaction commits if its row could still be rolled back.
+        """
+        if not created and key not in self.pending:
+            self.objects[key] = obj
+            return
+        self.pending.add(key)
+        transaction.on_commit(lambda: self.commit(key, obj))
+
+    def commit(self, key, obj):
+        """
+        Keep obj under key now that its row is committed.
+        """
+        self.objects[key] = obj
+        self.pending.discard(key)
@@ -4,9 +4,11 @@
 Proxy models for augmenting our source data tables with methods useful for processing.
 """
 from __future__ import unicode_literals
-from django.db import models
+from datetime import date
+from django.db import connection, models
 from .people import OCDPersonProxy
 from .elections import OCDElectionProxy
+from .unitofwork import save_or_defer, sync_pending
 from django.db.models import IntegerField
 from django.db.models import Case, When, Q
 from django.db.models.functions import Cast
@@ -50,12 +52,16 @@ class OCDCandidacyManager(models.Manager):
 
     def matched_form501_ids(self):
         """
-        Return all the Form 501 filing ids matched to a candidacy record.
+        Return a set of all the Form 501 filing ids matched to a candidacy record.
         """
-        return [
-            i['extras']['form501_filing_ids'] for i in
-            self.get_queryset().filter(extras__has_key='form501_filing_ids').values('extras')
-        ]
+        sql = """
+        SELECT DISTINCT jsonb_array_elements_text(extras->'form501_filing_ids')::int
+        FROM "{candidacy}"
+        WHERE extras ? 'form501_filing_ids';
+        """.format(candidacy=self.model._meta.db_table)
+        with connection.cursor() as c:
+            c.execute(sql)
+            return set(row[0] for row in c.fetchall())
 
     def get_or_create_from_calaccess(
         self,
@@ -144,7 +150,7 @@ class OCDCandidacyManager(models.Manager):
         # if provided registration does not equal the default, update
         if candidate_status != 'filed' and candidate_status != candidacy.registration_status:
             candidacy.registration_status = candidate_status
-            candidacy.save()
+            save_or_defer(candidacy, ['registration_status'])
 
         # make sure Person name is same as most recent candidate_name
         person = candidacy.person
@@ -179,6 +185,7 @@ class OCDCandidacyProxy(Candidacy):
         """
         Link a Form501Filing to a Candidacy, if it isn't already.
         """
+        sync_pending(self)
         # Check if the attribute is already there
         if 'form501_filing_ids' in self.extras:
             # If it is, check if we already have this id
@@ -186,38 +193,42 @@ class OCDCandidacyProxy(Candidacy):
                 # If we don't, append it to the list
                 self.extras['form501_filing_ids'].append(form501.filing_id)
                 # Save out
-                self.save()
+                save_or_defer(self, ['extras'])
         # If the attribute isn't there, go ahead and add it.
         else:
             self.extras['form501_filing_ids'] = [form501.filing_id]
             # Save out
-            self.save()
+            save_or_defer(self, ['extras'])
 
     def update_from_form501(self, form501):
         """
         Set Candidacy fields using data extracted from linked Form501Filings.
         """
         from calaccess_processed.models import Form501Filing
+        sync_pending(self)
 
-        # get all Form501Filing linked to Candidacy
-        filing_ids = self.extras['form501_filing_ids']
-        filings = Form501Filing.objects.filter(filing_id__in=filing_ids)
+        # get all Form501Filing linked to Candidacy, from the filings already in memory
+        by_filing_id = Form501Filing.objects.get_matcher().by_filing_id
+        filings = [by_filing_id[i] for i in self.extras['form501_filing_ids'] if i in by_filing_id]
+        if not filings:
+            return
 
         # keep the earliest filed_date
-        first_filed_date = filings.earliest('date_filed').date_filed
+        filed_dates = [f.date_filed for f in filings if f.date_filed]
+        first_filed_date = min(filed_dates) if filed_dates else None
 
         # If the filed dates don't match, update them
         if self.filed_date != first_filed_date:
             self.filed_date = first_filed_date
-            self.save()
+            save_or_defer(self, ['filed_date'])
 
-        # keep going if latest filing says withdrawn
-        latest = filings.latest('date_filed')
+        # keep going if latest filing says withdrawn, treating filings without a date as the latest
+        latest = max(filings, key=lambda f: (f.date_filed is None, f.date_filed or date.min))
         if latest.statement_type == '10003':  # <-- This is the code for withdrawn
             # If the candidacy hasn't been marked that way, update it now
             if self.registration_status != 'withdrawn':
                 self.registration_status = 'withdrawn'
-                self.save()
+                save_or_defer(self, ['registration_status'])
 
     def check_incumbency(self):
         """
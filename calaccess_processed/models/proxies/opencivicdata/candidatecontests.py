@@ -4,7 +4,7 @@
 Proxy models for augmenting our source data tables with methods useful for processing.
 """
 from __future__ import unicode_literals
-from django.db import models
+from django.db import connection, models
 from opencivicdata.elections.models import CandidateContest
 
 
@@ -18,15 +18,58 @@ class OCDRunoffManager(models.Manager):
         """
         return super(OCDRunoffManager, self).get_queryset().filter(name__contains='RUNOFF')
 
-    def set_parents(self):
+    def set_parents(self, created_since=None):
         """
         Connect and save parent contests for all runoffs.
+
+        The parent of a runoff is the most recent contest for the same post in an
+        earlier election. If created_since is provided, only runoffs created at or
+        after that datetime are linked.
+
+        Returns the count of runoffs updated.
         """
-        for obj in self.get_queryset().all():
-            # Carve out for the duplicate 2010 Assembly 43 runoffs until
-            # I can figure out what I broke.
-            obj.runoff_for_contest = obj.get_parent()
-            obj.save()
+        from opencivicdata.elections.models import CandidateContestPost, Election
+
+        sql = """
+        UPDATE "{contest}" AS r
+        SET "{parent}" = p.parent_id
+        FROM (
+            SELECT r.id, parent.id AS parent_id
+            FROM "{contest}" AS r
+            JOIN "{election}" AS re ON re.id = r.election_id
+            -- should only ever be one post per contest
+            JOIN LATERAL (
+                SELECT cp.post_id
+                FROM "{contest_post}" AS cp
+                WHERE cp.contest_id = r.id
+                ORDER BY cp.id
+                LIMIT 1
+            ) AS rp ON true
+            LEFT JOIN LATERAL (
+                SELECT c.id
+                FROM "{contest}" AS c
+                JOIN "{contest_post}" AS cp ON cp.contest_id = c.id
+                JOIN "{election}" AS e ON e.id = c.election_id
+                WHERE cp.post_id = rp.post_id
+                AND e.date < re.date
+                ORDER BY e.date DESC, c.id
+                LIMIT 1
+            ) AS parent ON true
+            WHERE r.name LIKE '%%RUNOFF%%'
+            {created_filter}
+        ) AS p
+        WHERE r.id = p.id
+        AND r."{parent}" IS DISTINCT FROM p.parent_id;
+        """.format(
+            contest=self.model._meta.db_table,
+            parent=self.model._meta.get_field('runoff_for_contest').column,
+            contest_post=CandidateContestPost._meta.db_table,
+            election=Election._meta.db_table,
+            created_filter='AND r.created_at >= %s' if created_since else '',
+        )
+        with connection.cursor() as c:
+            c.execute(sql, [created_since] if created_since else [])
+            return c.rowcount
 
 
 class OCDRunoffProxy(CandidateContest):
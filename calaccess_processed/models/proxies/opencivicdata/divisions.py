@@ -8,7 +8,34 @@ from django.db import models
 from opencivicdata.core.models import Division
 
 
-class OCDAssemblyDivisionManager(models.Manager):
+class OCDDistrictDivisionManager(models.Manager):
+    """
+    Custom helpers for OCD Division models numbered by district.
+    """
+    _cache = None
+
+    def get_by_district(self, district):
+        """
+        Returns the division for the district number.
+
+        Every division is fetched on first use and kept until clear_cache is called,
+        which happens at the start of every command.
+        """
+        if self._cache is None:
+            self._cache = dict((d.subid2, d) for d in self.get_queryset())
+        try:
+            return self._cache[str(district)]
+        except KeyError:
+            raise self.model.DoesNotExist("No division for district %s." % district)
+
+    def clear_cache(self):
+        """
+        Drop the divisions fetched so far.
+        """
+        self._cache = None
+
+
+class OCDAssemblyDivisionManager(OCDDistrictDivisionManager):
     """
     Custom helpers for the OCD Division model.
     """
@@ -22,7 +49,7 @@ class OCDAssemblyDivisionManager(models.Manager):
         )
 
 
-class OCDSenateDivisionManager(models.Manager):
+class OCDSenateDivisionManager(OCDDistrictDivisionManager):
     """
     Custom helpers for the OCD Division model.
     """
@@ -40,11 +67,23 @@ class OCDCaliforniaDivisionManager(models.Manager):
     """
     Custom helpers for the OCD Division model.
     """
+    _california = None
+
     def california(self):
         """
         Returns state of California division.
+
+        It's fetched once and kept until clear_cache is called, which happens at the start of every command.
+        """
+        if self._california is None:
+            self._california = self.get_queryset().get(id='ocd-division/country:us/state:ca')
+        return self._california
+
+    def clear_cache(self):
+        """
+        Drop the California division fetched so far.
         """
-        return self.get_queryset().get(id='ocd-division/country:us/state:ca')
+        self._california = None
 
 
 class OCDDivisionProxy(Division):
@@ -8,7 +8,8 @@ from django.db import models
 from .divisions import OCDDivisionProxy
 from django.utils.text import get_text_list
 from .organizations import OCDOrganizationProxy
-from opencivicdata.elections.models import Election
+from .unitofwork import create_or_defer, has_new, save_or_defer, sync_pending
+from opencivicdata.elections.models import Election, ElectionIdentifier
 
 
 class OCDPartisanPrimaryManager(models.Manager):
@@ -71,6 +72,7 @@ class OCDElectionProxy(Election):
         """
         Add election_type to 'calaccess_election_type' in extras field (if missing).
         """
+        sync_pending(self)
         if 'calaccess_election_type' in self.extras.keys():
             # and if this one isn't included
             if election_type not in self.extras[
@@ -79,12 +81,12 @@ class OCDElectionProxy(Election):
                 # then append
                 self.extras['calaccess_election_type'].append(election_type)
                 # and save
-                self.save()
+                save_or_defer(self, ['extras'])
         else:
             # if election doesn't already have types, add the key
             self.extras['calaccess_election_type'] = [election_type]
             # and save
-            self.save()
+            save_or_defer(self, ['extras'])
 
         return
 
@@ -92,15 +94,11 @@ class OCDElectionProxy(Election):
         """
         Add election_id to identifiers, if missing.
         """
-        if not self.identifiers.filter(
-            scheme='calaccess_election_id',
-            identifier=election_id,
-        ).exists():
-            self.identifiers.create(
-                scheme='calaccess_election_id',
-                identifier=election_id,
-            )
-            self.save()
+        kwargs = dict(scheme='calaccess_election_id', identifier=election_id)
+        if has_new(ElectionIdentifier, election_id=self.id, **kwargs):
+            return
+        if not self.identifiers.filter(**kwargs).exists():
+            create_or_defer(ElectionIdentifier(election=self, **kwargs))
 
         return
 
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Advisory locks that keep parallel loaders from creating the same OCD object twice.
+"""
+from __future__ import unicode_literals
+from django.db import connection
+
+# Whether lock_for_create takes locks. Set in each worker process of a parallel load.
+enabled = False
+
+
+def lock_for_create(*key_parts):
+    """
+    Take a Postgres advisory lock on a key for the rest of the transaction, if locking is enabled.
+
+    Call it before looking up an object that will be created if it's missing. Another
+    worker locking the same key waits until this transaction commits, then finds the
+    object this one created instead of creating its own.
+    """
+    lock_all_for_create([key_parts])
+
+
+def lock_all_for_create(keys):
+    """
+    Take the advisory locks on a list of keys, each a tuple of key parts, if locking is enabled.
+
+    The keys are locked in sorted order, so two workers locking some of the same keys
+    can't each hold one the other is waiting for.
+    """
+    if not enabled or not connection.in_atomic_block:
+        return
+    key_list = sorted(set('|'.join('%s' % part for part in key_parts) for key_parts in keys))
+    with connection.cursor() as c:
+        for key in key_list:
+            c.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", [key])
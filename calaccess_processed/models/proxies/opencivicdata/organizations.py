@@ -6,67 +6,92 @@ Proxy models for augmenting our source data tables with methods useful for proce
 from __future__ import unicode_literals
 from django.db import models
 from opencivicdata.core.models import Organization
+from .caches import CommittedCache
 
 
 class OCDOrganizationManager(models.Manager):
     """
     Custom helpers for the OCD Organization model.
+
+    Each organization is fetched once and then kept until clear_cache is called,
+    which happens at the start of every command. One created in a transaction is
+    only kept once the transaction commits.
     """
+    _cache = None
+
+    def clear_cache(self):
+        """
+        Drop the organizations fetched so far.
+        """
+        self._cache = CommittedCache()
+
+    def get_or_create_cached(self, name, **kwargs):
+        """
+        Returns the organization with the name, getting or creating it with kwargs on first use.
+        """
+        if self._cache is None:
+            self.clear_cache()
+        if name in self._cache:
+            return self._cache[name]
+        organization, created = self.get_queryset().get_or_create(name=name, **kwargs)
+        self._cache.add(name, organization, created=created)
+        return organization
+
     def senate(self):
         """
         Returns state senate organization.
         """
-        return self.get_queryset().get_or_create(
-            name='California State Senate',
+        return self.get_or_create_cached(
+            'California State Senate',
             classification='upper',
-        )[0]
+        )
 
     def assembly(self):
         """
         Returns state assembly organization.
         """
-        return self.get_queryset().get_or_create(
-            name='California State Assembly',
+        return self.get_or_create_cached(
+            'California State Assembly',
             classification='lower',
-        )[0]
+        )
 
     def executive_branch(self):
         """
         Returns executive branch organization.
         """
-        return self.get_queryset().get_or_create(
-            name='California State Executive Branch',
+        return self.get_or_create_cached(
+            'California State Executive Branch',
             classification='executive',
-        )[0]
+        )
 
     def secretary_of_state(self):
         """
         Returns secretary of state organization.
         """
-        return self.get_queryset().get_or_create(
-            name='California Secretary of State',
+        return self.get_or_create_cached(
+            'California Secretary of State',
             classification='executive',
             parent=self.executive_branch(),
-        )[0]
+        )
 
     def elections_division(self):
         """
         Returns the elections division of the secretary of state organization.
         """
-        return self.get_queryset().get_or_create(
-            name='Elections Division',
+        return self.get_or_create_cached(
+            'Elections Division',
             classification='executive',
             parent=self.secretary_of_state(),
-        )[0]
+        )
 
     def board_of_equalization(self):
         """
         Returns board of equalization organization.
         """
-        return self.get_queryset().get_or_create(
-            name='State Board of Equalization',
+        return self.get_or_create_cached(
+            'State Board of Equalization',
             parent=self.executive_branch(),
-        )[0]
+        )
 
 
 class OCDOrganizationProxy(Organization):
@@ -4,76 +4,170 @@
 Proxy models for augmenting our source data tables with methods useful for processing.
 """
 from __future__ import unicode_literals
+from bisect import bisect_right
+from datetime import datetime
 from django.db import models
+from django.utils import six
+from django.utils.dateparse import parse_date
 from opencivicdata.core.models import Organization
 from calaccess_raw.models import FilerToFilerTypeCd
 
 
+# Party codes treated as "NO PARTY PREFERENCE"
+NO_PARTY_PREFERENCE_CODES = (16007, 16009)
+NO_PARTY_PREFERENCE_CODE = 16012
+
+
+def date_ordinal(value):
+    """
+    Return the proleptic Gregorian ordinal of a date, datetime or ISO date string.
+    """
+    if isinstance(value, six.string_types):
+        value = parse_date(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+class PartyResolver(object):
+    """
+    Looks up political parties by name and by filer id in memory.
+
+    Built from every party, with its other names and identifiers, and every
+    (filer_id, effect_dt, party_cd) row of the raw FilerToFilerTypeCd table.
+    Each filer's party codes are kept in effect_dt order, so the code in effect
+    on a date is found with a bisect.
+    """
+    def __init__(self, parties, filer_party_codes):
+        """
+        Index the provided parties and the (filer_id, effect_dt, party_cd) tuples.
+
+        The tuples must be sorted by filer_id then effect_dt.
+        """
+        self.by_name = {}
+        self.by_other_name = {}
+        self.by_identifier = {}
+        for party in parties:
+            self.by_name.setdefault(party.name, party)
+            for other_name in party.other_names.all():
+                self.by_other_name.setdefault(other_name.name, party)
+            for identifier in party.identifiers.all():
+                self.by_identifier.setdefault(identifier.identifier, party)
+
+        # Map each filer_id to a list of effect_dt ordinals and a list of the party codes
+        # that took effect on them, dropping rows that don't change the filer's party
+        self.filer_dates = {}
+        self.filer_codes = {}
+        for filer_id, effect_dt, party_cd in filer_party_codes:
+            dates = self.filer_dates.setdefault(filer_id, [])
+            codes = self.filer_codes.setdefault(filer_id, [])
+            ordinal = date_ordinal(effect_dt)
+            if dates and dates[-1] == ordinal:
+                codes[-1] = party_cd
+            elif not codes or codes[-1] != party_cd:
+                dates.append(ordinal)
+                codes.append(party_cd)
+
+    @property
+    def unknown(self):
+        """
+        Returns the UNKNOWN party, or None if it hasn't been loaded.
+        """
+        return self.by_name.get('UNKNOWN')
+
+    def get_by_name(self, name):
+        """
+        Returns the party with the name or alternate name, or the UNKNOWN party.
+        """
+        return self.by_name.get(name) or self.by_other_name.get(name) or self.unknown
+
+    def get_party_code(self, filer_id, election_date):
+        """
+        Returns the party code in effect for the filer_id on election_date, or None.
+        """
+        dates = self.filer_dates.get(filer_id)
+        if not dates:
+            return None
+        i = bisect_right(dates, date_ordinal(election_date))
+        if not i:
+            return None
+        party_code = self.filer_codes[filer_id][i - 1]
+        if party_code in NO_PARTY_PREFERENCE_CODES:
+            return NO_PARTY_PREFERENCE_CODE
+        return party_code
+
+    def get_by_filer_id(self, filer_id, election_date):
+        """
+        Returns the party in effect for the filer_id on election_date, or the UNKNOWN party.
+        """
+        party_code = self.get_party_code(filer_id, election_date)
+        if party_code is None:
+            return self.unknown
+        return self.by_identifier.get(six.text_type(party_code)) or self.unknown
+
+
 class OCDPartyManager(models.Manager):
     """
     Limited the OCD Organization model to politics parties.
     """
+    _resolver = None
+
     def get_queryset(self):
         """
         Override the default manager to limit the results to political parties.
         """
         return super(OCDPartyManager, self).get_queryset().filter(classification='party')
 
+    def get_resolver(self):
+        """
+        Returns a PartyResolver, loading it from the database on first use.
+
+        It's kept until clear_cache is called, which happens at the start of every command.
+        """
+        if self._resolver is None:
+            parties = self.get_queryset().prefetch_related('other_names', 'identifiers')
+            filer_party_codes = FilerToFilerTypeCd.objects.filter(
+                effect_dt__isnull=False,
+            ).order_by('filer_id', 'effect_dt').values_list(
+                'filer_id',
+                'effect_dt',
+                'party_cd',
+            )
+            self._resolver = PartyResolver(parties, filer_party_codes.iterator())
+        return self._resolver
+
+    def clear_cache(self):
+        """
+        Drop the PartyResolver, so the next lookup reloads the parties and filer party codes.
+        """
+        self._resolver = None
+
     def unknown(self):
         """
         Returns the UNKNOWN party.
         """
-        return self.get_queryset().get(name='UNKNOWN')
+        party = self.get_resolver().unknown
+        if not party:
+            raise self.model.DoesNotExist("UNKNOWN party not loaded.")
+        return party
 
     def get_by_name(self, name):
         """
         Helper for getting the OCD party object giving a raw name from CAL-ACCESS.
 
-        If not found, return the "UNKNOWN" Organization object.
+        Tries the full name, then the alternate names. If not found, return the "UNKNOWN" Organization object.
         """
-        # First try a full name
-        try:
-            return self.get_queryset().get(name=name)
-        except self.model.DoesNotExist:
-            pass
-
-        # If that doesn't work, try an alternate name
-        try:
-            return self.get_queryset().get(other_names__name=name)
-        except self.model.DoesNotExist:
-            pass
-
-        # And if that doesn't work, just return the unknown party object
-        return self.unknown()
+        return self.get_resolver().get_by_name(name) or self.unknown()
 
     def get_by_filer_id(self, filer_id, election_date):
         """
         Lookup the party for the given filer_id, effective before election_date.
 
+        "INDEPENDENT" and "NON-PARTISAN" codes are treated as "NO PARTY PREFERENCE".
+
         If not found, return the "UNKNOWN" Organization object.
         """
-        # Try to see if the record exists in the raw data with a party code
-        try:
-            party_code = FilerToFilerTypeCd.objects.filter(
-                filer_id=filer_id,
-                effect_dt__lte=election_date,
-            ).latest('effect_dt').party_cd
-        except FilerToFilerTypeCd.DoesNotExist:
-            # If it doesn't hit just quit now
-            return self.unknown()
-
-        # IF we have a code, transform "INDEPENDENT" and "NON-PARTISAN" codes to "NO PARTY PREFERENCE"
-        if party_code in [16007, 16009]:
-            party_code = 16012
-
-        # Try pulling out the party using the lookup code
-        try:
-            return self.get_queryset().get(identifiers__identifier=party_code)
-        except self.model.DoesNotExist:
-            pass
-
-        # If that fails, just quit and return the unknown party object
-        return self.unknown()
+        return self.get_resolver().get_by_filer_id(filer_id, election_date) or self.unknown()
 
 
 class OCDPartyProxy(Organization):
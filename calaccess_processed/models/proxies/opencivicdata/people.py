@@ -4,10 +4,11 @@
 Proxy models for augmenting our source data tables with methods useful for processing.
 """
 from __future__ import unicode_literals
-from django.db import models
-from django.db.models import Count
-from opencivicdata.merge import merge
+from django.db import connection, models, transaction
 from opencivicdata.core.models import Person
+from opencivicdata.elections.models import Candidacy, CandidacySource, CandidateContest
+from .locks import lock_all_for_create
+from .unitofwork import create_or_defer, has_new, save_or_defer, sync_pending
 
 
 class OCDPersonManager(models.Manager):
@@ -37,6 +38,13 @@ class OCDPersonManager(models.Manager):
         Returns a tuple (Person object, created), where created is a boolean
         specifying whether a Person was created.
         """
+        # Make sure no other worker of a parallel load is creating the same person,
+        # whether it's looked up by filer_id or by name
+        lock_keys = [('person', 'name', candidate_name_dict['name'])]
+        if candidate_filer_id:
+            lock_keys.append(('person', 'filer_id', candidate_filer_id))
+        lock_all_for_create(lock_keys)
+
         # If there is a filer_id, try to go that way
         if candidate_filer_id:
             try:
@@ -63,114 +71,365 @@ class OCDPersonManager(models.Manager):
         """
         Merge items in persons iterable into one Person object.
 
-        Return the merged Person object.
+        The first Person is kept. Return the merged Person object.
         """
-        # each person will be merged into this one
+        persons = list(persons)
         keep = persons.pop(0)
+        self.merge_groups([(keep, persons)])
+        keep.refresh_from_db()
+        return keep
+
+    def merge_groups(self, groups):
+        """
+        Merge many groups of Person objects at once.
+
+        groups is an iterable of (keep, discards) tuples, where keep is a Person (or
+        Person id) and discards is a list of the Persons (or ids) to merge into it.
+        Groups that share a person are merged together.
 
-        # loop over all the rest
-        for i in persons:
-            merge(keep, i)
-            keep.refresh_from_db()
-
-        # also delete the now duplicated PersonIdentifier objects
-        keep_filer_ids = keep.identifiers.filter(scheme='calaccess_filer_id')
-
-        dupe_filer_ids = keep_filer_ids.values("identifier").annotate(
-            row_count=Count('id'),
-        ).order_by().filter(row_count__gt=1)
-
-        for i in dupe_filer_ids.all():
-            # delete all rows with that filer_id
-            keep_filer_ids.filter(identifier=i['identifier']).delete()
-            # then re-add the one
-            keep.identifiers.create(
-                scheme='calaccess_filer_id',
-                identifier=i['identifier'],
+        Everything linked to a discarded Person is moved to the one kept, duplicate
+        identifiers, other names, links, sources and memberships are dropped and
+        candidacies for the same contest are combined, all in a few statements per
+        table. Like opencivicdata's merge, the kept Person gets the discarded ids as
+        identifiers, fills its blank fields from the discarded Persons and keeps the
+        earliest created_at.
+
+        Returns the count of Persons merged away.
+        """
+        discard_to_keep = self.resolve_merge_groups(groups)
+        if not discard_to_keep:
+            return 0
+
+        with transaction.atomic(), connection.cursor() as c:
+            c.execute(
+                "CREATE TEMP TABLE person_merge (discard_id varchar, keep_id varchar) ON COMMIT DROP;"
             )
+            c.executemany(
+                "INSERT INTO person_merge (discard_id, keep_id) VALUES (%s, %s);",
+                list(discard_to_keep.items()),
+            )
+            c.execute("ANALYZE person_merge;")
 
-        # and dedupe candidacy records
-        # first, make groups by contests with more than one candidacy
-        contest_group_q = keep.candidacies.values("contest").annotate(
-            row_count=Count('id')
-        ).filter(row_count__gt=1)
-
-        # loop over each contest group
-        for group in contest_group_q.all():
-            cands = keep.candidacies.filter(contest=group['contest'])
-            # preference to "qualified" candidacy (from scrape)
-            if cands.filter(registration_status='qualified').exists():
-                cand_to_keep = cands.filter(registration_status='qualified').all()[0]
-            # or the one with the most recent filed_date
-            else:
-                cand_to_keep = cands.latest('filed_date')
-
-            # loop over all the other candidacies in the group
-            for cand_to_discard in cands.exclude(id=cand_to_keep.id).all():
-                # assuming the only thing in extras is form501_filing_ids
-                if 'form501_filing_ids' in cand_to_discard.extras:
-                    for i in cand_to_discard.extras['form501_filing_ids']:
-                        self.link_form501_to_candidacy(i, cand_to_keep)
-                cand_to_keep.refresh_from_db()
-
-                if 'form501_filing_ids' in cand_to_keep.extras:
-                    self.update_candidacy_from_form501s(cand_to_keep)
-                cand_to_keep.refresh_from_db()
-
-                # keep the candidate_name, if not already somewhere else
-                if (
-                    cand_to_discard.candidate_name != cand_to_keep.candidate_name and
-                    cand_to_discard.candidate_name != cand_to_keep.person.name and
-                    not cand_to_keep.person.other_names.filter(
-                        name=cand_to_discard.candidate_name
-                    ).exists()
-                ):
-                    keep.other_names.create(
-                        name=cand_to_discard.candidate_name,
-                        note='From merge of %s candidacies' % cand_to_keep.contest
-                    )
-                    cand_to_keep.refresh_from_db()
-
-                # keep the candidacy sources
-                if cand_to_discard.sources.exists():
-                    for source in cand_to_discard.sources.all():
-                        if not cand_to_keep.sources.filter(url=source.url).exists():
-                            cand_to_keep.sources.create(
-                                url=source.url,
-                                note=source.note,
-                            )
-                        cand_to_keep.refresh_from_db()
-
-                # keep earliest filed_date
-                if cand_to_keep.filed_date and cand_to_discard.filed_date:
-                    if cand_to_keep.filed_date > cand_to_discard.filed_date:
-                        cand_to_keep.filed_date = cand_to_discard.filed_date
-                elif cand_to_discard.filed_date:
-                    cand_to_keep.filed_date = cand_to_discard.filed_date
-                # keep is_incumbent if True
-                if not cand_to_keep.is_incumbent and cand_to_discard.is_incumbent:
-                    cand_to_keep.is_incumbent = cand_to_discard.is_incumbent
-                # assuming not trying to merge candidacies with different parties
-                if not cand_to_keep.party and cand_to_discard.party:
-                    cand_to_keep.party = cand_to_discard.party
-
-                cand_to_keep.save()
-                cand_to_discard.delete()
+            # keep the discarded names
+            self.add_other_names(c, """
+                SELECT m.keep_id, d.name, 'From merge of persons'
+                FROM person_merge AS m
+                JOIN "{person}" AS d ON d.id = m.discard_id
+                JOIN "{person}" AS k ON k.id = m.keep_id
+                WHERE d.name != k.name
+            """)
 
-        keep.refresh_from_db()
+            # keep the discarded ids and fill in any blank fields
+            self.add_merged_identifiers(c)
+            self.update_merged_fields(c)
 
-        # make sure Person name is same as most recent candidate_name
-        latest_candidate_name = keep.candidacies.latest(
-            'contest__election__date',
-        ).candidate_name
-        if keep.name != latest_candidate_name:
-            # move current Person.name into other_names
-            if not keep.other_names.filter(name=keep.name).exists():
-                keep.other_names.create(name=keep.name)
-            keep.name = latest_candidate_name
-        keep.save()
+            # move everything linked to the discarded persons
+            self.repoint_related(c, Person, 'person_merge', 'discard_id', 'keep_id')
 
-        return keep
+            # combine candidacies for the same contest
+            self.merge_candidacies(c)
+
+            # drop the duplicates the move made
+            for model, fields in self.get_person_dedupe_fields():
+                self.delete_duplicates(c, model, fields)
+
+            c.execute('DELETE FROM "{person}" AS p USING person_merge AS m WHERE p.id = m.discard_id;'.format(
+                person=Person._meta.db_table,
+            ))
+
+            # make sure each Person name is same as most recent candidate_name
+            self.update_names(c, "SELECT DISTINCT keep_id FROM person_merge")
+
+            # drop now, in case this is part of a bigger transaction
+            c.execute("DROP TABLE person_merge, candidacy_merge;")
+
+        return len(discard_to_keep)
+
+    def resolve_merge_groups(self, groups):
+        """
+        Return a dict mapping the id of each Person to discard to the id of the Person it's merged into.
+        """
+        parents = {}
+
+        def find(person_id):
+            while parents.get(person_id, person_id) != person_id:
+                person_id = parents[person_id]
+            return person_id
+
+        for keep, discards in groups:
+            keep_id = getattr(keep, 'id', keep)
+            for discard in discards:
+                root, discard_root = find(keep_id), find(getattr(discard, 'id', discard))
+                if root != discard_root:
+                    parents[discard_root] = root
+
+        return dict((person_id, find(person_id)) for person_id in parents)
+
+    def get_person_dedupe_fields(self):
+        """
+        Return a list of (model, fields) tuples of the Person-linked rows that are duplicates if they share the fields.
+        """
+        from opencivicdata.core.models import Membership, PersonIdentifier, PersonLink, PersonName, PersonSource
+        return [
+            (PersonIdentifier, ('person_id', 'scheme', 'identifier')),
+            (PersonName, ('person_id', 'name', 'note')),
+            (PersonLink, ('person_id', 'url')),
+            (PersonSource, ('person_id', 'url')),
+            (Membership, ('person_id', 'organization_id', 'post_id', 'label', 'end_date')),
+        ]
+
+    def add_merged_identifiers(self, cursor):
+        """
+        Add the id of each discarded Person in person_merge as an identifier of the Person it's merged into.
+        """
+        from opencivicdata.core.models import PersonIdentifier
+        cursor.execute("SELECT discard_id, keep_id FROM person_merge;")
+        PersonIdentifier.objects.bulk_create([
+            PersonIdentifier(person_id=keep_id, scheme='', identifier=discard_id)
+            for discard_id, keep_id in sorted(cursor.fetchall())
+        ])
+
+    def update_merged_fields(self, cursor):
+        """
+        Fill the blank fields of each kept Person in person_merge from the Persons merged into it.
+
+        If more than one discarded Person has a value, the greatest is used. The earliest
+        created_at is kept too. The name is handled by update_names.
+        """
+        columns = [
+            f.column for f in Person._meta.concrete_fields
+            if isinstance(f, (models.CharField, models.TextField)) and f.name not in ('id', 'name')
+        ]
+        cursor.execute("""
+            UPDATE "{person}" AS k
+            SET {set_columns},
+                created_at = LEAST(k.created_at, d.created_at)
+            FROM (
+                SELECT m.keep_id, {max_columns}, MIN(p.created_at) AS created_at
+                FROM person_merge AS m
+                JOIN "{person}" AS p ON p.id = m.discard_id
+                GROUP BY m.keep_id
+            ) AS d
+            WHERE k.id = d.keep_id;
+        """.format(
+            person=Person._meta.db_table,
+            set_columns=', '.join('"{0}" = COALESCE(NULLIF(k."{0}", \'\'), d."{0}")'.format(c) for c in columns),
+            max_columns=', '.join('MAX(p."{0}") AS "{0}"'.format(c) for c in columns),
+        ))
+
+    def repoint_related(self, cursor, model, merge_table, from_column, to_column):
+        """
+        Point every foreign key to model at the rows in merge_table's from_column to the row in its to_column.
+        """
+        for rel in model._meta.related_objects:
+            if not rel.one_to_many:
+                continue
+            cursor.execute("""
+                UPDATE "{table}" AS t
+                SET "{column}" = m.{to_column}
+                FROM {merge_table} AS m
+                WHERE t."{column}" = m.{from_column};
+            """.format(
+                table=rel.related_model._meta.db_table,
+                column=rel.field.column,
+                merge_table=merge_table,
+                from_column=from_column,
+                to_column=to_column,
+            ))
+
+    def delete_duplicates(self, cursor, model, fields, scope_sql='SELECT keep_id FROM person_merge'):
+        """
+        Delete all but one of the model's rows that share the fields.
+
+        Only rows where the first field is in the ids returned by scope_sql are checked.
+        Anything linked to a deleted row, like a membership's links, is moved to the one kept.
+        """
+        tables = dict(
+            table=model._meta.db_table,
+            pk=model._meta.pk.column,
+        )
+        cursor.execute("""
+            CREATE TEMP TABLE duplicate_merge ON COMMIT DROP AS
+            SELECT id, keep_id
+            FROM (
+                SELECT
+                    "{pk}" AS id,
+                    FIRST_VALUE("{pk}") OVER (PARTITION BY {fields} ORDER BY "{pk}"::text) AS keep_id
+                FROM "{table}"
+                WHERE "{scope}" IN ({scope_sql})
+            ) AS grouped
+            WHERE id != keep_id;
+        """.format(
+            fields=', '.join('"%s"' % f for f in fields),
+            scope=fields[0],
+            scope_sql=scope_sql,
+            **tables
+        ))
+        self.repoint_related(cursor, model, 'duplicate_merge', 'id', 'keep_id')
+        cursor.execute('DELETE FROM "{table}" AS t USING duplicate_merge AS m WHERE t."{pk}" = m.id;'.format(**tables))
+        cursor.execute("DROP TABLE duplicate_merge;")
+
+    def add_other_names(self, cursor, select_sql):
+        """
+        Add the (person id, name, note) rows returned by select_sql as other names, if they aren't already.
+        """
+        from opencivicdata.core.models import PersonName
+        cursor.execute(select_sql.format(
+            person=Person._meta.db_table,
+            candidacy=Candidacy._meta.db_table,
+            contest=CandidateContest._meta.db_table,
+        ))
+        rows = set(cursor.fetchall())
+        if not rows:
+            return
+        existing = set(PersonName.objects.filter(
+            person_id__in=set(person_id for person_id, name, note in rows),
+        ).values_list('person_id', 'name'))
+        PersonName.objects.bulk_create([
+            PersonName(person_id=person_id, name=name, note=note)
+            for person_id, name, note in sorted(rows)
+            if (person_id, name) not in existing
+        ])
+
+    def merge_candidacies(self, cursor):
+        """
+        Combine each kept Person's candidacies for the same contest.
+
+        The "qualified" candidacy (from the scrape), or else the one with the most recent
+        filed_date, is kept. It gets the others' Form 501 filings, sources, party and
+        incumbency and the earliest filed_date, and their candidate names are kept as
+        other names of the Person.
+        """
+        from calaccess_processed.models import Form501Filing
+
+        tables = dict(
+            candidacy=Candidacy._meta.db_table,
+            form501=Form501Filing._meta.db_table,
+        )
+        cursor.execute("""
+            CREATE TEMP TABLE candidacy_merge ON COMMIT DROP AS
+            SELECT id, keep_id
+            FROM (
+                SELECT
+                    id,
+                    FIRST_VALUE(id) OVER (
+                        PARTITION BY person_id, contest_id
+                        ORDER BY registration_status = 'qualified' DESC, filed_date DESC NULLS FIRST, id
+                    ) AS keep_id,
+                    COUNT(*) OVER (PARTITION BY person_id, contest_id) AS candidacy_count
+                FROM "{candidacy}"
+                WHERE person_id IN (SELECT keep_id FROM person_merge)
+            ) AS grouped
+            WHERE candidacy_count > 1;
+        """.format(**tables))
+
+        # keep the candidate names, if not already somewhere else
+        self.add_other_names(cursor, """
+            SELECT p.id, d.candidate_name, 'From merge of ' || ct.name || ' candidacies'
+            FROM candidacy_merge AS m
+            JOIN "{candidacy}" AS d ON d.id = m.id
+            JOIN "{candidacy}" AS k ON k.id = m.keep_id
+            JOIN "{person}" AS p ON p.id = k.person_id
+            JOIN "{contest}" AS ct ON ct.id = k.contest_id
+            WHERE m.id != m.keep_id
+            AND d.candidate_name != k.candidate_name
+            AND d.candidate_name != p.name
+        """)
+
+        # combine the Form 501 filings
+        cursor.execute("""
+            UPDATE "{candidacy}" AS k
+            SET extras = jsonb_set(COALESCE(k.extras, '{{}}'::jsonb), '{{form501_filing_ids}}', f.filing_ids)
+            FROM (
+                SELECT m.keep_id, jsonb_agg(DISTINCT i.value ORDER BY i.value) AS filing_ids
+                FROM candidacy_merge AS m
+                JOIN "{candidacy}" AS c ON c.id = m.id
+                CROSS JOIN LATERAL jsonb_array_elements(c.extras->'form501_filing_ids') AS i
+                GROUP BY m.keep_id
+            ) AS f
+            WHERE k.id = f.keep_id;
+        """.format(**tables))
+
+        # keep the earliest filed_date, the party and is_incumbent if True
+        cursor.execute("""
+            UPDATE "{candidacy}" AS k
+            SET filed_date = a.filed_date,
+                is_incumbent = CASE WHEN a.is_incumbent THEN true ELSE k.is_incumbent END,
+                party_id = COALESCE(k.party_id, a.party_id)
+            FROM (
+                SELECT m.keep_id, MIN(c.filed_date) AS filed_date, BOOL_OR(c.is_incumbent) AS is_incumbent,
+                    MAX(c.party_id) AS party_id
+                FROM candidacy_merge AS m
+                JOIN "{candidacy}" AS c ON c.id = m.id
+                GROUP BY m.keep_id
+            ) AS a
+            WHERE k.id = a.keep_id;
+        """.format(**tables))
+
+        # then update them from their Form 501 filings
+        cursor.execute("""
+            UPDATE "{candidacy}" AS k
+            SET filed_date = f.filed_date,
+                registration_status = CASE
+                    WHEN f.latest_statement_type = '10003' THEN 'withdrawn'
+                    ELSE k.registration_status
+                END
+            FROM (
+                SELECT
+                    c.id,
+                    MIN(f.date_filed) AS filed_date,
+                    (ARRAY_AGG(f.statement_type ORDER BY f.date_filed DESC NULLS FIRST))[1] AS latest_statement_type
+                FROM "{candidacy}" AS c
+                CROSS JOIN LATERAL jsonb_array_elements_text(c.extras->'form501_filing_ids') AS i
+                JOIN "{form501}" AS f ON f.filing_id = i.value::int
+                WHERE c.id IN (SELECT keep_id FROM candidacy_merge)
+                GROUP BY c.id
+            ) AS f
+            WHERE k.id = f.id;
+        """.format(**tables))
+
+        # move the sources and anything else, then drop the others
+        cursor.execute("DELETE FROM candidacy_merge WHERE id = keep_id;")
+        self.repoint_related(cursor, Candidacy, 'candidacy_merge', 'id', 'keep_id')
+        self.delete_duplicates(cursor, CandidacySource, ('candidacy_id', 'url'), 'SELECT keep_id FROM candidacy_merge')
+        cursor.execute('DELETE FROM "{candidacy}" AS c USING candidacy_merge AS m WHERE c.id = m.id;'.format(**tables))
+
+    def update_names(self, cursor, person_ids_sql):
+        """
+        Set the name of each Person returned by person_ids_sql to the candidate_name of its latest candidacy.
+
+        The Person's current name is kept as an other name.
+        """
+        from opencivicdata.elections.models import Election
+        latest_sql = """
+            SELECT DISTINCT ON (c.person_id) c.person_id, c.candidate_name
+            FROM "{{candidacy}}" AS c
+            JOIN "{{contest}}" AS ct ON ct.id = c.contest_id
+            JOIN "{election}" AS e ON e.id = ct.election_id
+            WHERE c.person_id IN ({person_ids_sql})
+            ORDER BY c.person_id, e.date DESC
+        """.format(
+            election=Election._meta.db_table,
+            person_ids_sql=person_ids_sql,
+        )
+        # move current Person.name into other_names
+        self.add_other_names(cursor, """
+            SELECT p.id, p.name, ''
+            FROM ({latest}) AS l
+            JOIN "{{person}}" AS p ON p.id = l.person_id
+            WHERE p.name != l.candidate_name
+        """.format(latest=latest_sql))
+        cursor.execute("""
+            UPDATE "{{person}}" AS p
+            SET name = l.candidate_name
+            FROM ({latest}) AS l
+            WHERE p.id = l.person_id
+            AND p.name != l.candidate_name;
+        """.format(latest=latest_sql).format(
+            person=Person._meta.db_table,
+            candidacy=Candidacy._meta.db_table,
+            contest=CandidateContest._meta.db_table,
+        ))
 
 
 class OCDPersonProxy(Person):
@@ -189,17 +448,22 @@ class OCDPersonProxy(Person):
         """
         Update name field to the latest candidate record.
         """
+        from opencivicdata.core.models import PersonName
+        sync_pending(self)
         # Get the latest candidate name
         latest_candidate_name = self.candidacies.latest('contest__election__date').candidate_name
         # If the latest candidate name doesn't match the current name
         if self.name != latest_candidate_name:
             # Move the current name into other_names
-            if not self.other_names.filter(name=self.name).exists():
-                self.other_names.create(name=self.name)
+            if not (
+                has_new(PersonName, person_id=self.id, name=self.name) or
+                self.other_names.filter(name=self.name).exists()
+            ):
+                create_or_defer(PersonName(person=self, name=self.name))
             # Reset the main one
             self.name = latest_candidate_name
             # Save out.
-            self.save()
+            save_or_defer(self, ['name'])
 
     def add_other_name(self, name, note):
         """
@@ -6,6 +6,8 @@ Proxy models for augmenting our source data tables with methods useful for proce
 from __future__ import unicode_literals
 import re
 from django.db import models
+from .locks import lock_for_create
+from .caches import CommittedCache
 from .divisions import OCDDivisionProxy
 from opencivicdata.core.models import Post
 from .organizations import OCDOrganizationProxy
@@ -15,7 +17,19 @@ from ..calaccess_raw.filertofilertype import RawFilerToFilerTypeCdProxy
 class OCDPostManager(models.Manager):
     """
     Custom helpers for the OCD Post model.
+
+    Posts found by office name are kept until clear_cache is called, which happens
+    at the start of every command. One created in a transaction is only kept once
+    the transaction commits.
     """
+    _cache = None
+
+    def clear_cache(self):
+        """
+        Drop the posts found so far.
+        """
+        self._cache = CommittedCache()
+
     def parse_office_name(self, office_name):
         """
         Parse string containg the name for an office.
@@ -42,17 +56,24 @@ class OCDPostManager(models.Manager):
         """
         Get a Post object with an office string.
         """
+        if self._cache is None:
+            self.clear_cache()
+        key = office_name.upper()
+        if key in self._cache:
+            post = self._cache[key]
+            return (post, False) if method == "get_or_create" else post
+
         parsed_office = self.parse_office_name(office_name)
 
         # prepare to get or create post
         label = office_name.title().replace('Of', 'of')
 
         if parsed_office['type'] == 'STATE SENATE':
-            division = OCDDivisionProxy.senate.get(subid2=parsed_office['district'])
+            division = OCDDivisionProxy.senate.get_by_district(parsed_office['district'])
             organization = OCDOrganizationProxy.objects.senate()
             role = 'Senator'
         elif parsed_office['type'] == 'ASSEMBLY':
-            division = OCDDivisionProxy.assembly.get(subid2=parsed_office['district'])
+            division = OCDDivisionProxy.assembly.get_by_district(parsed_office['district'])
             organization = OCDOrganizationProxy.objects.assembly()
             role = 'Assembly Member'
         else:
@@ -68,16 +89,25 @@ class OCDPostManager(models.Manager):
                 organization = OCDOrganizationProxy.objects.executive_branch()
                 role = label
 
+        # Make sure no other worker of a parallel load is creating the same post
+        if method == "get_or_create":
+            lock_for_create('post', key)
+
         # Grab the method passed in. You can see why we did this in the method just below this one.
         func = getattr(self.get_queryset(), method)
 
-        # Run it pass back the result.
-        return func(
+        # Run it, keep the post and pass back the result.
+        result = func(
             label=label,
             role=role,
             division=division,
             organization=organization
         )
+        if method == "get_or_create":
+            self._cache.add(key, result[0], created=result[1])
+        else:
+            self._cache.add(key, result)
+        return result
 
     def get_or_create_by_name(self, office_name):
         """
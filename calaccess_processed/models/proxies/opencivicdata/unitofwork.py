@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A unit of work that holds changes to OCD objects until they can be saved together.
+"""
+from __future__ import unicode_literals
+from collections import OrderedDict
+from django.db import transaction
+
+
+class OCDUnitOfWork(object):
+    """
+    Collects changed fields and new related rows of OCD objects and saves them together.
+
+    While one is open, the OCD proxy helpers record their changes here instead of
+    saving them one at a time. The changes are saved when the block exits without an
+    error, or when flush is called. New rows of each model are inserted in one
+    statement, and each changed object is saved once with all of its changed fields.
+
+        with OCDUnitOfWork():
+            candidacy.link_form501(form501)
+            candidacy.update_from_form501(form501)
+    """
+    # The open units of work, the innermost last
+    _stack = []
+
+    def __init__(self):
+        """
+        Start with nothing to save.
+        """
+        # (model, pk) -> (instance, set of changed field names)
+        self.dirty = OrderedDict()
+        # model -> list of new instances, in the order they were added
+        self.new = OrderedDict()
+
+    def __enter__(self):
+        """
+        Make this the current unit of work.
+        """
+        self._stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Save the collected changes, unless the block raised an error.
+        """
+        self._stack.remove(self)
+        if exc_type is None:
+            self.flush()
+        return False
+
+    @classmethod
+    def current(cls):
+        """
+        Returns the innermost open unit of work, or None.
+        """
+        return cls._stack[-1] if cls._stack else None
+
+    def get_key(self, obj):
+        """
+        Returns the key of the database row of an object.
+        """
+        return (obj._meta.concrete_model, obj.pk)
+
+    def save(self, obj, fields):
+        """
+        Record that fields of obj have changed.
+
+        If another instance of the same row has changes, the values are copied onto it,
+        so the last change to each field is the one saved.
+        """
+        instance, changed = self.dirty.setdefault(self.get_key(obj), (obj, set()))
+        if instance is not obj:
+            for field in fields:
+                setattr(instance, field, getattr(obj, field))
+        changed.update(fields)
+
+    def sync(self, obj):
+        """
+        Copy the unsaved changes to the same row onto obj, so it doesn't read stale values.
+        """
+        instance, changed = self.dirty.get(self.get_key(obj), (obj, ()))
+        if instance is not obj:
+            for field in changed:
+                setattr(obj, field, getattr(instance, field))
+
+    def add(self, obj):
+        """
+        Record a new object to insert.
+        """
+        self.new.setdefault(obj._meta.concrete_model, []).append(obj)
+
+    def has_new(self, model, **fields):
+        """
+        Returns whether a new object of model with the provided field values is waiting to be inserted.
+        """
+        return any(
+            all(getattr(obj, k) == v for k, v in fields.items())
+            for obj in self.new.get(model._meta.concrete_model, [])
+        )
+
+    def flush(self):
+        """
+        Insert the new objects and save the changed ones in one transaction.
+        """
+        if not any(self.new.values()) and not self.dirty:
+            return
+        with transaction.atomic():
+            for model, obj_list in self.new.items():
+                model._base_manager.bulk_create(obj_list)
+            for instance, changed in self.dirty.values():
+                instance.save(update_fields=sorted(changed))
+        self.new.clear()
+        self.dirty.clear()
+
+
+def save_or_defer(obj, fields):
+    """
+    Save obj, or record the changed fields if a unit of work is open.
+    """
+    uow = OCDUnitOfWork.current()
+    if uow:
+        uow.save(obj, fields)
+    else:
+        obj.save()
+
+
+def create_or_defer(obj):
+    """
+    Insert a new obj, or hold it until the open unit of work is flushed.
+    """
+    uow = OCDUnitOfWork.current()
+    if uow:
+        uow.add(obj)
+    else:
+        obj.save()
+
+
+def has_new(model, **fields):
+    """
+    Returns whether the open unit of work is holding a new object of model with the field values.
+    """
+    uow = OCDUnitOfWork.current()
+    return bool(uow) and uow.has_new(model, **fields)
+
+
+def sync_pending(obj):
+    """
+    Copy any unsaved changes held by the open unit of work onto obj.
+    """
+    uow = OCDUnitOfWork.current()
+    if uow:
+        uow.sync(obj)
@@ -5,6 +5,7 @@ Models for tracking processing of CAL-ACCESS snapshots over time.
 """
 from __future__ import unicode_literals
 from django.db import models
+from django.contrib.postgres.fields import JSONField
 from hurry.filesize import size as sizeformat
 from django.utils.encoding import python_2_unicode_compatible
 from calaccess_processed import archive_directory_path
@@ -45,6 +46,14 @@ class ProcessedDataVersion(models.Model):
         verbose_name='zip of size (in bytes)',
         help_text='The expected size (in bytes) of the zip of processed files'
     )
+    manifest = models.FileField(
+        blank=True,
+        max_length=255,
+        upload_to=archive_directory_path,
+        verbose_name='manifest of processed files',
+        help_text='A JSON file listing the archive path, size and SHA-256 hash '
+                  'of each processed file'
+    )
 
     class Meta:
         """
@@ -143,6 +152,68 @@ class ProcessedDataFile(models.Model):
         verbose_name='size of processed data file (in bytes)',
         help_text='Size of the processed file (in bytes)'
     )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        verbose_name='SHA-256 hash',
+        help_text='SHA-256 hash of the processed file\'s .CSV contents. Files with the '
+                  'same hash in different versions share one archive.',
+    )
+    insert_duration = models.DurationField(
+        null=True,
+        verbose_name='insert duration',
+        help_text='Time spent inserting the records of the file',
+    )
+    rebuild_duration = models.DurationField(
+        null=True,
+        verbose_name='constraint and index rebuild duration',
+        help_text='Time spent re-creating constraints and indexes after loading the file',
+    )
+    count_duration = models.DurationField(
+        null=True,
+        verbose_name='count duration',
+        help_text='Time spent counting the records of the file, if they were not '
+                  'counted as they were inserted',
+    )
+    archive_duration = models.DurationField(
+        null=True,
+        verbose_name='archive duration',
+        help_text='Time spent archiving the file',
+    )
+    rows_per_second = models.FloatField(
+        null=True,
+        verbose_name='rows inserted per second',
+        help_text='Count of records inserted divided by the insert duration',
+    )
+    table_size = models.BigIntegerField(
+        null=True,
+        verbose_name='size of table on disk (in bytes)',
+        help_text='Size on disk of the database table of the file, not including indexes (in bytes)',
+    )
+    index_size = models.BigIntegerField(
+        null=True,
+        verbose_name='size of indexes on disk (in bytes)',
+        help_text='Size on disk of the indexes on the database table of the file (in bytes)',
+    )
+    temp_bytes = models.BigIntegerField(
+        null=True,
+        verbose_name='temporary file bytes',
+        help_text='Bytes written to temporary files by the database while inserting '
+                  'the records of the file',
+    )
+    query_plan = JSONField(
+        null=True,
+        verbose_name='load query plan',
+        help_text='EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) output of the query that '
+                  'loaded the file, if it was profiled',
+    )
+    query_plan_warnings = JSONField(
+        default=list,
+        verbose_name='load query plan warnings',
+        help_text='Sequential scans, spills to disk and row misestimates found in the '
+                  'load query plan',
+    )
 
     class Meta:
         """
@@ -163,3 +234,72 @@ class ProcessedDataFile(models.Model):
         return sizeformat(self.file_size)
     pretty_file_size.short_description = 'processed file size'
     pretty_file_size.admin_order_field = 'processed file size'
+
+    def pretty_table_size(self):
+        """
+        Returns a prettified version (e.g., "725M") of the database table's size on disk.
+        """
+        if self.table_size is None:
+            return None
+        return sizeformat(self.table_size)
+    pretty_table_size.short_description = 'table size'
+    pretty_table_size.admin_order_field = 'table_size'
+
+    def pretty_index_size(self):
+        """
+        Returns a prettified version (e.g., "725M") of the database table's index size on disk.
+        """
+        if self.index_size is None:
+            return None
+        return sizeformat(self.index_size)
+    pretty_index_size.short_description = 'index size'
+    pretty_index_size.admin_order_field = 'index_size'
+
+
+@python_2_unicode_compatible
+class ProcessedDataChunk(models.Model):
+    """
+    A range of filings loaded into a processed data file in its own transaction.
+    """
+    processed_file = models.ForeignKey(
+        'ProcessedDataFile',
+        on_delete=models.CASCADE,
+        related_name='chunks',
+        verbose_name='processed data file',
+        help_text='Foreign key referencing the processed data file the chunk is loaded into'
+    )
+    min_key = models.IntegerField(
+        verbose_name='minimum key',
+        help_text='Lowest filing_id or filing_version_id value included in the chunk',
+    )
+    max_key = models.IntegerField(
+        verbose_name='maximum key',
+        help_text='Highest filing_id or filing_version_id value included in the chunk',
+    )
+    process_start_datetime = models.DateTimeField(
+        null=True,
+        verbose_name='date and time processing started',
+        help_text='Date and time when the processing of the chunk started',
+    )
+    process_finish_datetime = models.DateTimeField(
+        null=True,
+        verbose_name='date and time processing finished',
+        help_text='Date and time when the processing of the chunk finished',
+    )
+    records_count = models.IntegerField(
+        null=False,
+        default=0,
+        verbose_name='clean records count',
+        help_text='Count of records loaded from the chunk'
+    )
+
+    class Meta:
+        """
+        Meta model options.
+        """
+        app_label = 'calaccess_processed'
+        verbose_name = 'TRACKING: processed CAL-ACCESS data file chunk'
+        ordering = ('processed_file', 'min_key',)
+
+    def __str__(self):
+        return '{0} ({1}-{2})'.format(self.processed_file, self.min_key, self.max_key)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for reviewing the query plans of processed data load queries.
+"""
+from __future__ import unicode_literals
+
+# How many times off the planner's row estimate has to be before it's flagged
+MISESTIMATE_RATIO = 10
+
+# How the node supplying the rows of an insert is related to it
+SOURCE_RELATIONSHIPS = ('Outer', 'Member')
+
+
+def iter_plan_nodes(node):
+    """
+    Yield the node of an EXPLAIN (FORMAT JSON) plan and all of the nodes below it.
+    """
+    yield node
+    for child in node.get('Plans', []):
+        for descendant in iter_plan_nodes(child):
+            yield descendant
+
+
+def get_inserted_rows(plan):
+    """
+    Return the count of rows inserted by an INSERT ... SELECT statement from its EXPLAIN ANALYZE plan.
+
+    The rows come from the insert's outer child. Any others are the InitPlans or
+    SubPlans of CTEs and subqueries, which can come first.
+    """
+    source = next(
+        child for child in plan['Plan']['Plans']
+        if child.get('Parent Relationship') in SOURCE_RELATIONSHIPS
+    )
+    return source['Actual Rows'] * source['Actual Loops']
+
+
+def get_plan_warnings(plan):
+    """
+    Return a list of warnings about slow operations in an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan.
+
+    Flags sequential scans, sorts and hashes that spill to disk and row estimates off
+    by more than MISESTIMATE_RATIO times.
+    """
+    warnings = []
+    for node in iter_plan_nodes(plan['Plan']):
+        node_type = node['Node Type']
+        actual_rows = node.get('Actual Rows', 0) * node.get('Actual Loops', 1)
+
+        if node_type == 'Seq Scan':
+            warnings.append('Seq Scan on {0} read {1} rows'.format(
+                node['Relation Name'],
+                actual_rows + node.get('Rows Removed by Filter', 0),
+            ))
+
+        if node.get('Sort Space Type') == 'Disk':
+            warnings.append('{0} spilled {1}kB to disk'.format(
+                node_type,
+                node.get('Sort Space Used', 0),
+            ))
+        elif node.get('Hash Batches', 1) > 1:
+            warnings.append('{0} spilled to disk in {1} batches'.format(
+                node_type,
+                node['Hash Batches'],
+            ))
+        else:
+            # buffer counts include the node's children, so only count its own
+            temp_blocks = node.get('Temp Written Blocks', 0) - sum(
+                child.get('Temp Written Blocks', 0) for child in node.get('Plans', [])
+            )
+            if temp_blocks > 0:
+                warnings.append('{0} wrote {1} temporary blocks'.format(
+                    node_type,
+                    temp_blocks,
+                ))
+
+        # an INSERT without RETURNING never returns rows, whatever the estimate
+        if 'Actual Rows' in node and node_type != 'ModifyTable':
+            estimated_rows = node['Plan Rows'] * node.get('Actual Loops', 1)
+            ratio = float(max(actual_rows, 1)) / max(estimated_rows, 1)
+            if ratio > MISESTIMATE_RATIO or ratio < 1.0 / MISESTIMATE_RATIO:
+                warnings.append('{0} estimated {1} rows but returned {2}'.format(
+                    node_type,
+                    estimated_rows,
+                    actual_rows,
+                ))
+    return warnings
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for building processed data tables in a staging schema and swapping them in.
+"""
+from __future__ import unicode_literals
+from contextlib import contextmanager
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+
+# The schema where the live processed data tables are read from
+LIVE_SCHEMA = 'public'
+
+# The schema where processed data tables are built before they go live
+STAGING_SCHEMA = 'calaccess_processed_staging'
+
+# The schema where the replaced processed data tables are kept for rollbacks
+PREVIOUS_SCHEMA = 'calaccess_processed_previous'
+
+
+def schema_exists(schema):
+    """
+    Return True if the schema exists in the database.
+    """
+    with connection.cursor() as c:
+        c.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s)',
+            [schema],
+        )
+        return c.fetchone()[0]
+
+
+def tables_exist(schema, tables):
+    """
+    Return True if every one of the tables exists in the schema.
+    """
+    with connection.cursor() as c:
+        c.execute(
+            'SELECT COUNT(*) FROM pg_tables WHERE schemaname = %s AND tablename = ANY(%s)',
+            [schema, list(tables)],
+        )
+        return c.fetchone()[0] == len(set(tables))
+
+
+def create_schema(schema):
+    """
+    Create an empty schema, dropping any existing schema with the same name.
+    """
+    with connection.cursor() as c:
+        c.execute('DROP SCHEMA IF EXISTS "%s" CASCADE' % schema)
+        c.execute('CREATE SCHEMA "%s"' % schema)
+
+
+@contextmanager
+def search_path(schema):
+    """
+    Resolve unqualified table names in the schema first, then in the live schema.
+
+    Applies to the current database connection and to any connection opened
+    before the block exits, including those opened by worker processes.
+    """
+    def set_search_path(sender, connection, **kwargs):
+        with connection.cursor() as c:
+            c.execute('SET search_path TO "%s", "%s"' % (schema, LIVE_SCHEMA))
+
+    dispatch_uid = 'calaccess_processed_search_path'
+    connection_created.connect(set_search_path, weak=False, dispatch_uid=dispatch_uid)
+    if connection.connection is not None:
+        set_search_path(None, connection)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(dispatch_uid=dispatch_uid)
+        if connection.connection is not None:
+            with connection.cursor() as c:
+                c.execute('RESET search_path')
+
+
+def swap_schema(tables, incoming, outgoing):
+    """
+    Replace the live tables with those in the incoming schema in a single transaction.
+
+    The replaced tables are moved into the outgoing schema, which is emptied first.
+    The incoming schema is dropped once it's empty.
+    """
+    with transaction.atomic():
+        with connection.cursor() as c:
+            c.execute('DROP SCHEMA IF EXISTS "%s" CASCADE' % outgoing)
+            c.execute('CREATE SCHEMA "%s"' % outgoing)
+            for table in tables:
+                c.execute(
+                    'ALTER TABLE "%s"."%s" SET SCHEMA "%s"' % (LIVE_SCHEMA, table, outgoing)
+                )
+                c.execute(
+                    'ALTER TABLE "%s"."%s" SET SCHEMA "%s"' % (incoming, table, LIVE_SCHEMA)
+                )
+            c.execute('DROP SCHEMA "%s"' % incoming)
+
+
+def publish_staging_schema(tables):
+    """
+    Swap the tables built in the staging schema into the live schema.
+
+    The replaced tables are kept in the previous schema.
+    """
+    swap_schema(tables, STAGING_SCHEMA, PREVIOUS_SCHEMA)
+
+
+def rollback_to_previous_schema(tables):
+    """
+    Swap the tables in the previous schema back into the live schema.
+
+    The replaced tables become the previous schema, so a rollback can be undone.
+    """
+    with transaction.atomic():
+        swap_schema(tables, PREVIOUS_SCHEMA, STAGING_SCHEMA)
+        with connection.cursor() as c:
+            c.execute('ALTER SCHEMA "%s" RENAME TO "%s"' % (STAGING_SCHEMA, PREVIOUS_SCHEMA))
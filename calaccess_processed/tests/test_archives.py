@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unittests for streaming processed data into archives.
+"""
+import io
+import gzip
+import zipfile
+from unittest import TestCase
+from calaccess_processed import archives
+
+
+class ParallelCompressionTest(TestCase):
+    """
+    Tests for compressing archives on a pool of threads.
+    """
+    # Enough data to be split into several blocks
+    data = b''.join(
+        b'%d,FILER %d,100.00\n' % (i, i % 97) for i in range(300000)
+    )
+
+    def test_gzip(self):
+        """
+        Confirm blocks compressed in parallel join into one valid gzip file.
+        """
+        out = io.BytesIO()
+        with archives.GzipCompressor(out, workers=4) as gz:
+            gz.write(self.data)
+        self.assertGreater(len(self.data), archives.BLOCK_SIZE * 2)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(out.getvalue())).read(), self.data)
+
+    def test_zip(self):
+        """
+        Confirm a streamed zip can be read back, including an empty member.
+        """
+        out = io.BytesIO()
+        zf = archives.StreamingZipFile(out, workers=4)
+        zf.write_member('data.csv', io.BytesIO(self.data))
+        zf.write_member('empty.csv', io.BytesIO(b''))
+        zf.close()
+
+        zf = zipfile.ZipFile(io.BytesIO(out.getvalue()))
+        self.assertIsNone(zf.testzip())
+        self.assertEqual(zf.read('data.csv'), self.data)
+        self.assertEqual(zf.read('empty.csv'), b'')
+
+    def test_zip_members_written_as_streamed(self):
+        """
+        Confirm members can be written to as their contents stream in, and teed to another file.
+        """
+        copies = {}
+
+        def get_write(name, data):
+            """
+            Return a function that writes the data in pieces to a member and a copy of it.
+            """
+            def write(member):
+                """
+                Write the data to the member and its copy, 100,000 bytes at a time.
+                """
+                copies[name] = io.BytesIO()
+                tee = archives.TeeWriter(member, copies[name])
+                for i in range(0, len(data), 100000):
+                    tee.write(data[i:i + 100000])
+            return write
+
+        out = io.BytesIO()
+        archives.write_zip(out, [
+            ('data.csv', get_write('data.csv', self.data)),
+            ('small.csv', get_write('small.csv', b'1,2,3\n')),
+        ], workers=4)
+
+        zf = zipfile.ZipFile(io.BytesIO(out.getvalue()))
+        self.assertIsNone(zf.testzip())
+        self.assertEqual(zf.read('data.csv'), self.data)
+        self.assertEqual(zf.read('small.csv'), b'1,2,3\n')
+        self.assertEqual(copies['data.csv'].getvalue(), self.data)
+
+
+class SaveStreamTest(TestCase):
+    """
+    Tests for streaming data into a storage backend.
+    """
+    def get_field_file(self, saved):
+        """
+        Return a stand-in for a FieldFile whose storage backend rewinds the file, then reads it.
+        """
+        class FieldFile(object):
+            """
+            Stands in for a FieldFile with a storage backend like S3.
+            """
+            def save(self, name, content, save=True):
+                """
+                Rewind the content, then read it in chunks, as long as it isn't seekable.
+                """
+                if content.seekable():
+                    raise AssertionError("The storage backend would try to seek past the stream.")
+                content.seek(0)
+                saved[name] = b''.join(iter(lambda: content.read(4), b''))
+
+        return FieldFile()
+
+    def test_streamed(self):
+        """
+        Confirm the storage backend reads everything written, in one pass.
+        """
+        saved = {}
+        size = archives.save_stream(
+            self.get_field_file(saved),
+            'data.csv',
+            lambda f: f.write(b'1,2,3\n4,5,6\n'),
+        )
+        self.assertEqual(size, 12)
+        self.assertEqual(saved, {'data.csv': b'1,2,3\n4,5,6\n'})
+
+    def test_aborted(self):
+        """
+        Confirm a failed write aborts the upload instead of saving part of it.
+        """
+        saved = {}
+
+        def write(f):
+            """
+            Write a line, then fail.
+            """
+            f.write(b'1,2,3\n')
+            raise ValueError("COPY failed")
+
+        with self.assertRaises(ValueError):
+            archives.save_stream(self.get_field_file(saved), 'data.csv', write)
+        self.assertEqual(saved, {})
+
+    def test_failed_save(self):
+        """
+        Confirm the storage backend's error is raised if it fails partway through.
+        """
+        class FieldFile(object):
+            """
+            Stands in for a FieldFile whose storage backend fails.
+            """
+            def save(self, name, content, save=True):
+                """
+                Read a little, then fail.
+                """
+                content.read(4)
+                raise RuntimeError("Upload failed")
+
+        with self.assertRaises(RuntimeError):
+            archives.save_stream(FieldFile(), 'data.csv', lambda f: f.write(b'1,2,3\n' * 100000))
@@ -5,29 +5,170 @@ Unittests for management commands.
 """
 import os
 import shutil
+from collections import Counter
 import calaccess_processed
 from django.conf import settings
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.db.models import Count
 from django.utils.timezone import now
-from datetime import date
+from datetime import date, timedelta
 from django.test import TestCase, override_settings
 from calaccess_raw.models import RawDataVersion
 from calaccess_processed.management.commands import CalAccessCommand
 from calaccess_processed import corrections
-from calaccess_processed.models import ProcessedDataVersion, ScrapedCandidateProxy
+from calaccess_processed.models import (
+    ProcessedDataVersion,
+    ProcessedDataFile,
+    ScrapedCandidateProxy,
+    Form460Filing,
+    Form460FilingVersion,
+    Form460ScheduleAItem,
+    Form460ScheduleAItemVersion,
+    Form501FilingVersion,
+)
+from calaccess_processed.management.commands.loadcalaccessfilings import (
+    Command as LoadFilingsCommand,
+)
+from calaccess_processed.management.commands.calaccessloadreport import (
+    Command as LoadReportCommand,
+)
+from calaccess_processed.management.commands.mergeocdpersonsbycontestandname import (
+    Command as MergeByContestAndNameCommand,
+    PersonClusters,
+)
 from calaccess_scraped.models import Candidate as ScrapedCandidate
 from calaccess_scraped.models import Proposition as ScrapedProposition
-from opencivicdata.core.models import Person
+from opencivicdata.core.models import Person, PersonIdentifier, PersonName
 from opencivicdata.elections.models import (
     BallotMeasureContest,
     Candidacy,
+    CandidacySource,
     CandidateContest,
+    CandidateContestSource,
     RetentionContest,
 )
 
 
+class LoadFilingsGraphTest(TestCase):
+    """
+    Tests for the dependency graph used to load filing models in parallel.
+    """
+    def test_model_graph(self):
+        """
+        Confirm models depend only on the tables their load queries read.
+        """
+        graph = LoadFilingsCommand().get_model_graph([
+            Form460Filing,
+            Form460FilingVersion,
+            Form460ScheduleAItem,
+            Form460ScheduleAItemVersion,
+            Form501FilingVersion,
+        ])
+        self.assertEqual(graph[Form460FilingVersion], set())
+        self.assertEqual(graph[Form501FilingVersion], set())
+        self.assertEqual(graph[Form460Filing], set([Form460FilingVersion]))
+        self.assertEqual(
+            graph[Form460ScheduleAItemVersion],
+            set([Form460FilingVersion]),
+        )
+        self.assertEqual(
+            graph[Form460ScheduleAItem],
+            set([Form460Filing, Form460FilingVersion, Form460ScheduleAItemVersion]),
+        )
+
+
+class MergePersonsByContestAndNameTest(TestCase):
+    """
+    Tests for clustering persons that share a name in a contest.
+    """
+    def get_clusters(self, groups, person_filer_ids):
+        """
+        Return the clusters of persons made from the groups of (candidacy id, person id, party id) tuples.
+        """
+        command = MergeByContestAndNameCommand()
+        command.verbosity = 0
+        command.person_filer_ids = person_filer_ids
+        clusters = PersonClusters(person_filer_ids)
+        for group in groups:
+            command.handle_group(group, clusters)
+        return clusters.clusters()
+
+    def test_person_clusters(self):
+        """
+        Confirm clusters are joined unless they'd combine different filer_ids.
+        """
+        clusters = PersonClusters({1: set(['100']), 2: set(), 3: set(['200']), 4: set()})
+        self.assertTrue(clusters.union(2, 1))
+        self.assertTrue(clusters.union(4, 2))
+        self.assertFalse(clusters.union(3, 4))
+        self.assertTrue(clusters.union(1, 4))
+        self.assertEqual(clusters.find(4), 1)
+        self.assertEqual(clusters.clusters(), [[1, 2, 4]])
+
+    def test_one_party(self):
+        """
+        Confirm everyone in a group with one party and one filer_id is merged.
+        """
+        self.assertEqual(
+            self.get_clusters(
+                [[(10, 1, 'DEM'), (11, 2, None), (12, 3, 'DEM')]],
+                {1: set(['100']), 2: set(), 3: set(['100'])},
+            ),
+            [[1, 2, 3]],
+        )
+
+    def test_multiple_filer_ids(self):
+        """
+        Confirm a group with more than one filer_id is merged by party.
+        """
+        self.assertEqual(
+            self.get_clusters(
+                [[(10, 1, None), (11, 2, 'DEM'), (12, 3, 'DEM'), (13, 4, None)]],
+                {1: set(['100']), 2: set(['200']), 3: set(), 4: set()},
+            ),
+            [[1, 4], [2, 3]],
+        )
+
+    def test_multiple_parties(self):
+        """
+        Confirm a group with more than one party is merged by party.
+        """
+        self.assertEqual(
+            self.get_clusters(
+                [[(10, 1, 'DEM'), (11, 2, 'REP'), (12, 3, 'DEM'), (13, 4, 'REP')]],
+                {1: set(), 2: set(), 3: set(), 4: set()},
+            ),
+            [[1, 3], [2, 4]],
+        )
+
+
+class LoadReportTest(TestCase):
+    """
+    Tests for the comparison of load stats across processed versions.
+    """
+    def test_regressions(self):
+        """
+        Confirm only stats that grew past the threshold are flagged.
+        """
+        command = LoadReportCommand()
+        command.threshold = 25
+        previous = ProcessedDataFile(
+            insert_duration=timedelta(seconds=10),
+            rebuild_duration=timedelta(seconds=10),
+            table_size=1000,
+        )
+        current = ProcessedDataFile(
+            insert_duration=timedelta(seconds=20),
+            rebuild_duration=timedelta(seconds=11),
+            table_size=1000,
+        )
+        self.assertEqual(
+            command.get_regressions(previous, current),
+            [('insert_duration', 100.0)],
+        )
+
+
 class NoProcessedDataTest(TestCase):
     """
     Tests to run with no data loaded.
@@ -247,6 +388,81 @@ class ProcessedDataTest(TestCase):
                 )
             )
 
+    def get_candidate_contest_rows(self):
+        """
+        Return Counters of the loaded candidate contests, candidacies and people, without their ids.
+        """
+        return dict(
+            contests=Counter(CandidateContest.objects.values_list(
+                'election__name',
+                'name',
+                'division_id',
+                'party__name',
+                'previous_term_unexpired',
+                'posts__post__label',
+                'runoff_for_contest__name',
+            )),
+            contest_sources=Counter(CandidateContestSource.objects.values_list(
+                'contest__election__name',
+                'contest__name',
+                'url',
+                'note',
+            )),
+            candidacies=Counter(Candidacy.objects.values_list(
+                'contest__election__name',
+                'contest__name',
+                'post__label',
+                'candidate_name',
+                'person__name',
+                'party__name',
+                'registration_status',
+                'filed_date',
+                'is_incumbent',
+            )),
+            candidacy_sources=Counter(CandidacySource.objects.values_list(
+                'candidacy__contest__name',
+                'candidacy__candidate_name',
+                'url',
+                'note',
+            )),
+            people=Counter(Person.objects.values_list(
+                'name',
+                'sort_name',
+                'family_name',
+                'given_name',
+            )),
+            identifiers=Counter(PersonIdentifier.objects.values_list(
+                'person__name',
+                'scheme',
+                'identifier',
+            )),
+            other_names=Counter(PersonName.objects.values_list(
+                'person__name',
+                'name',
+                'note',
+            )),
+        )
+
+    def reload_candidate_contests(self, **options):
+        """
+        Delete the candidate contests and people, load them again and return their rows.
+        """
+        Candidacy.objects.all().delete()
+        CandidateContest.objects.all().delete()
+        Person.objects.all().delete()
+        call_command("loadocdcandidatecontests", verbosity=0, **options)
+        return self.get_candidate_contest_rows()
+
+    def test_bulk_candidate_contests(self):
+        """
+        Confirm --bulk loads the same contests, candidacies and people as the default mode.
+        """
+        default_rows = self.reload_candidate_contests()
+        bulk_rows = self.reload_candidate_contests(bulk=True)
+        self.assertTrue(default_rows['candidacies'])
+        for name, rows in default_rows.items():
+            self.assertEqual(rows, bulk_rows[name], msg="%s differ" % name)
+
     def test_processed_versions(self):
         """
         Test processed versions.
@@ -336,6 +552,16 @@ class ProcessedDataTest(TestCase):
         )
         self.assertEqual(correx.name, "REPUBLICAN")
 
+    def test_corrections_in_bulk(self):
+        """
+        Test that we can retrieve corrections for many candidates at once.
+        """
+        winston = ("WINSTON, ALMA MARIE", 2014, "PRIMARY", "GOVERNOR")
+        uncorrected = ("NOBODY, NOT A. REAL", 2014, "PRIMARY", "GOVERNOR")
+        correx = corrections.candidate_parties([winston, uncorrected])
+        self.assertEqual(correx[winston].name, "REPUBLICAN")
+        self.assertNotIn(uncorrected, correx)
+
     def test_correction_assignment_by_proxy(self):
         """
         Test that a correction is properly being applied when parties are retrieved.
@@ -3,8 +3,14 @@
 """
 Unittests for management commands.
 """
+from datetime import date
 from unittest import TestCase
+from calaccess_scraped.models import IncumbentElection
 from calaccess_processed.models import ScrapedCandidateElectionProxy
+from calaccess_processed.models.proxies.calaccess_scraped.candidateelections import (
+    parse_election_name,
+    resolve_election_date,
+)
 
 
 class ScrapedCandidatElectioneNameParsing(TestCase):
@@ -58,3 +64,37 @@ class ScrapedCandidatElectioneNameParsing(TestCase):
             'office': 'GOVERNOR',
             'district': None,
         }
+
+
+class ScrapedCandidateElectionDateResolution(TestCase):
+    """
+    Test how candidate election dates are resolved from their names.
+    """
+    def resolve(self, name, incumbent_elections=()):
+        """
+        Resolve the date of an election name against a list of incumbent elections.
+        """
+        return resolve_election_date(name, parse_election_name(name), list(incumbent_elections))
+
+    def test_special_election_date(self):
+        """
+        Test the date of a special election comes from the hardcoded list.
+        """
+        assert self.resolve('2016 SPECIAL ELECTION (ASSEMBLY 31)') == date(2016, 4, 5)
+
+    def test_incumbent_election_date(self):
+        """
+        Test the date of an election comes from a single matching incumbent election.
+        """
+        incumbent_elections = [
+            IncumbentElection(name='GENERAL ELECTION', date=date(2014, 11, 4)),
+            IncumbentElection(name='PRIMARY ELECTION', date=date(2014, 6, 3)),
+        ]
+        assert self.resolve('2014 PRIMARY', incumbent_elections) == date(2014, 6, 3)
+
+    def test_expected_election_date(self):
+        """
+        Test the date of a regular election without a match is calculated from its year.
+        """
+        assert self.resolve('2016 GENERAL') == date(2016, 11, 8)
+        assert self.resolve('2015 GENERAL') is None
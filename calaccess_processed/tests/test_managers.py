@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unittests for processed data model managers.
+"""
+from datetime import date, datetime
+from unittest import TestCase
+from calaccess_processed.models import (
+    Form460Filing,
+    Form460FilingVersion,
+    Form460ScheduleAItem,
+    Form460ScheduleAItemVersion,
+    Form501Filing,
+    Form501FilingVersion,
+)
+from calaccess_processed.models.filings.campaign.form501 import Form501Matcher
+from calaccess_processed.models.proxies.opencivicdata.parties import PartyResolver
+from calaccess_processed.models.proxies.opencivicdata.unitofwork import OCDUnitOfWork, has_new
+from opencivicdata.core.models import Person, PersonName
+
+
+class ProcessedDataManagerTest(TestCase):
+    """
+    Tests for the methods that build load queries.
+    """
+    def test_load_query_columns(self):
+        """
+        Confirm the inserted columns are parsed from the load query.
+        """
+        columns = Form460ScheduleAItemVersion.objects.raw_data_load_query_columns
+        self.assertEqual(columns[0], 'filing_version_id')
+        self.assertIn('amount', columns)
+
+    def test_unrestricted_load_query(self):
+        """
+        Confirm the load query is unchanged without a where clause.
+        """
+        self.assertEqual(
+            Form460Filing.objects.get_raw_data_load_query(),
+            Form460Filing.objects.raw_data_load_query,
+        )
+
+    def test_filing_filter(self):
+        """
+        Confirm version item rows are filtered through their filing version.
+        """
+        self.assertEqual(
+            Form460Filing.objects.get_filing_filter('SELECT 1'),
+            'filing_id IN (SELECT 1)',
+        )
+        self.assertEqual(
+            Form460ScheduleAItemVersion.objects.get_filing_filter('SELECT 1'),
+            'filing_version_id IN (SELECT id FROM calaccess_processed_form460filingversion '
+            'WHERE filing_id IN (SELECT 1))',
+        )
+
+    def test_restricted_load_query(self):
+        """
+        Confirm a where clause wraps the load query's SELECT statement.
+        """
+        sql = Form460ScheduleAItemVersion.objects.get_raw_data_load_query(
+            where='filing_version_id < 10',
+        )
+        self.assertTrue(
+            sql.startswith('INSERT INTO calaccess_processed_form460scheduleaitemversion (')
+        )
+        self.assertTrue(sql.endswith('\nWHERE filing_version_id < 10;'))
+        self.assertEqual(sql.count('INSERT INTO'), 1)
+
+    def test_raw_filing_keys_query(self):
+        """
+        Confirm raw filing version keys are read from the load query's table, without its joins.
+        """
+        self.assertEqual(
+            Form460FilingVersion.objects.raw_filing_keys_query,
+            'SELECT cvr."FILING_ID" AS filing_id, cvr."AMEND_ID" AS amend_id\n'
+            'FROM "CVR_CAMPAIGN_DISCLOSURE_CD" cvr\n'
+            'WHERE cvr."FORM_TYPE" = \'F460\'',
+        )
+        self.assertIn(
+            '\nWHERE ci."FORM_TYPE" = \'F501\'',
+            Form501FilingVersion.objects.raw_filing_keys_query,
+        )
+        with self.assertRaises(ValueError):
+            Form460ScheduleAItemVersion.objects.raw_filing_keys_query
+
+    def test_changed_filing_ids_query(self):
+        """
+        Confirm only the filing version keys are compared.
+        """
+        sql = Form460FilingVersion.objects.changed_filing_ids_query
+        self.assertTrue(
+            sql.startswith('WITH loaded AS (SELECT filing_id, amend_id FROM calaccess_processed_form460filingversion)')
+        )
+        self.assertIn('SELECT filing_id FROM (SELECT * FROM raw EXCEPT SELECT * FROM loaded)', sql)
+        self.assertNotIn('SMRY_CD', sql)
+
+    def test_chunk_key_field(self):
+        """
+        Confirm loads are only split on keys from tables the load query reads.
+        """
+        self.assertEqual(
+            Form460ScheduleAItemVersion.objects.chunk_key_field.column,
+            'filing_version_id',
+        )
+        self.assertEqual(
+            Form460ScheduleAItem.objects.chunk_key_field.column,
+            'filing_id',
+        )
+        self.assertIsNone(Form460FilingVersion.objects.chunk_key_field)
+
+    def test_constraints_and_indexes_sql(self):
+        """
+        Confirm the rebuild plan covers the primary key, foreign key and indexes.
+        """
+        sql_list = Form460ScheduleAItemVersion.objects.get_constraints_and_indexes_sql(
+            primary_key=True,
+        )
+        self.assertTrue(sql_list[0].startswith('CREATE UNIQUE INDEX'))
+        self.assertIn('PRIMARY KEY USING INDEX', sql_list[1])
+        self.assertTrue(any('FOREIGN KEY' in sql for sql in sql_list))
+        self.assertTrue(any(sql.startswith('CREATE INDEX') for sql in sql_list))
+
+    def test_exclude_existing_sql(self):
+        """
+        Confirm only the constraints and indexes missing from the table are rebuilt.
+        """
+        table = 'calaccess_processed_form460scheduleaitemversion'
+        sql_list = [
+            'CREATE UNIQUE INDEX "{0}_pkey" ON "{0}" ("id");'.format(table),
+            'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_pkey" PRIMARY KEY USING INDEX "{0}_pkey";'.format(table),
+            'CREATE INDEX "{0}_line_item" ON "{0}" ("line_item");'.format(table),
+            'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_fk" FOREIGN KEY ("filing_version_id") '
+            'REFERENCES "calaccess_processed_form460filingversion" ("id") '
+            'DEFERRABLE INITIALLY DEFERRED;'.format(table),
+        ]
+        # an interrupted rebuild made the primary key's unique index and the other index
+        constraints = {
+            '%s_pkey' % table: {'primary_key': False, 'unique': True, 'index': True},
+            '%s_line_item' % table: {'primary_key': False, 'unique': False, 'index': True},
+        }
+        self.assertEqual(
+            Form460ScheduleAItemVersion.objects.exclude_existing_sql(sql_list, constraints),
+            [sql_list[1], sql_list[3]],
+        )
+        self.assertEqual(
+            Form460ScheduleAItemVersion.objects.exclude_existing_sql(sql_list, {}),
+            sql_list,
+        )
+
+
+class PartyResolverTest(TestCase):
+    """
+    Tests for looking up filers' party codes in memory.
+    """
+    def setUp(self):
+        """
+        Build a resolver with no parties and a few filer party codes.
+        """
+        self.resolver = PartyResolver([], [
+            (1, date(2010, 1, 1), 16001),
+            (1, date(2012, 1, 1), 16001),
+            (1, date(2014, 1, 1), 16002),
+            (2, datetime(2010, 1, 1, 12), 16009),
+        ])
+
+    def test_party_code_on_date(self):
+        """
+        Confirm the latest code in effect on the date is returned.
+        """
+        self.assertEqual(self.resolver.get_party_code(1, date(2009, 12, 31)), None)
+        self.assertEqual(self.resolver.get_party_code(1, date(2010, 1, 1)), 16001)
+        self.assertEqual(self.resolver.get_party_code(1, '2013-06-07'), 16001)
+        self.assertEqual(self.resolver.get_party_code(1, date(2014, 1, 1)), 16002)
+        self.assertEqual(self.resolver.get_party_code(3, date(2014, 1, 1)), None)
+
+    def test_unchanged_codes_collapsed(self):
+        """
+        Confirm rows that don't change a filer's party aren't kept.
+        """
+        self.assertEqual(len(self.resolver.filer_dates[1]), 2)
+
+    def test_no_party_preference(self):
+        """
+        Confirm "NON-PARTISAN" codes become "NO PARTY PREFERENCE".
+        """
+        self.assertEqual(self.resolver.get_party_code(2, date(2010, 1, 1)), 16012)
+
+
+class Form501MatcherTest(TestCase):
+    """
+    Tests for matching candidates to Form 501 filings in memory.
+    """
+    def setUp(self):
+        """
+        Build a matcher with a few filings for one candidate.
+        """
+        def filing(filing_id, date_filed, election_year, election_type, middle_name=''):
+            return Form501Filing(
+                filing_id=filing_id,
+                date_filed=date_filed,
+                filer_id='1001',
+                last_name='SMITH',
+                first_name='JANE',
+                middle_name=middle_name,
+                office='ASSEMBLY',
+                district=5,
+                election_year=election_year,
+                election_type=election_type,
+            )
+        self.matcher = Form501Matcher([
+            filing(1, date(2013, 1, 1), 2014, 'PRIMARY', middle_name='Q.'),
+            filing(2, date(2014, 5, 1), 2014, 'GENERAL', middle_name='Q.'),
+            filing(3, date(2015, 1, 1), 2016, 'PRIMARY', middle_name='Q.'),
+        ])
+
+    def test_match_by_filer_id(self):
+        """
+        Confirm filings of the same election type are preferred.
+        """
+        match = self.matcher.match('ASSEMBLY', 5, 2014, 'PRIMARY', filer_id='1001')
+        self.assertEqual(match.filing_id, 1)
+        match = self.matcher.match('Assembly', 5, 2014, 'SPECIAL ELECTION', filer_id='1001')
+        self.assertEqual(match.filing_id, 2)
+        self.assertIsNone(self.matcher.match('ASSEMBLY', 6, 2014, 'PRIMARY', filer_id='1001'))
+
+    def test_match_by_name(self):
+        """
+        Confirm names are matched with their middle names if needed.
+        """
+        match = self.matcher.match('ASSEMBLY', 5, 2014, 'GENERAL', name='SMITH, JANE')
+        self.assertEqual(match.filing_id, 2)
+        match = self.matcher.match('ASSEMBLY', 5, 2016, 'PRIMARY', name='SMITH, JANE Q.')
+        self.assertEqual(match.filing_id, 3)
+        self.assertIsNone(self.matcher.match('ASSEMBLY', 5, 2012, 'PRIMARY', name='SMITH, JANE Q.'))
+
+
+class OCDUnitOfWorkTest(TestCase):
+    """
+    Tests for collecting changes to OCD objects without saving them.
+    """
+    def test_changes_to_same_row(self):
+        """
+        Confirm changes to two instances of a row are kept together and can be read back.
+        """
+        uow = OCDUnitOfWork()
+        first = Person(id='ocd-person/1', name='JOHN DOE')
+        second = Person(id='ocd-person/1', name='JOHN DOE')
+
+        first.name = 'JOHN Q DOE'
+        uow.save(first, ['name'])
+        uow.sync(second)
+        self.assertEqual(second.name, 'JOHN Q DOE')
+
+        second.sort_name = 'DOE, JOHN Q'
+        uow.save(second, ['sort_name'])
+        self.assertEqual(len(uow.dirty), 1)
+        instance, changed = list(uow.dirty.values())[0]
+        self.assertIs(instance, first)
+        self.assertEqual(first.sort_name, 'DOE, JOHN Q')
+        self.assertEqual(changed, set(['name', 'sort_name']))
+
+    def test_new_rows(self):
+        """
+        Confirm new rows can be found while the unit of work is open.
+        """
+        person = Person(id='ocd-person/1', name='JOHN DOE')
+        with OCDUnitOfWork() as uow:
+            uow.add(PersonName(person=person, name='JOHNNY DOE'))
+            self.assertTrue(has_new(PersonName, person_id=person.id, name='JOHNNY DOE'))
+            self.assertFalse(has_new(PersonName, person_id=person.id, name='JACK DOE'))
+            # nothing to save
+            uow.new.clear()
+        self.assertIsNone(OCDUnitOfWork.current())
+        self.assertFalse(has_new(PersonName, person_id=person.id, name='JOHNNY DOE'))
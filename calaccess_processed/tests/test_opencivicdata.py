@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unittests for loading and updating OCD models.
+"""
+from datetime import date, timedelta
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction
+from django.test import TestCase
+from django.utils.six import StringIO
+from django.utils.timezone import now
+from opencivicdata.core.models import Membership, Organization, Person, Post
+from opencivicdata.elections.models import Candidacy, CandidateContest
+from calaccess_processed.management.commands import CalAccessCommand
+from calaccess_processed.management.commands.loadocdincumbentofficeholders import (
+    Command as LoadIncumbentsCommand,
+)
+from calaccess_processed.models import (
+    Form501Filing,
+    OCDElectionProxy,
+    OCDPersonProxy,
+    OCDPostProxy,
+    OCDRunoffProxy,
+)
+from calaccess_processed.models.proxies.opencivicdata import locks
+from calaccess_processed.models.proxies.opencivicdata.unitofwork import create_or_defer, save_or_defer
+
+
+class OCDTestCase(TestCase):
+    """
+    Base class for tests that build a few OCD objects.
+    """
+    fixtures = ['divisions.json']
+
+    def setUp(self):
+        """
+        Drop objects cached by the proxy managers in an earlier test.
+        """
+        CalAccessCommand().clear_caches()
+
+    def create_contest(self, office_name, election_name, election_date, name=None):
+        """
+        Create a contest for the office in a new election.
+        """
+        post = OCDPostProxy.objects.get_or_create_by_name(office_name)[0]
+        election = OCDElectionProxy.objects.create_from_calaccess(election_name, election_date)
+        contest = CandidateContest.objects.create(
+            election=election,
+            division=post.division,
+            name=name or office_name,
+        )
+        contest.posts.create(post=post)
+        return contest
+
+    def create_candidacy(self, contest, person, **kwargs):
+        """
+        Create a qualified candidacy of the person in the contest.
+        """
+        kwargs.setdefault('candidate_name', person.name)
+        kwargs.setdefault('registration_status', 'qualified')
+        return Candidacy.objects.create(
+            contest=contest,
+            person=person,
+            post=contest.posts.all()[0].post,
+            **kwargs
+        )
+
+
+class LoadIncumbentsTest(OCDTestCase):
+    """
+    Tests for setting membership end dates and incumbent candidacies.
+    """
+    def setUp(self):
+        """
+        Prepare the command.
+        """
+        super(LoadIncumbentsTest, self).setUp()
+        self.command = LoadIncumbentsCommand()
+        self.command.verbosity = 0
+        self.command.no_color = True
+        self.post = OCDPostProxy.objects.get_or_create_by_name('GOVERNOR')[0]
+
+    def create_membership(self, name, start_date, end_date=''):
+        """
+        Create a membership of a new person in the post.
+        """
+        return Membership.objects.create(
+            person=Person.objects.create(name=name),
+            post=self.post,
+            organization=self.post.organization,
+            role=self.post.role,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+    def test_set_end_dates(self):
+        """
+        Confirm each membership ends when its successor's starts.
+        """
+        first = self.create_membership('FIRST', '2003')
+        second = self.create_membership('SECOND', '2011')
+        unknown = self.create_membership('UNKNOWN', '')
+
+        self.command.set_end_dates()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual(first.end_date, '2011')
+        self.assertEqual(second.end_date, '')
+        # a member without a start year is succeeded by the earliest one
+        self.assertEqual(unknown.end_date, '2003')
+
+    def test_set_incumbent_candidacies(self):
+        """
+        Confirm candidacies during a membership are incumbent and their challengers aren't.
+        """
+        membership = self.create_membership('INCUMBENT', '2010', '2014')
+        challenger = Person.objects.create(name='CHALLENGER')
+        contest_2012 = self.create_contest('GOVERNOR', '2012 GENERAL', date(2012, 11, 6))
+        contest_2016 = self.create_contest('GOVERNOR', '2016 GENERAL', date(2016, 11, 8))
+        incumbent_2012 = self.create_candidacy(contest_2012, membership.person)
+        incumbent_2016 = self.create_candidacy(contest_2016, membership.person)
+        challenger_2012 = self.create_candidacy(contest_2012, challenger)
+        challenger_2016 = self.create_candidacy(contest_2016, challenger)
+
+        self.command.set_incumbent_candidacies()
+
+        self.assertTrue(Candidacy.objects.get(id=incumbent_2012.id).is_incumbent)
+        self.assertIs(Candidacy.objects.get(id=challenger_2012.id).is_incumbent, False)
+        # after the membership ends, nobody in the contest is marked
+        self.assertIsNone(Candidacy.objects.get(id=incumbent_2016.id).is_incumbent)
+        self.assertIsNone(Candidacy.objects.get(id=challenger_2016.id).is_incumbent)
+
+
+class RunoffParentsTest(OCDTestCase):
+    """
+    Tests for linking runoffs to the contests before them.
+    """
+    def test_set_parents(self):
+        """
+        Confirm each runoff is linked to the latest earlier contest for its post.
+        """
+        self.create_contest('GOVERNOR', '2010 GENERAL', date(2010, 11, 2))
+        parent = self.create_contest('GOVERNOR', '2014 SPECIAL', date(2014, 3, 4))
+        self.create_contest('LIEUTENANT GOVERNOR', '2014 SPECIAL', date(2014, 4, 1))
+        runoff = self.create_contest('GOVERNOR', '2014 SPECIAL RUNOFF', date(2014, 5, 6), 'GOVERNOR RUNOFF')
+        orphan = self.create_contest(
+            'LIEUTENANT GOVERNOR',
+            '2008 SPECIAL RUNOFF',
+            date(2008, 5, 6),
+            'LIEUTENANT GOVERNOR RUNOFF',
+        )
+
+        self.assertEqual(OCDRunoffProxy.objects.set_parents(), 1)
+        self.assertEqual(CandidateContest.objects.get(id=runoff.id).runoff_for_contest_id, parent.id)
+        self.assertIsNone(CandidateContest.objects.get(id=orphan.id).runoff_for_contest_id)
+        # nothing left to change
+        self.assertEqual(OCDRunoffProxy.objects.set_parents(), 0)
+
+    def test_set_parents_created_since(self):
+        """
+        Confirm only runoffs created since the provided time are linked.
+        """
+        self.create_contest('GOVERNOR', '2014 SPECIAL', date(2014, 3, 4))
+        old_runoff = self.create_contest('GOVERNOR', '2014 SPECIAL RUNOFF', date(2014, 5, 6), 'GOVERNOR RUNOFF')
+        created_since = now()
+        new_runoff = self.create_contest('GOVERNOR', '2015 SPECIAL RUNOFF', date(2015, 5, 5), 'GOVERNOR RUNOFF')
+
+        self.assertEqual(OCDRunoffProxy.objects.set_parents(created_since=created_since), 1)
+        self.assertIsNone(CandidateContest.objects.get(id=old_runoff.id).runoff_for_contest_id)
+        self.assertEqual(
+            CandidateContest.objects.get(id=new_runoff.id).runoff_for_contest_id,
+            old_runoff.id,
+        )
+
+
+class Form501WithoutCandidacyTest(OCDTestCase):
+    """
+    Tests for finding Form 501 filings that aren't linked to a candidacy.
+    """
+    def test_without_candidacy(self):
+        """
+        Confirm linked filings and retirement board filings are each left out.
+
+        Before the anti-join, only filings that were both linked and for a retirement
+        board were left out.
+        """
+        for filing_id, office in [
+            (1, 'GOVERNOR'),
+            (2, 'GOVERNOR'),
+            (3, 'PUBLIC EMPLOYEES RETIREMENT BOARD'),
+            (4, 'PUBLIC EMPLOYEES RETIREMENT BOARD'),
+        ]:
+            Form501Filing.objects.create(filing_id=filing_id, amendment_count=0, office=office)
+        contest = self.create_contest('GOVERNOR', '2014 GENERAL', date(2014, 11, 4))
+        self.create_candidacy(
+            contest,
+            Person.objects.create(name='JOHN DOE'),
+            extras={'form501_filing_ids': [1, 4]},
+        )
+
+        self.assertEqual(
+            list(Form501Filing.objects.without_candidacy().values_list('filing_id', flat=True)),
+            [2],
+        )
+
+
+class MergePersonsTest(OCDTestCase):
+    """
+    Tests for merging persons and their candidacies.
+    """
+    def test_resolve_merge_groups(self):
+        """
+        Confirm groups that share a person are merged into the same person.
+        """
+        self.assertEqual(
+            OCDPersonProxy.objects.resolve_merge_groups([
+                ('a', ['b']),
+                ('b', ['c']),
+                ('d', ['e', 'd']),
+                ('f', []),
+            ]),
+            {'b': 'a', 'c': 'a', 'e': 'd'},
+        )
+
+    def test_merge_candidacies(self):
+        """
+        Confirm merged persons' candidacies, identifiers and names are combined.
+        """
+        contest = self.create_contest('GOVERNOR', '2014 GENERAL', date(2014, 11, 4))
+        later_contest = self.create_contest('GOVERNOR', '2018 GENERAL', date(2018, 11, 6))
+        Form501Filing.objects.create(filing_id=1, amendment_count=0, date_filed=date(2014, 3, 1))
+        Form501Filing.objects.create(filing_id=2, amendment_count=0, date_filed=date(2014, 2, 1))
+
+        keep = Person.objects.create(name='JOHN DOE')
+        keep.identifiers.create(scheme='calaccess_filer_id', identifier='100')
+        kept_candidacy = self.create_candidacy(
+            contest,
+            keep,
+            filed_date=date(2014, 3, 1),
+            extras={'form501_filing_ids': [1]},
+        )
+        kept_candidacy.sources.create(url='http://example.com/1', note='Last scraped on 2014-03-01')
+
+        discard = Person.objects.create(name='JOHNNY DOE')
+        discard.identifiers.create(scheme='calaccess_filer_id', identifier='100')
+        discarded_candidacy = self.create_candidacy(
+            contest,
+            discard,
+            registration_status='filed',
+            filed_date=date(2014, 2, 1),
+            extras={'form501_filing_ids': [2]},
+        )
+        discarded_candidacy.sources.create(url='http://example.com/1', note='Last scraped on 2014-02-01')
+        discarded_candidacy.sources.create(url='http://example.com/2', note='Last scraped on 2014-02-01')
+        self.create_candidacy(later_contest, discard, candidate_name='JOHN Q DOE')
+
+        self.assertEqual(OCDPersonProxy.objects.merge_groups([(keep, [discard])]), 1)
+
+        self.assertFalse(Person.objects.filter(id=discard.id).exists())
+        # the qualified candidacy is kept, with both filings and the earliest filed_date
+        candidacy = Candidacy.objects.get(contest=contest)
+        self.assertEqual(candidacy.id, kept_candidacy.id)
+        self.assertEqual(candidacy.person_id, keep.id)
+        self.assertEqual(candidacy.registration_status, 'qualified')
+        self.assertEqual(candidacy.extras['form501_filing_ids'], [1, 2])
+        self.assertEqual(candidacy.filed_date, date(2014, 2, 1))
+        self.assertEqual(
+            sorted(candidacy.sources.values_list('url', flat=True)),
+            ['http://example.com/1', 'http://example.com/2'],
+        )
+        self.assertEqual(Candidacy.objects.get(contest=later_contest).person_id, keep.id)
+
+        # the duplicate filer_id is dropped and the discarded id is kept
+        self.assertEqual(
+            sorted(keep.identifiers.values_list('scheme', 'identifier')),
+            [('', discard.id), ('calaccess_filer_id', '100')],
+        )
+
+        # the name is the latest candidate_name, and the others are kept as other names
+        keep.refresh_from_db()
+        self.assertEqual(keep.name, 'JOHN Q DOE')
+        self.assertEqual(
+            sorted(keep.other_names.values_list('name', 'note')),
+            [('JOHN DOE', ''), ('JOHNNY DOE', 'From merge of persons')],
+        )
+
+    def test_merge_memberships(self):
+        """
+        Confirm merged persons' memberships are combined and blank fields are filled from the discarded person.
+        """
+        post = OCDPostProxy.objects.get_or_create_by_name('GOVERNOR')[0]
+        keep = Person.objects.create(name='JOHN DOE', family_name='DOE')
+        discard = Person.objects.create(name='JOHN DOE', given_name='JOHN', family_name='SMITH', birth_date='1950')
+        Person.objects.filter(id=discard.id).update(created_at=now() - timedelta(days=1))
+        kept_membership = Membership.objects.create(
+            person=keep,
+            organization=post.organization,
+            post=post,
+            end_date='2019-01-07',
+        )
+        discarded_membership = Membership.objects.create(
+            person=discard,
+            organization=post.organization,
+            post=post,
+            end_date='2019-01-07',
+        )
+        discarded_membership.links.create(url='http://example.com/1')
+        later_membership = Membership.objects.create(
+            person=discard,
+            organization=post.organization,
+            post=post,
+            end_date='2023-01-02',
+        )
+
+        self.assertEqual(OCDPersonProxy.objects.merge_groups([(keep, [discard])]), 1)
+
+        # the duplicate membership is dropped, with its link moved to the one kept
+        self.assertEqual(
+            sorted(Membership.objects.filter(person=keep).values_list('id', flat=True)),
+            sorted([kept_membership.id, later_membership.id]),
+        )
+        self.assertEqual(
+            list(kept_membership.links.values_list('url', flat=True)),
+            ['http://example.com/1'],
+        )
+
+        # blank fields are filled in, the others are kept, along with the earliest created_at
+        keep.refresh_from_db()
+        self.assertEqual(keep.given_name, 'JOHN')
+        self.assertEqual(keep.family_name, 'DOE')
+        self.assertEqual(keep.birth_date, '1950')
+        self.assertLess(keep.created_at, now() - timedelta(hours=23))
+        self.assertTrue(keep.identifiers.filter(scheme='', identifier=discard.id).exists())
+
+
+class PostCacheTest(OCDTestCase):
+    """
+    Tests for keeping the posts and organizations found by the proxy managers.
+    """
+    def test_rolled_back_post(self):
+        """
+        Confirm a post created in a rolled back savepoint isn't returned from the cache.
+        """
+        try:
+            with transaction.atomic():
+                rolled_back = OCDPostProxy.objects.get_or_create_by_name('GOVERNOR')[0]
+                raise ValueError
+        except ValueError:
+            pass
+
+        post, created = OCDPostProxy.objects.get_or_create_by_name('GOVERNOR')
+        self.assertTrue(created)
+        self.assertNotEqual(post.id, rolled_back.id)
+        self.assertTrue(Post.objects.filter(id=post.id).exists())
+        # the organization created with the rolled back post is created again too
+        self.assertTrue(Organization.objects.filter(id=post.organization_id).exists())
+
+
+class RunInBatchesTest(OCDTestCase):
+    """
+    Tests for loading records in batched transactions.
+    """
+    def test_failed_record(self):
+        """
+        Confirm a record whose changes fail to save is rolled back without losing the rest of its batch.
+        """
+        person = Person.objects.create(name='JOHN DOE', sort_name='DOE, JOHN')
+
+        def load(name):
+            """
+            Create a person with the name, changing the existing person on the way.
+            """
+            if name == 'FIRST':
+                person.given_name = 'JOHN'
+                save_or_defer(person, ['given_name'])
+            elif name == 'THIRD':
+                person.family_name = 'DOE'
+                save_or_defer(person, ['family_name'])
+            else:
+                person.sort_name = 'NOBODY'
+                save_or_defer(person, ['sort_name'])
+            # a person without a name fails when the unit of work is saved
+            create_or_defer(Person(name=name))
+
+        command = CalAccessCommand(stdout=StringIO())
+        command.verbosity = 0
+        command.no_color = True
+        failures = command.run_in_batches(['FIRST', None, 'THIRD'], load, batch_size=3)
+
+        self.assertEqual(failures, 1)
+        self.assertEqual(
+            sorted(Person.objects.exclude(id=person.id).values_list('name', flat=True)),
+            ['FIRST', 'THIRD'],
+        )
+        person.refresh_from_db()
+        self.assertEqual(person.given_name, 'JOHN')
+        self.assertEqual(person.family_name, 'DOE')
+        # the failed record's change to the same person is rolled back too
+        self.assertEqual(person.sort_name, 'DOE, JOHN')
+
+    def test_failed_record_post(self):
+        """
+        Confirm a post created by a failed record is created again by the next record that uses it.
+        """
+        election = OCDElectionProxy.objects.create_from_calaccess('2016 GENERAL', date(2016, 11, 8))
+
+        def load(name):
+            """
+            Create a contest for governor with the name, failing the first one after the post is created.
+            """
+            post = OCDPostProxy.objects.get_or_create_by_name('GOVERNOR')[0]
+            if name == 'FIRST':
+                raise ValueError('Failed after creating the post')
+            contest = CandidateContest.objects.create(election=election, division=post.division, name=name)
+            contest.posts.create(post=post)
+
+        command = CalAccessCommand(stdout=StringIO())
+        command.verbosity = 0
+        command.no_color = True
+        failures = command.run_in_batches(['FIRST', 'SECOND'], load, batch_size=2)
+
+        self.assertEqual(failures, 1)
+        contest = CandidateContest.objects.get(name='SECOND')
+        self.assertTrue(Post.objects.filter(id=contest.posts.all()[0].post_id).exists())
+
+
+class ParallelLoadTest(OCDTestCase):
+    """
+    Tests for keeping parallel loads from creating the same objects.
+    """
+    def get_advisory_lock_count(self):
+        """
+        Return the count of advisory locks held by this connection.
+        """
+        with connection.cursor() as c:
+            c.execute(
+                "SELECT COUNT(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid();"
+            )
+            return c.fetchone()[0]
+
+    def test_person_locks(self):
+        """
+        Confirm a person is locked by both name and filer_id, so workers with either one wait.
+        """
+        locks.enabled = True
+        try:
+            OCDPersonProxy.objects.get_or_create_from_calaccess(
+                {'name': 'JOHN DOE'},
+                candidate_filer_id='100',
+            )
+            self.assertEqual(self.get_advisory_lock_count(), 2)
+            # the same keys in another order are already held
+            locks.lock_all_for_create([('person', 'filer_id', '100'), ('person', 'name', 'JOHN DOE')])
+            self.assertEqual(self.get_advisory_lock_count(), 2)
+        finally:
+            locks.enabled = False
+
+    def test_bulk_workers(self):
+        """
+        Confirm the bulk loader, which doesn't lock, can't run in workers.
+        """
+        with self.assertRaises(CommandError):
+            call_command('loadocdcandidatecontests', bulk=True, workers=2, verbosity=0)
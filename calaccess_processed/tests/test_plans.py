@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unittests for reviewing load query plans.
+"""
+from unittest import TestCase
+from calaccess_processed import plans
+
+
+class PlanWarningsTest(TestCase):
+    """
+    Tests for the warnings raised about slow operations in query plans.
+    """
+    plan = {
+        'Plan': {
+            'Node Type': 'ModifyTable',
+            'Plan Rows': 1000,
+            'Actual Rows': 0,
+            'Actual Loops': 1,
+            'Temp Written Blocks': 50,
+            'Plans': [{
+                'Node Type': 'Sort',
+                'Parent Relationship': 'Outer',
+                'Plan Rows': 10,
+                'Actual Rows': 5000,
+                'Actual Loops': 1,
+                'Sort Space Type': 'Disk',
+                'Sort Space Used': 400,
+                'Temp Written Blocks': 50,
+                'Plans': [{
+                    'Node Type': 'Seq Scan',
+                    'Relation Name': 'CVR_CAMPAIGN_DISCLOSURE_CD',
+                    'Plan Rows': 5000,
+                    'Actual Rows': 5000,
+                    'Actual Loops': 1,
+                    'Rows Removed by Filter': 100,
+                }],
+            }],
+        },
+    }
+
+    def test_inserted_rows(self):
+        """
+        Confirm inserted rows are read from the node below the insert.
+        """
+        self.assertEqual(plans.get_inserted_rows(self.plan), 5000)
+
+    def test_inserted_rows_with_init_plan(self):
+        """
+        Confirm inserted rows aren't read from an InitPlan listed before the insert's source.
+        """
+        plan = {
+            'Plan': {
+                'Node Type': 'ModifyTable',
+                'Actual Rows': 0,
+                'Actual Loops': 1,
+                'Plans': [{
+                    'Node Type': 'Aggregate',
+                    'Parent Relationship': 'InitPlan',
+                    'Subplan Name': 'CTE latest',
+                    'Actual Rows': 1,
+                    'Actual Loops': 1,
+                }, {
+                    'Node Type': 'Hash Join',
+                    'Parent Relationship': 'Outer',
+                    'Actual Rows': 250,
+                    'Actual Loops': 2,
+                }],
+            },
+        }
+        self.assertEqual(plans.get_inserted_rows(plan), 500)
+
+    def test_plan_warnings(self):
+        """
+        Confirm seq scans, spills and misestimates are each flagged once.
+        """
+        self.assertEqual(plans.get_plan_warnings(self.plan), [
+            'Sort spilled 400kB to disk',
+            'Sort estimated 10 rows but returned 5000',
+            'Seq Scan on CVR_CAMPAIGN_DISCLOSURE_CD read 5100 rows',
+        ])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unittests for running tasks in a pool of worker processes.
+"""
+import os
+import signal
+import time
+from unittest import TestCase
+from calaccess_processed.workers import WorkerPool
+
+
+class WorkerPoolTest(TestCase):
+    """
+    Tests for returning the results of tasks run in a pool of worker processes.
+    """
+    def test_result(self):
+        """
+        Confirm a task's result is returned with its key.
+        """
+        with WorkerPool(1, poll_seconds=0.1) as pool:
+            pool.apply_async('Form460Filing', int, ('42',))
+            self.assertEqual(pool.get_next_result(), ('Form460Filing', 42, None))
+
+    def test_failed_task_result(self):
+        """
+        Confirm a task that raised is returned as failed instead of waited on forever.
+        """
+        with WorkerPool(1, poll_seconds=0.1) as pool:
+            pool.apply_async('Form460Filing', int, ('not a number',))
+            key, result, error = pool.get_next_result()
+        self.assertEqual(key, 'Form460Filing')
+        self.assertIsNone(result)
+        self.assertIn('ValueError', error)
+
+    def test_dead_worker_result(self):
+        """
+        Confirm a task whose worker process died is returned as failed, and the pool carries on.
+        """
+        with WorkerPool(2, poll_seconds=0.1) as pool:
+            pool.apply_async('Form460Filing', time.sleep, (60,))
+            # wait for the worker to report it started the task
+            while 'Form460Filing' not in pool.pids:
+                time.sleep(0.1)
+                pool.read_pids()
+            os.kill(pool.pids['Form460Filing'], signal.SIGKILL)
+            key, result, error = pool.get_next_result()
+            self.assertEqual(key, 'Form460Filing')
+            self.assertIsNone(result)
+            self.assertIn('died', error)
+
+            pool.apply_async('Form497', int, ('497',))
+            self.assertEqual(pool.get_next_result(), ('Form497', 497, None))
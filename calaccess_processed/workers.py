@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for running management command tasks in a pool of worker processes.
+"""
+from __future__ import unicode_literals
+import os
+import errno
+import traceback
+from multiprocessing import Pool
+from django.utils.six.moves import queue
+try:
+    from multiprocessing import SimpleQueue
+except ImportError:
+    # Python 2
+    from multiprocessing.queues import SimpleQueue
+
+# Where the worker processes report the id of the task they start and their pid
+_started_queue = None
+
+
+def init_worker(started_queue):
+    """
+    Keep the queue a worker process reports the tasks it starts on.
+    """
+    global _started_queue
+    _started_queue = started_queue
+
+
+def run_task(key, func, args):
+    """
+    Report the task's key and the worker's pid, then call func with args.
+
+    Return a tuple (key, result, error), where error is a formatted traceback
+    if func raised an error, otherwise None.
+    """
+    _started_queue.put((key, os.getpid()))
+    try:
+        return key, func(*args), None
+    except Exception:
+        return key, None, traceback.format_exc()
+
+
+def pid_exists(pid):
+    """
+    Return True if a process with the provided pid is still running.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class WorkerPool(object):
+    """
+    A pool of worker processes that returns each task's result as it finishes.
+
+    Each task reports the pid of the worker that runs it, so a task whose worker
+    died, like when it's killed for running out of memory, is returned as failed
+    instead of waited on forever.
+    """
+    # How often get_next_result checks on the workers while it waits for a task to finish
+    poll_seconds = 5
+
+    def __init__(self, workers, poll_seconds=None):
+        """
+        Start the worker processes.
+        """
+        self.poll_seconds = poll_seconds or self.poll_seconds
+        self.started = SimpleQueue()
+        self.results = queue.Queue()
+        self.running = {}
+        self.pids = {}
+        self.pool = Pool(workers, initializer=init_worker, initargs=(self.started,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.terminate()
+
+    def apply_async(self, key, func, args=()):
+        """
+        Call func with args in a worker process, as the task with the provided key.
+
+        func must be a module-level function, so it can be sent to the worker.
+        """
+        self.running[key] = self.pool.apply_async(
+            run_task,
+            (key, func, args),
+            callback=self.results.put,
+        )
+
+    def get_next_result(self):
+        """
+        Wait for the next task to finish and return its tuple (key, result, error).
+
+        The success callback is the only thing that puts a result on the queue, so the
+        queue is polled. In between, a task that raised outside of func, or whose
+        worker process died, is returned with an error.
+        """
+        while True:
+            try:
+                key, result, error = self.results.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                pass
+            else:
+                self.finish(key)
+                return key, result, error
+
+            for key, async_result in list(self.running.items()):
+                if async_result.ready() and not async_result.successful():
+                    self.finish(key)
+                    try:
+                        async_result.get()
+                    except Exception:
+                        return key, None, traceback.format_exc()
+
+            self.read_pids()
+            for key, pid in list(self.pids.items()):
+                # a task's result can reach the queue after its worker moved on to the next task
+                if not pid_exists(pid) and not self.running[key].ready():
+                    self.finish(key)
+                    return key, None, "Worker process %s died while running %s" % (pid, key)
+
+    def read_pids(self):
+        """
+        Record the pid of the worker running each task that reported starting since the last read.
+        """
+        while not self.started.empty():
+            key, pid = self.started.get()
+            if key in self.running:
+                self.pids[key] = pid
+
+    def finish(self, key):
+        """
+        Stop tracking the task with the provided key.
+        """
+        self.running.pop(key, None)
+        self.pids.pop(key, None)
+
+    def terminate(self):
+        """
+        Stop the worker processes, without waiting for their tasks to finish.
+        """
+        self.pool.terminate()
+        self.pool.join()